@@ -0,0 +1,357 @@
+# async_engine.py
+# Asyncio execution engine for v2ray_collector3.py (selected with --engine async).
+# ===== IMPORTS & DEPENDENCIES =====
+import asyncio
+import logging
+import socket
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import aiohttp
+
+import v2ray_collector3 as collector
+from v2ray_collector3 import ValidatedConfig, ValidationServices
+import channel_state
+import config_checks
+import prober
+import run_metrics
+from channel_state import ChannelCursor
+from config_fingerprint import ConfigIndex
+from config_model import ProxyConfig
+from dns_resolver import DNSResolver
+from geo_cache import AsyncGeoLookup
+from rate_limiter import HostLimiters, throttle_delay
+from result_spool import ResultSpool
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+class StageLimits:
+    """Concurrency ceilings for each stage of the async pipeline, plus the per-host HTTP limiters."""
+
+    def __init__(
+        self,
+        scrape: int = collector.ASYNC_SCRAPE_CONCURRENCY,
+        dns: int = collector.ASYNC_DNS_CONCURRENCY,
+        geo: int = collector.ASYNC_GEO_CONCURRENCY,
+        probe: int = collector.ASYNC_PROBE_CONCURRENCY,
+        hosts: Optional[HostLimiters] = None,
+    ):
+        self.scrape = asyncio.Semaphore(scrape)
+        self.dns = asyncio.Semaphore(dns)
+        self.geo = asyncio.Semaphore(geo)
+        self.probe = asyncio.Semaphore(probe)
+        self.hosts = hosts if hosts is not None else HostLimiters(collector.HOST_POLICIES)
+
+def create_http_session(connection_limit: int) -> aiohttp.ClientSession:
+    """Creates an aiohttp session sized for the combined stage ceilings."""
+    connector = aiohttp.TCPConnector(limit=connection_limit, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=collector.REQUEST_TIMEOUT)
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=timeout,
+        headers={"User-Agent": collector.USER_AGENT},
+    )
+
+async def http_request(
+    http: aiohttp.ClientSession, method: str, url: str, hosts: Optional[HostLimiters] = None, **kwargs
+) -> aiohttp.ClientResponse:
+    """
+    Performs a request with the same limiter and retry policy as collector.ThrottledAdapter.
+
+    With `hosts`, each attempt waits for its host's limiter, and a throttled
+    response pauses that host (Retry-After, else exponential backoff) instead of
+    this coroutine alone. The response body is read before returning, so the
+    caller may use response.text()/json() after the connection has been released.
+    """
+    limiter = hosts.for_url(url) if hosts else None
+    for attempt in range(collector.HTTP_RETRY_TOTAL + 1):
+        backoff = collector.HTTP_RETRY_BACKOFF_FACTOR * (2 ** attempt)
+        if limiter:
+            await limiter.acquire_async()
+        status: Optional[int] = None
+        delay: Optional[float] = None
+        try:
+            response = await http.request(method, url, **kwargs)
+            await response.read()
+            status, delay = response.status, throttle_delay(response.headers)
+            run_metrics.metrics.upstream(limiter.name if limiter else response.url.host, status, attempt > 0)
+            if status not in collector.HTTP_RETRY_STATUS_CODES or attempt == collector.HTTP_RETRY_TOTAL:
+                response.raise_for_status()
+                return response
+            delay = delay or backoff
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            run_metrics.metrics.upstream(limiter.name if limiter else url, None, attempt > 0)
+            if attempt == collector.HTTP_RETRY_TOTAL:
+                raise
+            delay = backoff
+        finally:
+            if limiter:
+                limiter.release(status, delay if status is not None else None)
+        if limiter is None or status is None:
+            # Sleeps only this coroutine; other requests keep flowing
+            await asyncio.sleep(delay)
+    raise aiohttp.ClientError(f"Retries exhausted for {url}")
+
+async def http_get(http: aiohttp.ClientSession, url: str, hosts: Optional[HostLimiters] = None) -> aiohttp.ClientResponse:
+    return await http_request(http, "GET", url, hosts)
+
+async def fetch_channel_content_async(
+    http: aiohttp.ClientSession, channel_name: str, before: Optional[int] = None, hosts: Optional[HostLimiters] = None
+) -> Optional[str]:
+    """Fetches the HTML content of a public Telegram channel."""
+    url = collector.channel_page_url(channel_name, before)
+    started = time.perf_counter()
+    status, size = None, 0
+    try:
+        response = await http_get(http, url, hosts)
+        status = response.status
+        body = await response.read()
+        size = len(body)
+        return await response.text()
+    except aiohttp.ClientResponseError as e:
+        status = e.status
+        logging.error(f"Failed to fetch content for channel '{channel_name}': {e}")
+        return None
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logging.error(f"Failed to fetch content for channel '{channel_name}': {e}")
+        return None
+    finally:
+        run_metrics.metrics.channel_fetch(channel_name, status, size, time.perf_counter() - started)
+
+async def scrape_channel_async(
+    http: aiohttp.ClientSession,
+    limits: StageLimits,
+    channel_name: str,
+    cursors: Optional[Dict[str, ChannelCursor]] = None,
+    backfill_pages: int = 0,
+) -> Set[str]:
+    """Scrapes a single Telegram channel for configs (see collector.scrape_channel)."""
+    async with limits.scrape:
+        logging.info(f"Scraping channel: {channel_name}")
+        html_content = await fetch_channel_content_async(http, channel_name, hosts=limits.hosts)
+        if not html_content:
+            return set()
+        pages = [html_content]
+        if cursors is not None and channel_name not in cursors:
+            for _ in range(backfill_pages):
+                before = channel_state.oldest_message_id(pages[-1])
+                older_page = await fetch_channel_content_async(http, channel_name, before, limits.hosts) if before else None
+                if not older_page:
+                    break
+                pages.append(older_page)
+    # Parsing is CPU-bound; keep it off the event loop
+    if cursors is None:
+        return await asyncio.to_thread(collector.parse_v2ray_configs, html_content)
+    return await asyncio.to_thread(collector.parse_channel_delta, channel_name, pages, cursors)
+
+async def get_server_ip_async(
+    limits: StageLimits, config: ProxyConfig, resolver: Optional[DNSResolver] = None
+) -> Optional[str]:
+    """Resolves a config's server address to an IP without blocking the loop."""
+    address = config.host
+    if collector.is_ip_address(address):
+        return address
+    async with limits.dns:
+        with run_metrics.metrics.timed("dns"):
+            if resolver:
+                return await resolver.resolve_one_async(address)
+            try:
+                infos = await asyncio.get_running_loop().getaddrinfo(address, None, family=socket.AF_INET)
+            except (socket.gaierror, UnicodeError):
+                return None
+    return infos[0][4][0] if infos else None
+
+async def fetch_geo_batch_async(
+    http: aiohttp.ClientSession, ips: List[str], hosts: Optional[HostLimiters] = None
+) -> List[Dict]:
+    """Looks up to 100 IPs with a single POST to the ip-api.com batch endpoint."""
+    response = await http_request(http, "POST", collector.GEO_IP_BATCH_URL, hosts, json=ips)
+    return await response.json(content_type=None)
+
+async def get_geo_info_async(
+    http: aiohttp.ClientSession, limits: StageLimits, ip_address: str, geo_lookup: Optional[AsyncGeoLookup] = None
+) -> Dict:
+    """Gets geographic information for an IP address."""
+    if geo_lookup:
+        # Cache hits cost nothing and misses share batch POSTs, so no stage ceiling here
+        return await geo_lookup.lookup(ip_address)
+    async with limits.geo:
+        try:
+            response = await http_get(http, collector.GEO_IP_API_URL.format(ip=ip_address), limits.hosts)
+            return collector.parse_geo_response(await response.json(content_type=None))
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            pass # Silently fail, like the threaded engine
+    return dict(collector.UNKNOWN_GEO_INFO)
+
+async def measure_latency_async(limits: StageLimits, config: ProxyConfig, ip: str) -> Optional[prober.ProbeResult]:
+    """Async counterpart of collector.measure_latency(); probes run directly on the engine's loop."""
+    target = prober.endpoint_from_config(config)
+    if target is None:
+        return collector.unprobed_result() if config.protocol in prober.UDP_PROTOCOLS else None
+    async with limits.probe:
+        with run_metrics.metrics.timed("probe"):
+            result = await prober.probe_target(ip, target, collector.PROBE_SAMPLES, collector.PROBE_TIMEOUT_SECONDS)
+    run_metrics.metrics.probe(result["latency_ms"] if result["ok"] else None)
+    return result if result["ok"] else None
+
+async def validate_and_enrich_config_async(
+    http: aiohttp.ClientSession,
+    limits: StageLimits,
+    config: ProxyConfig,
+    services: ValidationServices,
+    geo_lookup: Optional[AsyncGeoLookup] = None,
+) -> Optional[ValidatedConfig]:
+    """Async counterpart of validate_and_enrich_config(); `geo_lookup` replaces services.geo_lookup."""
+    ip = await get_server_ip_async(limits, config, services.resolver)
+    if not ip or config_checks.is_reserved_address(ip):
+        return None
+
+    probe = await measure_latency_async(limits, config, ip)
+    if probe is None or probe["latency_ms"] > collector.MAX_LATENCY_MS:
+        return None
+
+    # The offline database is an in-memory bisect, cheap enough to call on the loop
+    geo_info = services.offline_geo.lookup(ip) if services.offline_geo else None
+    if geo_info is None:
+        if services.geo_db_only:
+            geo_info = dict(collector.UNKNOWN_GEO_INFO)
+        else:
+            with run_metrics.metrics.timed("geo"):
+                geo_info = await get_geo_info_async(http, limits, ip, geo_lookup)
+    return collector.build_validated_config(config, geo_info, probe["latency_ms"], probe)
+
+async def run_async_engine(
+    channels: List[str],
+    limits: Optional[StageLimits] = None,
+    cursors: Optional[Dict[str, ChannelCursor]] = None,
+    backfill_pages: int = 0,
+    index: Optional[ConfigIndex] = None,
+    services: Optional[ValidationServices] = None,
+    batches: Optional[Iterable[Tuple[str, Set[str]]]] = None,
+    window: Optional[int] = None,
+    results: Optional[ResultSpool] = None,
+) -> Union[List[ValidatedConfig], ResultSpool]:
+    """
+    Scrapes and validates configs on a single event loop.
+
+    Each channel's configs are fingerprinted into a shared index and the first config
+    seen for each server is pushed straight onto a validation queue as soon as the
+    channel is parsed, so validation overlaps with scraping instead of waiting for
+    the slowest channel.
+
+    Args:
+        channels: Telegram channel names to scrape.
+        limits: Per-stage concurrency ceilings. Defaults to the ASYNC_* constants.
+        cursors: Per-channel cursors for incremental scraping, updated in place.
+        backfill_pages: Older pages to walk for channels without a cursor.
+        index: Fingerprint index shared with the caller; records which channels carried each server.
+        services: Shared caches and lookup backends (see collector.ValidationServices).
+        batches: (channel or source, configs) pairs to validate instead of fetching channels,
+            e.g. a sharded run's scrape output or a raw corpus; consumed lazily, in order.
+        window: Most configs in flight, queued or being validated (default: twice
+            ASYNC_VALIDATION_WORKERS). At most `window` validation workers run (no more than
+            ASYNC_VALIDATION_WORKERS); producers wait while the window is full, so input is
+            read as fast as it is validated.
+        results: Where validated configs go (e.g. a ResultSpool); a new list by default.
+
+    Returns:
+        `results`, or the list of validated configs, in completion order.
+    """
+    limits = limits or StageLimits()
+    services = services or ValidationServices()
+    connection_limit = collector.ASYNC_SCRAPE_CONCURRENCY + collector.ASYNC_GEO_CONCURRENCY
+    index = index if index is not None else ConfigIndex()
+    validated_configs = results if results is not None else []
+    workers = min(window or collector.ASYNC_VALIDATION_WORKERS, collector.ASYNC_VALIDATION_WORKERS)
+    # Without a window, as many configs queue up as there are workers
+    window = window or 2 * workers
+    # Held from the moment a config is queued until its validation finishes
+    window_slots = asyncio.Semaphore(window)
+    queue: "asyncio.Queue[Optional[ProxyConfig]]" = asyncio.Queue()
+    processed_count = 0
+    metrics = run_metrics.metrics
+
+    async with create_http_session(connection_limit) as http:
+        geo_lookup = None
+        if services.geo_cache is not None:
+            geo_lookup = AsyncGeoLookup(services.geo_cache, lambda ips: fetch_geo_batch_async(http, ips, limits.hosts))
+
+        async def enqueue(channel_name: str, channel_configs: Set[str]):
+            # The event loop is single-threaded, so the index needs no lock
+            new_configs = index.add_many(channel_configs, channel_name)
+            metrics.channel_configs(channel_name, len(channel_configs), len(new_configs))
+            if channel_name in index.rejections:
+                metrics.channel_rejections(channel_name, index.rejections[channel_name])
+            for cfg in collector.select_due_configs(new_configs, services):
+                await window_slots.acquire()
+                await queue.put(cfg)
+            metrics.queue_depth("validation", queue.qsize())
+
+        async def produce(channel_name: str):
+            try:
+                channel_configs = await scrape_channel_async(http, limits, channel_name, cursors, backfill_pages)
+            except Exception as e:
+                logging.error(f"An exception occurred while processing channel {channel_name}: {e}")
+                return
+            await enqueue(channel_name, channel_configs)
+
+        async def produce_batches():
+            # Reading the input (files, base64 decoding) stays off the loop, one batch at a time
+            iterator = iter(batches)
+            while True:
+                batch = await asyncio.to_thread(next, iterator, None)
+                if batch is None:
+                    return
+                await enqueue(*batch)
+
+        async def consume():
+            nonlocal processed_count
+            while True:
+                config = await queue.get()
+                if config is None:
+                    return
+                metrics.queue_depth("validation", queue.qsize())
+                result = None
+                try:
+                    result = await validate_and_enrich_config_async(
+                        http, limits, config, services, geo_lookup
+                    )
+                    if result:
+                        validated_configs.append(result)
+                except Exception as e:
+                    logging.error(f"An exception occurred while validating config {config.raw[:30]}...: {e}")
+                finally:
+                    window_slots.release()
+                collector.record_health(services, config, result)
+                processed_count += 1
+                if processed_count % 20 == 0:
+                    logging.info(f"Validation progress: {processed_count}/{len(index)} configs processed.")
+
+        logging.info("--- Starting Scraping and Validation Pipeline (async) ---")
+        consumers = [asyncio.create_task(consume()) for _ in range(workers)]
+        with metrics.stage("scrape"):
+            if batches is None:
+                await asyncio.gather(*(produce(name) for name in channels))
+            else:
+                await produce_batches()
+        logging.info(
+            f"--- Scraping Complete --- Found {len(index)} unique servers in {index.raw_count} scraped configs "
+            f"({index.unparsed} unparseable, {index.rejected} rejected by static checks)."
+        )
+        if index.rejections:
+            logging.info(f"Dropped before validation: {index.rejection_summary()}.")
+
+        # One sentinel per consumer; each exits after draining the queued configs ahead of it
+        for _ in consumers:
+            await queue.put(None)
+        with metrics.stage("validate"):
+            await asyncio.gather(*consumers)
+        logging.info(f"Validation progress: {processed_count}/{len(index)} configs processed.")
+
+    if geo_lookup:
+        logging.info(f"Geo enrichment used {geo_lookup.requests_made} batch requests.")
+    if services.resolver:
+        services.resolver.log_summary()
+    limits.hosts.log_summary()
+    validated_configs.extend(collector.carried_health_results(services))
+    return validated_configs
@@ -0,0 +1,91 @@
+# bench_config_model.py
+# Throughput of the parse-once config model on a synthetic 100k-config corpus.
+# Usage: python benchmarks/bench_config_model.py [--count N]
+# ===== IMPORTS & DEPENDENCIES =====
+import argparse
+import base64
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import prober  # noqa: E402
+import xray_tester  # noqa: E402
+from config_fingerprint import ConfigIndex, config_fingerprint  # noqa: E402
+from config_model import ProxyConfig  # noqa: E402
+
+# ===== CONFIGURATION & CONSTANTS =====
+DEFAULT_COUNT = 100_000
+SEED = 1234
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+def synthetic_corpus(count: int, seed: int = SEED) -> List[str]:
+    """Builds a reproducible mix of share links shaped like the ones scraped from channels."""
+    rng = random.Random(seed)
+    configs = []
+    for i in range(count):
+        host = f"{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+        if rng.random() < 0.3:
+            host = f"node{i % 5000}.example{rng.randrange(50)}.com"
+        port = rng.choice((443, 8443, 2053, 80, 8080, rng.randrange(1024, 65535)))
+        uuid = f"{rng.getrandbits(128):032x}"
+        uuid = f"{uuid[:8]}-{uuid[8:12]}-{uuid[12:16]}-{uuid[16:20]}-{uuid[20:]}"
+        kind = i % 6
+        if kind == 0:
+            data = {"v": "2", "ps": f"vmess {i}", "add": host, "port": str(port), "id": uuid, "aid": "0",
+                    "scy": "auto", "net": "ws", "type": "none", "host": "cdn.example.com", "path": "/ws", "tls": "tls"}
+            configs.append("vmess://" + base64.b64encode(json.dumps(data).encode()).decode())
+        elif kind in (1, 2):
+            configs.append(
+                f"vless://{uuid}@{host}:{port}?encryption=none&security=reality&sni=www.example.com&fp=chrome"
+                f"&pbk=Q{uuid[:20]}&sid={uuid[:8]}&type=grpc&serviceName=grpc#%F0%9F%87%A9%F0%9F%87%AA%20vless{i}"
+            )
+        elif kind == 3:
+            configs.append(f"trojan://{uuid[:16]}@{host}:{port}?sni=example.org&type=tcp#trojan-{i}")
+        elif kind == 4:
+            userinfo = base64.urlsafe_b64encode(f"chacha20-ietf-poly1305:{uuid[:12]}".encode()).decode().rstrip("=")
+            configs.append(f"ss://{userinfo}@{host}:{port}#ss-{i}")
+        else:
+            configs.append(f"hy2://{uuid[:12]}@{host}:{port}?sni=example.net&insecure=1#hy2-{i}")
+    return configs
+
+def timed(label: str, count: int, run: Callable[[], object]) -> object:
+    started = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<24} {elapsed * 1000:9.1f} ms  {count / elapsed:12,.0f} configs/s")
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark parsing and re-serializing share-link configs.")
+    parser.add_argument("--count", type=int, default=DEFAULT_COUNT, help="Number of synthetic configs.")
+    args = parser.parse_args(argv)
+
+    corpus = synthetic_corpus(args.count)
+    print(f"Corpus: {len(corpus):,} configs")
+    records: List[ProxyConfig] = timed("parse", len(corpus), lambda: [ProxyConfig.parse(c) for c in corpus])
+    timed("fingerprint (record)", len(records), lambda: [config_fingerprint(r) for r in records])
+    timed("fingerprint (string)", len(corpus), lambda: [config_fingerprint(c) for c in corpus])
+    timed("with_name", len(records), lambda: [r.with_name("DE-Hetzner-139ms-VLESS") for r in records])
+    timed("probe endpoint", len(records), lambda: [prober.endpoint_from_config(r) for r in records])
+    timed("xray outbound", len(records), lambda: [xray_tester.outbound_from_config(r, "out") for r in records])
+
+    index = ConfigIndex()
+    timed("ConfigIndex.add_many", len(corpus), lambda: index.add_many(set(corpus), "bench"))
+    print(f"Index: {len(index):,} unique servers, {index.unparsed} unparseable")
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [ProxyConfig.parse(c) for c in corpus]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"Memory: {(after - before) / len(kept):,.0f} bytes per record, params included")
+
+if __name__ == "__main__":
+    main()
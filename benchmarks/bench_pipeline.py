@@ -0,0 +1,253 @@
+# bench_pipeline.py
+# Offline, reproducible timings of each collector stage against local stubs for t.me, ip-api.com and DNS.
+# Usage: python benchmarks/bench_pipeline.py [--sizes 10k,100k,1m] [--latency-ms 20 --error-rate 0.01]
+#        [--json out.json] [--compare previous.json]
+# ===== IMPORTS & DEPENDENCIES =====
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import v2ray_collector3 as collector  # noqa: E402
+from bench_config_model import synthetic_corpus  # noqa: E402
+from config_fingerprint import ConfigIndex  # noqa: E402
+from dns_resolver import DNSResolver  # noqa: E402
+from fixtures import channel_page, load_fixture_pages  # noqa: E402
+from rate_limiter import HostLimiters, HostPolicy  # noqa: E402
+from stub_server import Faults, StubDNS, StubServer, geo_record  # noqa: E402
+
+# ===== CONFIGURATION & CONSTANTS =====
+DEFAULT_SIZES = "10k,100k"
+CONFIGS_PER_PAGE = 60  # Synthetic channel pages carry this many configs (3 per message)
+GEO_SAMPLE = 2000  # Single-IP get_geo_info calls timed; the batch endpoint covers every IP
+GEO_BATCH_SIZE = 100
+SEED = 1234
+STUB_POLICY = HostPolicy(rate=None, max_concurrency=1000, initial_concurrency=1000)
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * multiplier)
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class StageTimer:
+    """Collects per-unit durations for each stage and the stage totals."""
+
+    def __init__(self):
+        self.stages: List[Dict] = []
+
+    def run(self, stage: str, unit: str, items: Iterable, call: Callable,
+            items_per_call: Callable = lambda item, result: 1, workers: int = 1) -> List:
+        """
+        Calls `call(item)` for every item, `workers` at a time, timing each call.
+
+        Throughput counts items_per_call(item, result) per call (configs per page, say).
+        """
+        items = list(items)
+        durations: List[float] = []
+        results: List = []
+
+        def timed(item):
+            started = time.perf_counter()
+            result = call(item)
+            return result, (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        if workers > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                for result, elapsed_ms in executor.map(timed, items):
+                    results.append(result)
+                    durations.append(elapsed_ms)
+        else:
+            for item in items:
+                result, elapsed_ms = timed(item)
+                results.append(result)
+                durations.append(elapsed_ms)
+        elapsed = time.perf_counter() - started
+        count = sum(items_per_call(item, result) for item, result in zip(items, results))
+        self.stages.append({
+            "stage": stage, "unit": unit, "calls": len(items), "items": count, "seconds": round(elapsed, 4),
+            "items_per_second": round(count / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": round(percentile(durations, 0.50), 3), "p99_ms": round(percentile(durations, 0.99), 3),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        })
+        return results
+
+def synthetic_pages(corpus: List[str]) -> Dict[str, str]:
+    """Spreads the corpus over channel pages with CONFIGS_PER_PAGE configs each, after the shipped fixtures."""
+    pages = load_fixture_pages()
+    for number, start in enumerate(range(0, len(corpus), CONFIGS_PER_PAGE)):
+        channel = f"bench_{number:06d}"
+        pages[channel] = channel_page(channel, corpus[start:start + CONFIGS_PER_PAGE], seed=SEED)
+    return pages
+
+def point_collector_at(stub: StubServer):
+    """Sends the collector's t.me and ip-api.com requests to the stub server."""
+    collector.TELEGRAM_CHANNEL_URL = f"{stub.url}/s/{{channel}}"
+    collector.GEO_IP_API_URL = f"{stub.url}/json/{{ip}}?fields=status,country,countryCode,isp"
+    collector.GEO_IP_BATCH_URL = f"{stub.url}/batch?fields=status,country,countryCode,isp,query"
+
+def run_size(size: int, args) -> Dict:
+    """Runs every stage on a corpus of `size` configs and returns the report."""
+    logging.getLogger().setLevel(logging.WARNING)
+    corpus = synthetic_corpus(size, SEED)
+    pages = synthetic_pages(corpus)
+    faults = Faults(args.latency_ms, args.jitter_ms, args.error_rate, SEED)
+    timer = StageTimer()
+
+    with StubServer(lambda channel, before: pages.get(channel), faults) as stub, StubDNS(faults) as dns:
+        point_collector_at(stub)
+        # The stub stands in for every upstream, so it gets no rate budget; failed requests are
+        # still retried and back off the way the collector's adapter does against the real hosts
+        limiters = HostLimiters({"127.0.0.1": STUB_POLICY})
+        session = collector.create_requests_session(pool_size=collector.VALIDATOR_WORKERS, limiters=limiters)
+
+        fetched = timer.run(
+            "fetch_channel_content", "page", pages,
+            lambda channel: collector.fetch_channel_content(session, channel), workers=collector.SCRAPER_WORKERS,
+        )
+        html_pages = [page for page in fetched if page]
+        parsed = timer.run(
+            "parse_v2ray_configs", "page", html_pages, collector.parse_v2ray_configs,
+            items_per_call=lambda page, configs: len(configs),
+        )
+        index = ConfigIndex()
+        timer.run(
+            "dedup (ConfigIndex)", "page", list(enumerate(parsed)),
+            lambda item: index.add_many(item[1], f"page{item[0]}"), items_per_call=lambda item, _: len(item[1]),
+        )
+        records = [record for _, record in index.items()]
+
+        resolver = DNSResolver()
+        ips = timer.run(
+            "get_server_ip", "config", records, lambda record: collector.get_server_ip(record, resolver),
+            workers=collector.VALIDATOR_WORKERS,
+        )
+        unique_ips = sorted({ip for ip in ips if ip})
+        rng = random.Random(SEED)
+        sample = rng.sample(unique_ips, min(args.geo_sample, len(unique_ips)))
+        timer.run(
+            "get_geo_info", "IP", sample, lambda ip: collector.get_geo_info(session, ip),
+            workers=collector.UNBATCHED_GEO_VALIDATOR_WORKERS,
+        )
+        batches = [unique_ips[i:i + GEO_BATCH_SIZE] for i in range(0, len(unique_ips), GEO_BATCH_SIZE)]
+
+        def fetch_batch(batch):
+            try:
+                return collector.fetch_geo_batch(session, batch)
+            except collector.requests.exceptions.RequestException:
+                return []
+
+        timer.run("fetch_geo_batch", "batch", batches, fetch_batch, items_per_call=lambda batch, _: len(batch), workers=2)
+        session.close()
+        requests_served = dict(stub.requests)
+        dns_queries = dns.queries
+
+    ip_by_record = dict(zip((record.raw for record in records), ips))
+    results = []
+    for record in records:
+        ip = ip_by_record[record.raw]
+        if ip:
+            geo = collector.parse_geo_response(geo_record(ip))
+            results.append(collector.build_validated_config(record, geo, rng.randrange(20, collector.MAX_LATENCY_MS)))
+    results.sort(key=lambda x: (x["latency"], x["config"]))
+    with tempfile.TemporaryDirectory() as output_dir:
+        collector.VALIDATED_DIR = Path(output_dir)
+        timer.run("save_results", "run", [results], collector.save_results, items_per_call=lambda results, _: len(results))
+
+    return {
+        "size": size, "unique_configs": len(records), "unparsed": index.unparsed, "pages": len(pages),
+        "stub_requests": requests_served, "dns_queries": dns_queries,
+        "faults": {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "error_rate": args.error_rate},
+        "stages": timer.stages,
+    }
+
+def print_report(report: Dict, previous: Optional[Dict] = None):
+    print(f"\nCorpus {report['size']:,} configs: {report['pages']:,} pages, {report['unique_configs']:,} unique, "
+          f"{report['unparsed']} unparseable; stub requests {report['stub_requests']}, DNS queries {report['dns_queries']}")
+    before = {stage["stage"]: stage for stage in (previous or {}).get("stages", [])}
+    print(f"{'stage':<22} {'calls':>8} {'items':>9} {'seconds':>9} {'items/s':>12} {'p50 ms':>9} {'p99 ms':>9} {'peak RSS':>9}")
+    for stage in report["stages"]:
+        line = (
+            f"{stage['stage']:<22} {stage['calls']:>8,} {stage['items']:>9,} {stage['seconds']:>9.3f} "
+            f"{stage['items_per_second']:>12,.0f} {stage['p50_ms']:>9.3f} {stage['p99_ms']:>9.3f} {stage['peak_rss_mb']:>7.0f}MB"
+        )
+        old = before.get(stage["stage"])
+        if old and old["items_per_second"]:
+            line += f"  ({stage['items_per_second'] / old['items_per_second'] - 1:+.0%} vs previous)"
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the collector's stages offline against local stubs.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated corpus sizes, e.g. 10k,100k,1m.")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Mean latency the stubs add per request.")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Standard deviation of the added latency.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub requests that fail.")
+    parser.add_argument("--geo-sample", type=int, default=GEO_SAMPLE, help="Single-IP geo lookups to time.")
+    parser.add_argument("--json", type=Path, help="Write the reports to this file.")
+    parser.add_argument("--compare", type=Path, help="A previous --json file to compare throughput with.")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)  # One size, in this process
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(size) for size in args.sizes.split(",") if size.strip()]
+    if args.single:
+        report = run_size(sizes[0], args)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f)
+        return
+
+    previous = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = {report["size"]: report for report in json.load(f)["reports"]}
+    reports = []
+    for size in sizes:
+        # Each size runs in a fresh process, so peak RSS is that size's own
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+            tmp_path = Path(tmp.name)
+        forwarded = [
+            "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+            "--error-rate", str(args.error_rate), "--geo-sample", str(args.geo_sample),
+        ]
+        try:
+            subprocess.run(
+                [sys.executable, __file__, "--single", "--sizes", str(size), "--json", str(tmp_path), *forwarded],
+                check=True,
+            )
+            with open(tmp_path, "r", encoding="utf-8") as f:
+                report = json.load(f)
+        finally:
+            os.unlink(tmp_path)
+        reports.append(report)
+        print_report(report, previous.get(size))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "reports": reports}, f, indent=1)
+        print(f"\nWrote {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# fixtures.py
+# t.me/s/<channel> page fixtures for the offline benchmarks: loading, synthesizing and recording them.
+# Usage: python benchmarks/fixtures.py --record channel1 channel2   (needs network; refreshes the fixtures)
+#        python benchmarks/fixtures.py --generate                    (rebuilds the shipped fixtures offline)
+# ===== IMPORTS & DEPENDENCIES =====
+import argparse
+import html
+import random
+import sys
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_config_model import synthetic_corpus  # noqa: E402
+
+# ===== CONFIGURATION & CONSTANTS =====
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+MESSAGES_PER_PAGE = 20  # What t.me/s/ returns per page
+SHIPPED_CHANNELS = ("bench_configs_a", "bench_configs_b", "bench_configs_c")
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+
+PAGE_HEAD = (
+    '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>{channel} – Telegram</title>\n'
+    '<meta property="og:title" content="{channel}">\n'
+    '<link href="//telegram.org/css/widget-frame.css?71" rel="stylesheet">\n</head>\n'
+    '<body class="widget_frame_base tgme_webpreview_body">\n<main class="tgme_main">\n'
+    '<section class="tgme_channel_history js-message_history">\n'
+)
+PAGE_TAIL = "</section>\n</main>\n</body>\n</html>\n"
+MESSAGE = (
+    '<div class="tgme_widget_message_wrap js-widget_message_wrap">'
+    '<div class="tgme_widget_message text_not_supported_wrap js-widget_message" data-post="{channel}/{message_id}" '
+    'data-view="eyJjIjotMTAwMTIzNDU2Nzg5LCJwIjo{message_id}fQ">\n'
+    '<div class="tgme_widget_message_user"><a href="https://t.me/{channel}"><i class="tgme_widget_message_user_photo bgcolor2" '
+    'data-content="{initial}"></i></a></div>\n'
+    '<div class="tgme_widget_message_bubble">\n'
+    '<div class="tgme_widget_message_author accent_color"><a class="tgme_widget_message_owner_name" href="https://t.me/{channel}">'
+    '<span dir="auto">{channel}</span></a></div>\n'
+    '<div class="tgme_widget_message_text js-message_text" dir="auto">{text}</div>\n'
+    '<div class="tgme_widget_message_footer compact js-message_footer"><div class="tgme_widget_message_info short js-message_info">'
+    '<span class="tgme_widget_message_views">{views}</span><span class="copyonclick">'
+    '<a class="tgme_widget_message_date" href="https://t.me/{channel}/{message_id}">'
+    '<time datetime="{timestamp}" class="time">{clock}</time></a></span></div></div>\n'
+    "</div></div></div>\n"
+)
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+def message_text(configs: Sequence[str], rng: random.Random) -> str:
+    """Lays configs out the ways channels post them: one <code> each, several per <pre>, or inline text."""
+    style = rng.random()
+    escaped = [html.escape(c, quote=False) for c in configs]
+    header = f'<b>🔥 Free configs #{rng.randrange(1000)}</b><br/><br/>'
+    if style < 0.5:
+        body = "<br/>".join(f"<code>{c}</code>" for c in escaped)
+    elif style < 0.8:
+        body = '<pre><code class="language-text">' + "<br/>".join(escaped) + "</code></pre>"
+    else:
+        body = "<br/><br/>".join(escaped)  # Not in <code>: the extractors must ignore these
+    return header + body + '<br/><br/>📡 <a href="https://t.me/bench">@bench</a>'
+
+def channel_page(channel: str, configs: Sequence[str], first_message_id: int = 1000, seed: int = 0) -> str:
+    """Builds a t.me/s/<channel> page with MESSAGES_PER_PAGE messages sharing `configs` between them."""
+    rng = random.Random(f"{channel}/{first_message_id}/{seed}")
+    parts = [PAGE_HEAD.format(channel=channel)]
+    per_message = max(1, -(-len(configs) // MESSAGES_PER_PAGE))
+    for i in range(MESSAGES_PER_PAGE):
+        chunk = configs[i * per_message:(i + 1) * per_message]
+        message_id = first_message_id + i
+        text = message_text(chunk, rng) if chunk else "No configs today."
+        hour, minute = divmod(i * 7, 60)
+        parts.append(MESSAGE.format(
+            channel=channel, message_id=message_id, initial=channel[:1].upper(), text=text,
+            views=f"{rng.randrange(1, 999)}.{rng.randrange(10)}K",
+            timestamp=f"2024-05-01T{hour:02d}:{minute:02d}:00+00:00", clock=f"{hour:02d}:{minute:02d}",
+        ))
+    parts.append(PAGE_TAIL)
+    return "".join(parts)
+
+def fixture_path(channel: str) -> Path:
+    return FIXTURES_DIR / f"{channel}.html"
+
+def load_fixture_pages() -> Dict[str, str]:
+    """Returns every fixture page by channel name."""
+    return {path.stem: path.read_text(encoding="utf-8") for path in sorted(FIXTURES_DIR.glob("*.html"))}
+
+def record(channels: List[str]):
+    """Saves the live t.me/s/<channel> page of each channel as a fixture."""
+    FIXTURES_DIR.mkdir(exist_ok=True)
+    for channel in channels:
+        request = urllib.request.Request(f"https://t.me/s/{channel}", headers={"User-Agent": USER_AGENT})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            fixture_path(channel).write_bytes(response.read())
+        print(f"Recorded {fixture_path(channel)}")
+
+def generate():
+    """Rebuilds the shipped fixtures from the synthetic corpus, so they can be recreated without network."""
+    FIXTURES_DIR.mkdir(exist_ok=True)
+    corpus = synthetic_corpus(len(SHIPPED_CHANNELS) * 60)
+    for i, channel in enumerate(SHIPPED_CHANNELS):
+        page = channel_page(channel, corpus[i * 60:(i + 1) * 60], first_message_id=5000 + i * 100)
+        fixture_path(channel).write_text(page, encoding="utf-8")
+        print(f"Wrote {fixture_path(channel)}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the t.me page fixtures used by the benchmarks.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--record", nargs="+", metavar="CHANNEL", help="Fetch live channel pages (needs network).")
+    group.add_argument("--generate", action="store_true", help="Rebuild the shipped synthetic fixtures.")
+    args = parser.parse_args(argv)
+    if args.record:
+        record(args.record)
+    else:
+        generate()
+
+if __name__ == "__main__":
+    main()
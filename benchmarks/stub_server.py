@@ -0,0 +1,181 @@
+# stub_server.py
+# Local stand-ins for t.me, the ip-api.com geo API and DNS, with configurable latency and error rates.
+# ===== IMPORTS & DEPENDENCIES =====
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+# ===== CONFIGURATION & CONSTANTS =====
+COUNTRIES = (
+    ("DE", "Germany"), ("US", "United States"), ("NL", "Netherlands"), ("FR", "France"), ("FI", "Finland"),
+    ("GB", "United Kingdom"), ("SG", "Singapore"), ("JP", "Japan"), ("CA", "Canada"), ("TR", "Turkey"),
+)
+ISPS = ("Hetzner Online GmbH", "Cloudflare, Inc.", "OVH SAS", "DigitalOcean, LLC", "Amazon.com, Inc.", "Akamai")
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+def _stable_int(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+
+def geo_record(ip: str) -> Dict:
+    """The ip-api.com answer for an IP; deterministic, so runs are comparable."""
+    value = _stable_int(ip)
+    code, name = COUNTRIES[value % len(COUNTRIES)]
+    return {"status": "success", "country": name, "countryCode": code, "isp": ISPS[value // 7 % len(ISPS)], "query": ip}
+
+def stub_address(name: str) -> str:
+    value = _stable_int(name)
+    return f"{value % 223 + 1}.{value >> 8 & 255}.{value >> 16 & 255}.{value >> 24 & 254 or 1}"
+
+class Faults:
+    """Latency (mean and spread, ms) and error rate shared by the stubs, drawn from one seeded RNG."""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """Returns (delay in seconds, whether this request fails)."""
+        with self._lock:
+            delay = max(0.0, self._rng.gauss(self.latency_ms, self.jitter_ms)) / 1000 if self.latency_ms else 0.0
+            return delay, self._rng.random() < self.error_rate
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # Headers and body go out in separate writes
+    server: "StubServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _fault(self) -> bool:
+        delay, failed = self.server.faults.draw()
+        if delay:
+            time.sleep(delay)
+        if failed:
+            self._send(503, b"stub error", "text/plain")
+        return failed
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        self.server.count(parts.path)
+        if self._fault():
+            return
+        if parts.path.startswith("/s/"):
+            channel = parts.path[3:].strip("/")
+            before = parse_qs(parts.query).get("before", [None])[0]
+            page = self.server.page(channel, int(before) if before and before.isdigit() else None)
+            if page is None:
+                self._send(404, b"unknown channel", "text/plain")
+            else:
+                self._send(200, page.encode("utf-8"), "text/html; charset=utf-8")
+        elif parts.path.startswith("/json/"):
+            body = json.dumps(geo_record(parts.path[len("/json/"):])).encode()
+            self._send(200, body, "application/json", {"X-Rl": "44", "X-Ttl": "60"})
+        else:
+            self._send(404, b"not found", "text/plain")
+
+    def do_POST(self):
+        parts = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = self.rfile.read(length)
+        self.server.count(parts.path)
+        if self._fault():
+            return
+        if parts.path == "/batch":
+            ips = json.loads(payload or b"[]")
+            self._send(200, json.dumps([geo_record(ip) for ip in ips]).encode(), "application/json", {"X-Rl": "14", "X-Ttl": "60"})
+        else:
+            self._send(404, b"not found", "text/plain")
+
+class StubServer(ThreadingHTTPServer):
+    """
+    Serves t.me/s/<channel> pages at /s/<channel> and the ip-api.com endpoints
+    at /json/<ip> and /batch on 127.0.0.1. Use as a context manager; `url` is
+    the base to substitute for https://t.me and http://ip-api.com.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, pages: Callable[[str, Optional[int]], Optional[str]], faults: Optional[Faults] = None):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.page = pages
+        self.faults = faults or Faults()
+        self.requests: Dict[str, int] = {}
+        self._count_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, path: str):
+        key = path.split("/")[1] if "/" in path else path
+        with self._count_lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def __enter__(self) -> "StubServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+class StubDNS:
+    """
+    Replaces socket.getaddrinfo while active, answering every name with a
+    deterministic address after the configured latency; `faults.error_rate`
+    of the names get NXDOMAIN. IP literals and localhost still resolve normally.
+    """
+
+    def __init__(self, faults: Optional[Faults] = None):
+        self.faults = faults or Faults()
+        self.queries = 0
+        self._original = socket.getaddrinfo
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0) -> List:
+        if not isinstance(host, str) or host == "localhost" or host.replace(".", "").isdigit():
+            return self._original(host, port, family, type, proto, flags)
+        self.queries += 1
+        delay, failed = self.faults.draw()
+        if delay:
+            time.sleep(delay)
+        if failed:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return [(socket.AF_INET, type or socket.SOCK_STREAM, proto, "", (stub_address(host), port or 0))]
+
+    def gethostbyname(self, host: str) -> str:
+        try:
+            return self.getaddrinfo(host, None, socket.AF_INET)[0][4][0]
+        except IndexError:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known") from None
+
+    def __enter__(self) -> "StubDNS":
+        self._original_gethostbyname = socket.gethostbyname
+        socket.getaddrinfo = self.getaddrinfo
+        socket.gethostbyname = self.gethostbyname
+        return self
+
+    def __exit__(self, *exc_info):
+        socket.getaddrinfo = self._original
+        socket.gethostbyname = self._original_gethostbyname
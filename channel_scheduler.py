@@ -0,0 +1,272 @@
+# channel_scheduler.py
+# Per-channel yield scoring, adaptive refresh intervals and parking of channels that stay empty.
+# ===== IMPORTS & DEPENDENCIES =====
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from config_fingerprint import ConfigIndex, config_fingerprint
+from output_writer import write_atomic
+
+# ===== CONFIGURATION & CONSTANTS =====
+SCORE_WINDOW = 6  # Recent runs a channel's score is based on
+BASE_INTERVAL_SECONDS = 3600  # Productive channels are scraped every run (the workflow runs hourly)
+MAX_INTERVAL_SECONDS = 24 * 3600
+TARGET_WORKING_PER_VISIT = 1.0  # Slower channels are visited about once per expected working config
+PARK_AFTER_RUNS = 12  # Consecutive empty runs before a channel is parked
+PARKED_RECHECK_SECONDS = 7 * 24 * 3600  # Parked channels are still tried this often
+# Pass rates are smoothed towards this prior, weighted as this many configs, so
+# one lucky config doesn't make a channel look perfect
+PRIOR_PASS_RATE = 0.2
+PRIOR_WEIGHT = 5.0
+COST_FLOOR_SECONDS = 0.25  # Fetch cost below this counts as this, so fast fetches don't dominate scores
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+class ChannelScore:
+    """
+    Recent history of one channel.
+
+    Each history entry is [servers, working, fetch_seconds] for one scrape:
+    servers found, weighted by 1/number of channels that posted the same
+    server this run (so reposts earn little); the same weighting over servers
+    that passed validation; and the time spent fetching the channel's pages.
+    `fingerprints` are the servers found by the last scrape, whose results are
+    carried forward while the channel waits for its next refresh.
+    """
+
+    __slots__ = ("last_scraped", "empty_runs", "parked", "history", "fingerprints")
+
+    def __init__(self, last_scraped: float = 0.0, empty_runs: int = 0, parked: bool = False,
+                 history: Optional[List[List[float]]] = None, fingerprints: Optional[List[str]] = None):
+        self.last_scraped = last_scraped
+        self.empty_runs = empty_runs
+        self.parked = parked
+        self.history = history if history is not None else []
+        self.fingerprints = fingerprints if fingerprints is not None else []
+
+    def _mean(self, column: int) -> float:
+        return sum(entry[column] for entry in self.history) / len(self.history) if self.history else 0.0
+
+    @property
+    def servers(self) -> float:
+        return self._mean(0)
+
+    @property
+    def pass_rate(self) -> float:
+        servers = sum(entry[0] for entry in self.history)
+        working = sum(entry[1] for entry in self.history)
+        return (working + PRIOR_PASS_RATE * PRIOR_WEIGHT) / (servers + PRIOR_WEIGHT)
+
+    @property
+    def expected_working(self) -> float:
+        """Working servers a scrape of this channel is expected to contribute."""
+        return self.servers * self.pass_rate
+
+    @property
+    def fetch_seconds(self) -> float:
+        return self._mean(2)
+
+    @property
+    def score(self) -> float:
+        """Expected working servers per second of fetching; unknown channels score highest."""
+        if not self.history:
+            return float("inf")
+        return self.expected_working / max(self.fetch_seconds, COST_FLOOR_SECONDS)
+
+    def to_json(self) -> Dict:
+        return {
+            "last_scraped": self.last_scraped, "empty_runs": self.empty_runs, "parked": self.parked,
+            "history": [[round(value, 3) for value in entry] for entry in self.history],
+            "fingerprints": self.fingerprints,
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "ChannelScore":
+        return cls(data.get("last_scraped", 0.0), data.get("empty_runs", 0), data.get("parked", False),
+                   data.get("history", []), data.get("fingerprints", []))
+
+class ChannelScheduler:
+    """
+    Decides which channels to scrape each run, and in what order.
+
+    A channel's refresh interval is BASE_INTERVAL when it is expected to yield
+    at least TARGET_WORKING_PER_VISIT working servers per scrape, and grows in
+    inverse proportion to that expectation up to `max_interval`. t.me/s/ pages
+    hold a channel's latest ~20 posts, so a slow channel visited less often
+    still has most of its new posts on the page. Due channels are ordered by
+    score, so the scrape pool starts on the most productive ones. A channel
+    that yields nothing (or fails to load) for `park_after` runs in a row is
+    parked and only tried every PARKED_RECHECK_SECONDS until it yields again.
+    """
+
+    def __init__(
+        self,
+        file_path: Path,
+        base_interval: float = BASE_INTERVAL_SECONDS,
+        max_interval: float = MAX_INTERVAL_SECONDS,
+        park_after: int = PARK_AFTER_RUNS,
+    ):
+        self.file_path = file_path
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.park_after = park_after
+        self.scores: Dict[str, ChannelScore] = self._load()
+        self.skipped: List[str] = []
+        self.parked_skipped: List[str] = []
+        self.failed: List[str] = []
+
+    def _load(self) -> Dict[str, ChannelScore]:
+        if not self.file_path.exists():
+            return {}
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                return {name: ChannelScore.from_json(data) for name, data in json.load(f).items()}
+        except (OSError, ValueError, AttributeError) as e:
+            logging.warning(f"Ignoring unreadable channel scores file {self.file_path}: {e}")
+            return {}
+
+    def interval(self, score: ChannelScore) -> float:
+        """Seconds between scrapes of a channel."""
+        if score.parked:
+            return PARKED_RECHECK_SECONDS
+        expected = score.expected_working
+        if expected >= TARGET_WORKING_PER_VISIT:
+            return self.base_interval
+        return min(self.max_interval, self.base_interval * TARGET_WORKING_PER_VISIT / max(expected, 1e-9))
+
+    def due_at(self, name: str) -> float:
+        """When a channel is next due; 0 for a channel that was never scraped."""
+        score = self.scores.get(name)
+        return score.last_scraped + self.interval(score) if score else 0.0
+
+    def plan(self, channels: Iterable[str], now: Optional[float] = None) -> List[str]:
+        """
+        Returns the channels due this run, highest score first.
+
+        A small slack (5% of the base interval) keeps an hourly schedule from
+        skipping a channel because this run started a few seconds early.
+        """
+        now = now or time.time()
+        slack = self.base_interval * 0.05
+        due = []
+        self.skipped, self.parked_skipped = [], []
+        for name in channels:
+            score = self.scores.get(name)
+            if score is None or now + slack >= self.due_at(name):
+                due.append(name)
+            elif score.parked:
+                self.parked_skipped.append(name)
+            else:
+                self.skipped.append(name)
+        due.sort(key=lambda name: -(self.scores[name].score if name in self.scores else float("inf")))
+        logging.info(
+            f"Channel scheduler: {len(due)} channels due, {len(self.skipped)} waiting for their next refresh, "
+            f"{len(self.parked_skipped)} parked."
+        )
+        return due
+
+    def record_run(
+        self,
+        scraped: Iterable[str],
+        index: ConfigIndex,
+        validated_configs: Iterable[Dict],
+        fetch_stats: Dict[str, Dict],
+        now: Optional[float] = None,
+    ):
+        """
+        Scores this run's scrape of each channel.
+
+        Args:
+            scraped: The channels scraped this run.
+            index: The run's index, which knows which channels posted each server.
+            validated_configs: The configs that passed validation (fresh and carried forward).
+            fetch_stats: Per-channel fetch stats from run_metrics ("fetch_seconds", "status").
+        """
+        now = now or time.time()
+        self.failed = []
+        working = {config_fingerprint(res["config"]) for res in validated_configs}
+        servers: Dict[str, float] = {}
+        passed: Dict[str, float] = {}
+        found_by: Dict[str, List[str]] = {}
+        for fingerprint, _ in index.items():
+            channels = index.channels(fingerprint)
+            share = 1 / len(channels) if channels else 0.0
+            for channel in channels:
+                servers[channel] = servers.get(channel, 0.0) + share
+                found_by.setdefault(channel, []).append(fingerprint)
+                if fingerprint in working:
+                    passed[channel] = passed.get(channel, 0.0) + share
+
+        for name in scraped:
+            stats = fetch_stats.get(name, {})
+            # No stats means the fetch wasn't instrumented; a None status is a connection error
+            failed = stats.get("status", 200) != 200
+            if failed:
+                self.failed.append(name)
+            self.record_scrape(
+                name, servers.get(name, 0.0), passed.get(name, 0.0), stats.get("fetch_seconds", 0.0),
+                None if failed else found_by.get(name, []), now,
+            )
+
+    def record_scrape(
+        self,
+        name: str,
+        servers: float,
+        working: float,
+        fetch_seconds: float,
+        fingerprints: Optional[Iterable[str]],
+        now: Optional[float] = None,
+    ):
+        """
+        Scores one scrape of a channel.
+
+        `servers` and `working` are already weighted by reposts (see ChannelScore);
+        `fingerprints` is None when the channel failed to load, which keeps the
+        servers of its last good scrape.
+        """
+        score = self.scores.setdefault(name, ChannelScore())
+        score.history = (score.history + [[servers, working, fetch_seconds]])[-SCORE_WINDOW:]
+        score.last_scraped = now or time.time()
+        if fingerprints is not None:
+            score.fingerprints = sorted(fingerprints)
+        if servers and fingerprints is not None:
+            if score.parked:
+                logging.info(f"Channel {name} is posting again; unparking it.")
+            score.empty_runs, score.parked = 0, False
+        else:
+            score.empty_runs += 1
+            if score.empty_runs >= self.park_after and not score.parked:
+                score.parked = True
+                logging.info(f"Parking channel {name}: nothing found in {score.empty_runs} runs.")
+
+    def waiting_fingerprints(self) -> Set[str]:
+        """Servers found by the last good scrape of each channel skipped this run or that failed to load."""
+        waiting: Set[str] = set()
+        for name in self.skipped + self.parked_skipped + self.failed:
+            waiting.update(self.scores[name].fingerprints)
+        return waiting
+
+    def forget_missing(self, channels: Iterable[str]):
+        """Drops scores for channels no longer listed in channels.txt."""
+        listed = set(channels)
+        for name in [name for name in self.scores if name not in listed]:
+            del self.scores[name]
+
+    def save(self):
+        data = {name: score.to_json() for name, score in sorted(self.scores.items())}
+        write_atomic(self.file_path, (json.dumps(data, indent=1, sort_keys=True) + "\n").encode("utf-8"))
+        logging.info(f"Saved scores for {len(data)} channels to {self.file_path}")
+
+    def log_summary(self, top: int = 5):
+        ranked = sorted((s.score, name) for name, s in self.scores.items() if s.history)
+        if not ranked:
+            return
+        best = ", ".join(
+            f"{name} ({self.scores[name].expected_working:.1f} working/scrape, "
+            f"{self.scores[name].pass_rate:.0%} pass)" for _, name in reversed(ranked[-top:])
+        )
+        parked = sum(score.parked for score in self.scores.values())
+        logging.info(f"Channel scores: top {best}; {parked} channels parked.")
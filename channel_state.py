@@ -0,0 +1,118 @@
+# channel_state.py
+# Persisted per-channel message cursors for incremental scraping (--incremental).
+# ===== IMPORTS & DEPENDENCIES =====
+import hashlib
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, TypedDict
+
+# ===== CONFIGURATION & CONSTANTS =====
+STATE_DIR = Path("state")
+CHANNEL_STATE_FILE = STATE_DIR / "channel_state.json"
+
+# Every message on a t.me/s/<channel> page carries data-post="<channel>/<id>"
+MESSAGE_MARKER_PATTERN = re.compile(r'data-post="[^"/]+/(\d+)"')
+MESSAGE_TIME_PATTERN = re.compile(r'<time[^>]*datetime="([^"]+)"')
+CODE_BLOCK_PATTERN = re.compile(r"<code[^>]*>.*?</code>", re.DOTALL | re.IGNORECASE)
+
+# ===== TYPE DEFINITIONS =====
+class ChannelMessage(TypedDict):
+    message_id: int
+    timestamp: str
+    html: str
+
+class ChannelCursor(TypedDict):
+    last_message_id: int
+    last_timestamp: str
+    content_hash: str
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+def load_channel_state(file_path: Path = CHANNEL_STATE_FILE) -> Dict[str, ChannelCursor]:
+    """Loads the per-channel cursors saved by a previous run."""
+    if not file_path.exists():
+        return {}
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable channel state file {file_path}: {e}")
+        return {}
+
+def save_channel_state(state: Dict[str, ChannelCursor], file_path: Path = CHANNEL_STATE_FILE):
+    """Writes the per-channel cursors atomically so an interrupted run can't corrupt them."""
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = file_path.with_suffix(file_path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, file_path)
+    logging.info(f"Saved cursors for {len(state)} channels to {file_path}")
+
+def split_channel_messages(html_content: str) -> List[ChannelMessage]:
+    """
+    Splits a t.me/s/<channel> page into its individual messages.
+
+    Args:
+        html_content: The HTML of a channel page.
+
+    Returns:
+        The messages on the page, in page order (oldest first).
+    """
+    markers = list(MESSAGE_MARKER_PATTERN.finditer(html_content))
+    messages: List[ChannelMessage] = []
+    for i, marker in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(html_content)
+        segment = html_content[marker.start():end]
+        time_match = MESSAGE_TIME_PATTERN.search(segment)
+        messages.append({
+            "message_id": int(marker.group(1)),
+            "timestamp": time_match.group(1) if time_match else "",
+            "html": segment,
+        })
+    return messages
+
+def message_content_hash(message: ChannelMessage) -> str:
+    """Hashes only the <code> regions of a message, so view counters don't change the hash."""
+    digest = hashlib.sha256()
+    for block in CODE_BLOCK_PATTERN.findall(message["html"]):
+        digest.update(block.encode("utf-8"))
+    return digest.hexdigest()
+
+def select_new_messages(messages: List[ChannelMessage], cursor: Optional[ChannelCursor]) -> List[ChannelMessage]:
+    """
+    Returns the messages that were not seen by the previous run.
+
+    A message newer than the cursor is always new. The message at the cursor itself
+    is returned again only if its content hash changed, i.e. it was edited.
+    """
+    if not cursor:
+        return list(messages)
+    last_id = cursor["last_message_id"]
+    selected = []
+    for message in messages:
+        if message["message_id"] > last_id:
+            selected.append(message)
+        elif message["message_id"] == last_id and message_content_hash(message) != cursor["content_hash"]:
+            selected.append(message)
+    return selected
+
+def advance_cursor(messages: List[ChannelMessage], cursor: Optional[ChannelCursor]) -> Optional[ChannelCursor]:
+    """Moves the cursor to the newest message in `messages`, never backwards."""
+    if not messages:
+        return cursor
+    newest = max(messages, key=lambda m: m["message_id"])
+    if cursor and newest["message_id"] < cursor["last_message_id"]:
+        return cursor
+    return {
+        "last_message_id": newest["message_id"],
+        "last_timestamp": newest["timestamp"],
+        "content_hash": message_content_hash(newest),
+    }
+
+def oldest_message_id(html_content: str) -> Optional[int]:
+    """Returns the smallest message ID on a page, used as the next ?before= value for back-fill."""
+    ids = [int(m.group(1)) for m in MESSAGE_MARKER_PATTERN.finditer(html_content)]
+    return min(ids) if ids else None
@@ -0,0 +1,194 @@
+# compact_results.py
+# Columnar, dictionary-encoded export of the validated results, and a lazy reader for it.
+# ===== IMPORTS & DEPENDENCIES =====
+import json
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+from urllib.parse import quote
+
+from config_model import NAME_SAFE_CHARS, parse_config
+
+# ===== CONFIGURATION & CONSTANTS =====
+FORMAT_VERSION = 1
+# Low-cardinality columns stored as indexes into a per-column list of distinct values
+DICTIONARY_COLUMNS = ("protocol", "country_code", "country_name", "isp")
+PLAIN_COLUMNS = ("name", "display_name", "latency", "latency_p90", "jitter")
+# Keys every record has; other keys only appear when the record had them
+REQUIRED_KEYS = {"config", "protocol", "name", "country_code", "country_name", "isp", "latency"}
+KNOWN_KEYS = {"config", "renamed_config", *DICTIONARY_COLUMNS, *PLAIN_COLUMNS}
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+def _with_name(config: str, base: str, name: str) -> Optional[str]:
+    """What ProxyConfig.with_name(name) gives for the config, without parsing unless it is vmess."""
+    if not base.startswith("vmess://"):
+        return f"{base}#{quote(name, safe=NAME_SAFE_CHARS)}"
+    parsed = parse_config(config)
+    return parsed.with_name(name) if parsed else None
+
+def _renamed_suffix(config: str, base: str, name: str, renamed: Optional[str]):
+    """
+    Encodes renamed_config relative to the config.
+
+    None means the config re-serialized with its name (the usual case), a
+    string starting with "#" (or "") is a suffix of the base URI, and anything
+    else is the full URI. A missing renamed_config is stored as False.
+    """
+    if renamed is None:
+        return False
+    if renamed == _with_name(config, base, name):
+        return None
+    if renamed.startswith(base) and renamed[len(base):len(base) + 1] in ("#", ""):
+        return renamed[len(base):]
+    return renamed
+
+def encode_results(results: Sequence[Dict]) -> Dict:
+    """
+    Converts result records (the results.json schema) to the compact columnar form.
+
+    Each config is split into its base URI and #fragment, renamed_config is
+    only stored when it isn't the config re-serialized with its name, and
+    protocol/country/ISP are dictionary encoded. decode_results(encode_results(r)) == r.
+    """
+    dictionaries: Dict[str, List[str]] = {column: [] for column in DICTIONARY_COLUMNS}
+    lookups: Dict[str, Dict[str, int]] = {column: {} for column in DICTIONARY_COLUMNS}
+    columns: Dict[str, List] = {
+        column: [] for column in ("base", "fragment", "renamed", *DICTIONARY_COLUMNS, *PLAIN_COLUMNS, "extra")
+    }
+    for res in results:
+        base, hash_sign, fragment = res["config"].partition("#")
+        columns["base"].append(base)
+        columns["fragment"].append(hash_sign + fragment)
+        columns["renamed"].append(_renamed_suffix(res["config"], base, res["name"], res.get("renamed_config")))
+        for column in DICTIONARY_COLUMNS:
+            value = res[column]
+            index = lookups[column].get(value)
+            if index is None:
+                index = lookups[column][value] = len(dictionaries[column])
+                dictionaries[column].append(value)
+            columns[column].append(index)
+        for column in PLAIN_COLUMNS:
+            columns[column].append(res.get(column))
+        extra = {key: value for key, value in res.items() if key not in KNOWN_KEYS}
+        columns["extra"].append(extra or None)
+    if not any(columns["extra"]):
+        del columns["extra"]
+    return {"version": FORMAT_VERSION, "count": len(results), "dictionaries": dictionaries, "columns": columns}
+
+def compact_json(results: Sequence[Dict]) -> str:
+    return json.dumps(encode_results(results), ensure_ascii=False, separators=(",", ":")) + "\n"
+
+class CompactResults:
+    """
+    Read access to a compact export without materializing every record.
+
+    Columns stay as the lists they were loaded as. Filters compare dictionary
+    indexes and plain numbers and return row indexes; rows are only turned into
+    result dicts by record(), records() or iteration.
+    """
+
+    def __init__(self, data: Dict):
+        if data.get("version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported compact results version: {data.get('version')}")
+        self.count: int = data["count"]
+        self.dictionaries: Dict[str, List[str]] = data["dictionaries"]
+        self.columns: Dict[str, List] = data["columns"]
+        self._extra: Optional[List] = self.columns.get("extra")
+
+    @classmethod
+    def load(cls, file_path: Path) -> "CompactResults":
+        with open(file_path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def value(self, column: str, row: int):
+        """One decoded cell, e.g. value("country_code", 3)."""
+        if column in self.dictionaries:
+            return self.dictionaries[column][self.columns[column][row]]
+        if column == "config":
+            return self.columns["base"][row] + self.columns["fragment"][row]
+        if column == "renamed_config":
+            return self._renamed(row)
+        return self.columns[column][row]
+
+    def _renamed(self, row: int) -> Optional[str]:
+        suffix = self.columns["renamed"][row]
+        base = self.columns["base"][row]
+        if suffix is None:
+            return _with_name(base + self.columns["fragment"][row], base, self.columns["name"][row])
+        if suffix is False:
+            return None
+        return base + suffix if suffix[:1] in ("#", "") else suffix
+
+    def record(self, row: int) -> Dict:
+        """Rebuilds one result record exactly as it appeared in results.json."""
+        res = {"config": self.value("config", row)}
+        renamed = self._renamed(row)
+        if renamed is not None:
+            res["renamed_config"] = renamed
+        for column in DICTIONARY_COLUMNS:
+            res[column] = self.dictionaries[column][self.columns[column][row]]
+        for column in PLAIN_COLUMNS:
+            value = self.columns[column][row]
+            if value is not None or column in REQUIRED_KEYS:
+                res[column] = value
+        if self._extra and self._extra[row]:
+            res.update(self._extra[row])
+        return res
+
+    def records(self, rows: Optional[Sequence[int]] = None) -> Iterator[Dict]:
+        for row in range(self.count) if rows is None else rows:
+            yield self.record(row)
+
+    def __iter__(self) -> Iterator[Dict]:
+        return self.records()
+
+    def _code(self, column: str, value: Optional[str]) -> Optional[int]:
+        # -1 matches no row, for values absent from the dictionary
+        if value is None:
+            return None
+        try:
+            return self.dictionaries[column].index(value)
+        except ValueError:
+            return -1
+
+    def filter(
+        self,
+        protocol: Optional[str] = None,
+        country_code: Optional[str] = None,
+        isp: Optional[str] = None,
+        max_latency: Optional[int] = None,
+    ) -> List[int]:
+        """
+        Returns the indexes of the rows matching every given condition.
+
+        Example:
+            results.records(results.filter(country_code="DE", max_latency=300))
+        """
+        wanted = [
+            (self.columns[column], code)
+            for column, code in (
+                ("protocol", self._code("protocol", protocol)),
+                ("country_code", self._code("country_code", country_code.upper() if country_code else None)),
+                ("isp", self._code("isp", isp)),
+            )
+            if code is not None
+        ]
+        latencies = self.columns["latency"]
+        return [
+            row for row in range(self.count)
+            if all(column[row] == code for column, code in wanted)
+            and (max_latency is None or latencies[row] <= max_latency)
+        ]
+
+    def counts(self, column: str) -> Dict[str, int]:
+        """Rows per distinct value of a dictionary-encoded column, without decoding any row."""
+        tally = [0] * len(self.dictionaries[column])
+        for code in self.columns[column]:
+            tally[code] += 1
+        return dict(zip(self.dictionaries[column], tally))
+
+def decode_results(data: Dict) -> List[Dict]:
+    return list(CompactResults(data))
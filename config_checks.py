@@ -0,0 +1,132 @@
+# config_checks.py
+# Static per-protocol sanity checks and reserved-address filtering, run before a config costs any network work.
+# ===== IMPORTS & DEPENDENCIES =====
+import re
+import socket
+from bisect import bisect_right
+from typing import Iterable, List, Optional, Tuple
+
+from config_model import ProxyConfig
+
+# ===== CONFIGURATION & CONSTANTS =====
+# Special-purpose ranges (RFC 6890 and successors) that no public proxy can live in
+RESERVED_NETWORKS_V4 = (
+    "0.0.0.0/8", "10.0.0.0/8", "100.64.0.0/10", "127.0.0.0/8", "169.254.0.0/16", "172.16.0.0/12",
+    "192.0.0.0/24", "192.0.2.0/24", "192.88.99.0/24", "192.168.0.0/16", "198.18.0.0/15",
+    "198.51.100.0/24", "203.0.113.0/24", "224.0.0.0/4", "240.0.0.0/4",
+)
+RESERVED_NETWORKS_V6 = (
+    "::/127", "::ffff:0:0/96", "64:ff9b:1::/48", "100::/64", "2001:db8::/32", "3fff::/20",
+    "fc00::/7", "fe80::/10", "fec0::/10", "ff00::/8",
+)
+# Names that only resolve inside a network (RFC 6761, RFC 6762, ICANN's .internal)
+RESERVED_SUFFIXES = (".localhost", ".local", ".internal", ".invalid", ".test", ".example", ".home.arpa", ".lan")
+UUID_PATTERN = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\Z", re.IGNORECASE)
+# At least two labels and a TLD that starts with a letter, so "1.2.3.400" isn't taken for a name
+HOSTNAME_PATTERN = re.compile(r"(?:[a-z0-9_](?:[a-z0-9_-]{0,61}[a-z0-9_])?\.)+[a-z][a-z0-9-]{0,62}\Z")
+SS_METHODS = frozenset((
+    "aes-128-gcm", "aes-192-gcm", "aes-256-gcm", "chacha20-poly1305", "chacha20-ietf-poly1305",
+    "xchacha20-poly1305", "xchacha20-ietf-poly1305", "2022-blake3-aes-128-gcm", "2022-blake3-aes-256-gcm",
+    "2022-blake3-chacha20-poly1305", "aes-128-cfb", "aes-192-cfb", "aes-256-cfb", "aes-128-ctr",
+    "aes-192-ctr", "aes-256-ctr", "chacha20", "chacha20-ietf", "rc4-md5", "none", "plain",
+))
+VMESS_SECURITIES = frozenset(("auto", "aes-128-gcm", "chacha20-poly1305", "none", "zero"))
+TRUNCATION_MARK = "\u2026"  # Telegram cuts long messages with an ellipsis
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+def _range_table(networks: Iterable[str], family: int) -> Tuple[List[int], List[int]]:
+    """Turns CIDRs into sorted, merged [start, end] integer ranges for bisect lookups."""
+    bits = 32 if family == socket.AF_INET else 128
+    ranges = []
+    for network in networks:
+        address, _, prefix = network.partition("/")
+        start = int.from_bytes(socket.inet_pton(family, address), "big")
+        ranges.append((start, start + (1 << (bits - int(prefix))) - 1))
+    starts: List[int] = []
+    ends: List[int] = []
+    for start, end in sorted(ranges):
+        if ends and start <= ends[-1] + 1:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+RESERVED_V4 = _range_table(RESERVED_NETWORKS_V4, socket.AF_INET)
+RESERVED_V6 = _range_table(RESERVED_NETWORKS_V6, socket.AF_INET6)
+IPV4_MAPPED_PREFIX = bytes(10) + b"\xff\xff"
+
+def _in_table(table: Tuple[List[int], List[int]], value: int) -> bool:
+    starts, ends = table
+    position = bisect_right(starts, value) - 1
+    return position >= 0 and value <= ends[position]
+
+def parse_ip(address: str) -> Optional[bytes]:
+    """Returns the packed form of an IPv4 or IPv6 literal, or None if `address` isn't one."""
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            return socket.inet_pton(family, address)
+        except (OSError, ValueError):
+            continue
+    return None
+
+def is_reserved_packed(packed: bytes) -> bool:
+    if len(packed) == 16 and packed[:12] == IPV4_MAPPED_PREFIX:
+        packed = packed[12:]
+    table = RESERVED_V4 if len(packed) == 4 else RESERVED_V6
+    return _in_table(table, int.from_bytes(packed, "big"))
+
+def is_reserved_address(address: str) -> bool:
+    """True for a private, loopback, link-local, shared, documentation, multicast or otherwise reserved IP."""
+    packed = parse_ip(address)
+    return packed is not None and is_reserved_packed(packed)
+
+def check_host(host: str) -> Optional[str]:
+    """Returns why a server address can't be a public proxy, or None if it can."""
+    host = host.strip("[]").lower()
+    packed = parse_ip(host)
+    if packed is not None:
+        return "reserved_address" if is_reserved_packed(packed) else None
+    if len(host) > 253 or not HOSTNAME_PATTERN.match(host):
+        return "bad_host"
+    if host.endswith(RESERVED_SUFFIXES):
+        return "reserved_name"
+    return None
+
+def check_config(config: ProxyConfig) -> Optional[str]:
+    """
+    Runs the static checks on a parsed config.
+
+    Only the link itself is looked at (no DNS, no sockets), so a check costs a
+    few microseconds. Parsing already rejects missing hosts, bad base64 and
+    ports over 65535; this adds what a parse can't see.
+
+    Returns:
+        None if the config is plausible, else a short rejection reason:
+        truncated, bad_port, bad_host, reserved_name, reserved_address,
+        bad_uuid, missing_password, bad_cipher or missing_reality_key.
+    """
+    if TRUNCATION_MARK in config.raw.partition("#")[0]:
+        return "truncated"
+    if not 0 < config.port < 65536:
+        return "bad_port"
+    reason = check_host(config.host)
+    if reason:
+        return reason
+    protocol = config.protocol
+    if protocol in ("vless", "vmess"):
+        if not UUID_PATTERN.match(config.credential):
+            return "bad_uuid"
+        if protocol == "vmess" and config.method.lower() not in VMESS_SECURITIES:
+            return "bad_cipher"
+    elif protocol == "ss":
+        if config.method.lower() not in SS_METHODS:
+            return "bad_cipher"
+        if not config.credential and config.method.lower() not in ("none", "plain"):
+            return "missing_password"
+    elif protocol == "trojan" and not config.credential:
+        return "missing_password"
+    if config.security == "reality" and not config.params.get("pbk"):
+        return "missing_reality_key"
+    return None
@@ -0,0 +1,100 @@
+# config_extractor.py
+# Pulls V2Ray config links out of t.me/s/<channel> pages without building a DOM.
+# ===== IMPORTS & DEPENDENCIES =====
+import html
+import re
+from typing import Iterator, Set
+
+try:
+    from lxml import etree
+except ImportError:  # lxml is optional; the regex scanner needs only the stdlib
+    etree = None
+
+# ===== CONFIGURATION & CONSTANTS =====
+PROTOCOLS = ("vmess", "vless", "ss", "trojan", "hysteria", "hy2")
+
+# Same acceptance rule as the original BeautifulSoup parser
+PROTOCOL_PATTERN = re.compile(r"^(?:vmess|vless|ss|trojan|hysteria|hy2)://")
+# Where a new config starts inside a line. The lookbehind keeps "vless://" from
+# being split at its inner "ss://" and ignores headers glued to a preceding word.
+CONFIG_START_PATTERN = re.compile(r"(?<![A-Za-z0-9])(?:vmess|vless|ss|trojan|hysteria|hy2)://")
+# Telegram renders configs in <code> (often inside <pre>); nested <code> does not occur
+CODE_BLOCK_PATTERN = re.compile(r"<code\b[^>]*>(.*?)</code\s*>", re.DOTALL | re.IGNORECASE)
+TAG_PATTERN = re.compile(r"<[^>]*>")
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+def split_config_line(line: str) -> Iterator[str]:
+    """
+    Splits a line holding several configs back to back into individual configs.
+
+    This is the start_indices splitting from the original v2ray_collector.py,
+    applied per line so text on other lines is never glued onto a config. A line
+    with a single header is returned unchanged, as the line-based parser saw it.
+    """
+    starts = [m.start() for m in CONFIG_START_PATTERN.finditer(line)]
+    if len(starts) <= 1:
+        yield line
+        return
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else len(line)
+        yield line[start:end].strip()
+
+def configs_from_text(text: str, configs: Set[str]):
+    """Adds every config found in the text of one <code> block to `configs`."""
+    for line in text.strip().splitlines():
+        for candidate in split_config_line(line.strip()):
+            if PROTOCOL_PATTERN.match(candidate):
+                configs.add(candidate)
+
+def extract_configs_regex(html_content: str) -> Set[str]:
+    """
+    Scans <code> regions with precompiled patterns.
+
+    Every tag inside a block becomes a line break, matching
+    BeautifulSoup's get_text(separator="\\n").
+    """
+    configs: Set[str] = set()
+    if "<code" not in html_content and "<CODE" not in html_content:
+        return configs
+    for match in CODE_BLOCK_PATTERN.finditer(html_content):
+        inner = match.group(1)
+        if "://" not in inner:
+            continue
+        text = TAG_PATTERN.sub("\n", inner)
+        if "&" in text:
+            text = html.unescape(text)
+        configs_from_text(text, configs)
+    return configs
+
+def extract_configs_lxml(html_content: str) -> Set[str]:
+    """Walks <code> elements with lxml's C parser; each text node becomes a line, as with extract_configs_regex."""
+    configs: Set[str] = set()
+    if "<code" not in html_content and "<CODE" not in html_content:
+        return configs
+    root = etree.fromstring(html_content, etree.HTMLParser())
+    if root is None:
+        return configs
+    for code_block in root.iter("code"):
+        configs_from_text("\n".join(code_block.itertext()), configs)
+    return configs
+
+def extract_configs(html_content: str) -> Set[str]:
+    """
+    Extracts V2Ray config links from the <code> blocks of a Telegram channel page.
+
+    Uses lxml's parser when lxml is installed, else the regex scanner; both
+    return the same set as the original BeautifulSoup parser.
+
+    Args:
+        html_content: The HTML of the page (or of a single message).
+
+    Returns:
+        A set of unique config strings.
+    """
+    if etree is not None:
+        try:
+            return extract_configs_lxml(html_content)
+        except (ValueError, etree.LxmlError):  # e.g. a str page with an XML encoding declaration
+            pass
+    return extract_configs_regex(html_content)
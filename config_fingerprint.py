@@ -0,0 +1,141 @@
+# config_fingerprint.py
+# Canonical per-protocol fingerprints so one server reposted by many channels is validated once.
+# ===== IMPORTS & DEPENDENCIES =====
+import hashlib
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from config_checks import check_config
+from config_model import ProxyConfig
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+def _split_fragment(config: str) -> str:
+    """Drops the #name part of a config."""
+    return config.split("#", 1)[0]
+
+def canonical_form(config: str) -> Tuple:
+    """
+    Returns the parts of a config that identify the server behind it.
+
+    See ProxyConfig.canonical_key; hysteria2:// and hy2:// are treated as the same protocol.
+
+    Raises:
+        ValueError: If the config can't be parsed.
+    """
+    return ProxyConfig.parse(config).canonical_key()
+
+def config_fingerprint(config: Union[str, ProxyConfig]) -> str:
+    """
+    Computes a stable fingerprint for the server a config points at.
+
+    Configs that can't be parsed fall back to the exact URI without its name, so
+    they still dedupe against exact reposts.
+    """
+    if isinstance(config, ProxyConfig):
+        key = repr(config.canonical_key())
+    else:
+        try:
+            key = repr(canonical_form(config))
+        except ValueError:
+            key = _split_fragment(config.strip())
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+class ConfigIndex:
+    """
+    A fingerprint -> representative config index that also records which channels carried each server.
+
+    Each scraped URI is parsed into a ProxyConfig here, once; later stages work on
+    the records. URIs that don't parse are counted in `unparsed` and dropped,
+    since no later stage could reach their server; so are records that fail the
+    static checks (see config_checks.check_config). Both are tallied by reason
+    per channel in `rejections`.
+
+    With keep_records=False the index only remembers fingerprints, for dedup
+    over corpora too large to keep every record: representative(), channels()
+    and items() then know nothing.
+
+    Not thread-safe: both engines update it from a single thread (the as_completed
+    loop or the event loop).
+    """
+
+    def __init__(self, keep_records: bool = True):
+        self.keep_records = keep_records
+        self._representatives: Dict[str, Optional[ProxyConfig]] = {}
+        self._channels: Dict[str, Set[str]] = {}
+        self.raw_count = 0
+        self.unparsed = 0
+        self.rejections: Dict[str, Dict[str, int]] = {}  # channel ("" if none) -> reason -> configs
+
+    def add(self, config: str, channel: Optional[str] = None) -> Optional[ProxyConfig]:
+        """
+        Records a scraped config.
+
+        Returns:
+            The parsed record if this is the first config seen for its server, else None.
+        """
+        self.raw_count += 1
+        try:
+            record = ProxyConfig.parse(config)
+        except ValueError:
+            self.unparsed += 1
+            self._reject(channel, "unparseable")
+            return None
+        reason = check_config(record)
+        if reason:
+            self._reject(channel, reason)
+            return None
+        fingerprint = config_fingerprint(record)
+        is_new = fingerprint not in self._representatives
+        if not self.keep_records:
+            if is_new:
+                self._representatives[fingerprint] = None
+            return record if is_new else None
+        if is_new:
+            self._representatives[fingerprint] = record
+            self._channels[fingerprint] = set()
+        if channel:
+            self._channels[fingerprint].add(channel)
+        return record if is_new else None
+
+    def _reject(self, channel: Optional[str], reason: str):
+        reasons = self.rejections.setdefault(channel or "", {})
+        reasons[reason] = reasons.get(reason, 0) + 1
+
+    @property
+    def rejected(self) -> int:
+        """Configs dropped by the static checks (unparseable ones not included)."""
+        return sum(n for reasons in self.rejections.values() for reason, n in reasons.items() if reason != "unparseable")
+
+    def rejection_summary(self) -> str:
+        """Rejections by reason over all channels, most common first, e.g. "bad_uuid 12, truncated 3"."""
+        totals: Dict[str, int] = {}
+        for reasons in self.rejections.values():
+            for reason, n in reasons.items():
+                totals[reason] = totals.get(reason, 0) + n
+        return ", ".join(f"{reason} {n}" for reason, n in sorted(totals.items(), key=lambda item: (-item[1], item[0])))
+
+    def add_many(self, configs: Set[str], channel: Optional[str] = None) -> List[ProxyConfig]:
+        """Records a channel's configs and returns the representatives that were new."""
+        new_configs = []
+        for config in sorted(configs):  # Sorted so the representative doesn't depend on set order
+            record = self.add(config, channel)
+            if record:
+                new_configs.append(record)
+        return new_configs
+
+    def representative(self, fingerprint: str) -> Optional[ProxyConfig]:
+        return self._representatives.get(fingerprint)
+
+    def channels(self, fingerprint: str) -> Set[str]:
+        """Returns the channels that posted the server behind `fingerprint`."""
+        return self._channels.get(fingerprint, set())
+
+    def items(self) -> Iterator[Tuple[str, ProxyConfig]]:
+        """Yields (fingerprint, representative record) pairs in insertion order."""
+        return iter(self._representatives.items())
+
+    def __contains__(self, fingerprint: str) -> bool:
+        return fingerprint in self._representatives
+
+    def __len__(self) -> int:
+        return len(self._representatives)
@@ -0,0 +1,226 @@
+# config_model.py
+# Parse-once typed records for share-link configs (vmess, vless, trojan, ss, hysteria/hy2).
+# ===== IMPORTS & DEPENDENCIES =====
+import base64
+import binascii
+import json
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote, unquote
+
+# ===== CONFIGURATION & CONSTANTS =====
+PROTOCOLS = ("vmess", "vless", "trojan", "ss", "hysteria", "hy2")
+# Scheme spellings that name the same protocol
+PROTOCOL_ALIASES = {"hysteria2": "hy2"}
+# vmess JSON keys that describe the server; "ps" (the display name) and "v" are left out
+VMESS_KEYS = ("add", "port", "id", "aid", "scy", "net", "type", "host", "path", "tls", "sni", "alpn", "fp")
+# vmess JSON key -> share-link query name, so every record exposes transport params the same way
+VMESS_PARAMS = {"host": "host", "path": "path", "sni": "sni", "alpn": "alpn", "fp": "fp", "type": "headerType", "aid": "aid"}
+# Characters kept as-is when a name is written into a URI fragment
+NAME_SAFE_CHARS = "-_.~!$&'()*+,;=:@/?[]"
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+def decode_base64(data: str) -> str:
+    """Decodes standard or URL-safe base64 that may be missing its padding."""
+    data = data.strip()
+    data += "=" * (-len(data) % 4)
+    try:
+        return base64.b64decode(data, altchars=b"-_" if ("-" in data or "_" in data) else None).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError(f"invalid base64: {e}") from None
+
+def _unquote_plus(text: str) -> str:
+    # Most params need no decoding, and skipping unquote() for them is most of the parse time
+    if "%" in text or "+" in text:
+        return unquote(text.replace("+", " "))
+    return text
+
+def parse_query(query: str) -> Tuple[Tuple[str, str], ...]:
+    """Splits a query string into decoded (key, value) pairs, like parse_qsl(keep_blank_values=True)."""
+    pairs = []
+    for field in query.split("&"):
+        if field:
+            key, _, value = field.partition("=")
+            pairs.append((_unquote_plus(key), _unquote_plus(value)))
+    return tuple(pairs)
+
+def split_server(text: str) -> Tuple[Optional[str], str, int, str]:
+    """
+    Splits "[userinfo@]host:port[/path][?query]" without the cost of urlsplit().
+
+    Returns:
+        (userinfo or None, lowercased host, port, query)
+
+    Raises:
+        ValueError: If the host or port is missing or the port is out of range.
+    """
+    rest, _, query = text.partition("?")
+    netloc = rest.split("/", 1)[0]
+    userinfo, at, hostport = netloc.rpartition("@")
+    if hostport.startswith("["):
+        host, _, tail = hostport[1:].partition("]")
+        port_text = tail[1:] if tail.startswith(":") else ""
+    else:
+        host, _, port_text = hostport.rpartition(":")
+    if not host or not port_text.isdigit() or int(port_text) > 65535:
+        raise ValueError("missing host or port")
+    return (userinfo if at else None), host.lower(), int(port_text), query
+
+class ProxyConfig:
+    """
+    One share-link config, parsed once.
+
+    Attributes:
+        raw: The URI as scraped.
+        protocol: vmess, vless, trojan, ss, hysteria or hy2 (hysteria2:// is stored as hy2).
+        host, port: The server endpoint.
+        credential: UUID (vmess/vless), password (trojan/ss/hysteria) or user:password.
+        method: Cipher for ss and vmess ("auto" if unset), else "".
+        network: Transport (tcp, ws, grpc, ...), "tcp" if unset.
+        security: "tls", "reality" or "none"; trojan defaults to TLS.
+        sni: The TLS server name given in the link, "" if none.
+        params: Transport params by share-link name (host, path, serviceName, fp, ...).
+        fragment: The decoded #name (vmess "ps").
+    """
+
+    __slots__ = (
+        "raw", "protocol", "host", "port", "credential", "method", "network",
+        "security", "sni", "params", "fragment", "_base", "_pairs", "_vmess",
+    )
+
+    def __init__(self, raw: str, protocol: str, host: str, port: int, credential: str, method: str,
+                 network: str, security: str, sni: str, params: Dict[str, str], fragment: str,
+                 base: str, pairs: Tuple[Tuple[str, str], ...] = (), vmess: Optional[Dict] = None):
+        self.raw = raw
+        self.protocol = protocol
+        self.host = host
+        self.port = port
+        self.credential = credential
+        self.method = method
+        self.network = network
+        self.security = security
+        self.sni = sni
+        self.params = params
+        self.fragment = fragment
+        self._base = base  # The URI up to (not including) its '#'
+        self._pairs = pairs  # Every query param in link order, for canonical_key
+        self._vmess = vmess
+
+    @classmethod
+    def parse(cls, uri: str) -> "ProxyConfig":
+        """
+        Parses a share link.
+
+        Raises:
+            ValueError: If the scheme is unsupported or the link is malformed.
+        """
+        uri = uri.strip()
+        scheme, sep, body = uri.partition("://")
+        if not sep:
+            raise ValueError("not a config URI")
+        protocol = scheme.lower()
+        protocol = PROTOCOL_ALIASES.get(protocol, protocol)
+        if protocol not in PROTOCOLS:
+            raise ValueError(f"unsupported protocol: {scheme}")
+        base, _, fragment = uri.partition("#")
+        try:
+            if protocol == "vmess":
+                return cls._parse_vmess(uri, base, body.partition("#")[0])
+            if protocol == "ss":
+                return cls._parse_ss(uri, base, unquote(fragment))
+            return cls._parse_url(uri, protocol, base, unquote(fragment))
+        except (TypeError, AttributeError, KeyError) as e:
+            raise ValueError(f"malformed {protocol} config: {e}") from None
+
+    @classmethod
+    def _parse_vmess(cls, uri: str, base: str, body: str) -> "ProxyConfig":
+        data = json.loads(decode_base64(body))
+        if not isinstance(data, dict):
+            raise ValueError("vmess payload is not an object")
+        host, port = str(data.get("add") or ""), int(data.get("port") or 0)
+        if not host or not 0 < port < 65536:
+            raise ValueError("missing host or port")
+        params = {name: str(data[key]) for key, name in VMESS_PARAMS.items() if data.get(key) not in (None, "")}
+        tls = str(data.get("tls") or "").lower()
+        return cls(
+            uri, "vmess", host, port, str(data.get("id") or ""), str(data.get("scy") or "auto"),
+            str(data.get("net") or "tcp"), tls if tls in ("tls", "reality") else "none",
+            params.get("sni", ""), params, str(data.get("ps") or ""), base, vmess=data,
+        )
+
+    @classmethod
+    def _parse_url(cls, uri: str, protocol: str, base: str, fragment: str) -> "ProxyConfig":
+        userinfo, host, port, query = split_server(base.partition("://")[2])
+        username, colon, password = (userinfo or "").partition(":")
+        credential = unquote(username) + (":" + unquote(password) if colon else "")
+        pairs = parse_query(query)
+        params = dict(reversed(pairs))  # The first value wins, as with parse_qs()[key][0]
+        security = params.get("security", "").lower() or ("tls" if protocol == "trojan" else "none")
+        sni = params.get("sni") or params.get("peer") or params.get("serverName") or ""
+        return cls(
+            uri, protocol, host, port, credential, "", params.get("type") or "tcp",
+            security if security in ("tls", "reality") else "none", sni, params, fragment, base, pairs,
+        )
+
+    @classmethod
+    def _parse_ss(cls, uri: str, base: str, fragment: str) -> "ProxyConfig":
+        body = base[len("ss://"):]
+        if "@" not in body:
+            # Legacy form: ss://base64(method:password@host:port)
+            body, _, query = body.partition("?")
+            body = decode_base64(body) + (f"?{query}" if query else "")
+        userinfo, _, server = body.rpartition("@")
+        userinfo = unquote(userinfo)
+        if ":" not in userinfo:
+            # SIP002 form: ss://base64(method:password)@host:port
+            userinfo = decode_base64(userinfo)
+        method, _, password = userinfo.partition(":")
+        _, host, port, query = split_server(server)
+        if not method:
+            raise ValueError("missing method")
+        pairs = parse_query(query)
+        params = dict(reversed(pairs))
+        return cls(
+            uri, "ss", host, port, password, method, params.get("type") or "tcp", "none", "",
+            params, fragment, base, pairs,
+        )
+
+    def canonical_key(self) -> Tuple:
+        """
+        Returns the parts of the config that identify the server behind it.
+
+        Protocol, host, port, credentials and transport params are kept; the name
+        is dropped and query params are sorted.
+        """
+        if self._vmess is not None:
+            values = []
+            for key in VMESS_KEYS:
+                value = str(self._vmess.get(key, "") or "").strip()
+                values.append(value.lower() if key in ("add", "id", "net", "tls") else value)
+            return ("vmess", *values)
+        if self.protocol == "ss":
+            return ("ss", self.host, self.port, self.method.lower(), self.credential, self._sorted_pairs())
+        # A vless credential is a UUID; trojan/hysteria passwords stay case-sensitive
+        credential = self.credential.lower() if self.protocol == "vless" else self.credential
+        return (self.protocol, self.host, self.port, credential, self._sorted_pairs())
+
+    def _sorted_pairs(self) -> Tuple[Tuple[str, str], ...]:
+        """Query params with lowercased keys, sorted so their order no longer matters."""
+        return tuple(sorted((key.lower(), value) for key, value in self._pairs))
+
+    def with_name(self, name: str) -> str:
+        """Serializes the config with a new display name (the #fragment, or "ps" for vmess)."""
+        if self._vmess is not None:
+            data = dict(self._vmess, ps=name)
+            return "vmess://" + base64.b64encode(json.dumps(data, ensure_ascii=False).encode("utf-8")).decode("ascii")
+        return f"{self._base}#{quote(name, safe=NAME_SAFE_CHARS)}"
+
+    def __repr__(self) -> str:
+        return f"ProxyConfig({self.protocol}://{self.host}:{self.port})"
+
+def parse_config(uri: str) -> Optional[ProxyConfig]:
+    """Parses a share link, returning None if it can't be parsed."""
+    try:
+        return ProxyConfig.parse(uri)
+    except ValueError:
+        return None
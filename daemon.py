@@ -0,0 +1,374 @@
+# daemon.py
+# Resident collector: keeps configs, caches and health in memory and re-scrapes and re-probes them from priority queues.
+# ===== IMPORTS & DEPENDENCIES =====
+import concurrent.futures
+import contextlib
+import heapq
+import logging
+import signal
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import requests
+
+import run_metrics
+import v2ray_collector3 as collector
+from channel_scheduler import ChannelScheduler
+from config_fingerprint import ConfigIndex
+from config_model import ProxyConfig, parse_config
+from health_store import HealthScheduler
+from subscription_server import SubscriptionServer, SubscriptionStore
+
+# ===== CONFIGURATION & CONSTANTS =====
+FLUSH_INTERVAL_SECONDS = 300
+IDLE_WAIT_SECONDS = 30  # Longest wait between queue checks, so a stop request is noticed promptly
+PROBE_BACKLOG_PER_WORKER = 2  # Probes handed to the validator pool ahead of its free workers
+# Probe priority tiers, most important first; within a tier the most overdue server goes first
+NEW_SERVER, PUBLISHED_SERVER, FAILING_SERVER = 0, 1, 2
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+class DueQueue:
+    """
+    Keys with a due time, earliest first. Scheduling a key again replaces its
+    due time; the superseded heap entry is skipped when it surfaces.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, str]] = []
+        self._due: Dict[str, float] = {}
+
+    def schedule(self, key: str, due_at: float):
+        self._due[key] = due_at
+        heapq.heappush(self._heap, (due_at, key))
+
+    def cancel(self, key: str):
+        self._due.pop(key, None)
+
+    def _drop_stale(self):
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def pop_due(self, now: float) -> List[Tuple[float, str]]:
+        """Removes and returns the (due_at, key) pairs that are due."""
+        ready = []
+        self._drop_stale()
+        while self._heap and self._heap[0][0] <= now:
+            due_at, key = heapq.heappop(self._heap)
+            del self._due[key]
+            ready.append((due_at, key))
+            self._drop_stale()
+        return ready
+
+    def next_due(self) -> Optional[float]:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._due
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+class CollectorDaemon:
+    """
+    Runs the collector as a long-lived process.
+
+    Channels are re-scraped when the channel scheduler says they're due, and
+    each server is re-probed when its health history says so. Work that is
+    due waits in priority order: channels by score, then servers never
+    checked, then published servers, then failing ones, each most overdue
+    first. The parsed configs, DNS and geo caches, health history and channel
+    scores stay in memory. Outputs and state files are flushed every
+    `flush_interval` seconds, so results are at most that stale, and only
+    servers that are due get probed.
+
+    A server stays tracked while the last good scrape of some channel listed
+    it, and is published while its last probe passed. State is only touched
+    from the thread that runs run(), like the engines' coordinating loops.
+    """
+
+    def __init__(
+        self,
+        session: requests.Session,
+        services: "collector.ValidationServices",
+        scheduler: ChannelScheduler,
+        channels_file: Path,
+        flush_interval: float = FLUSH_INTERVAL_SECONDS,
+        report_paths: Tuple[Optional[Path], Optional[Path]] = (None, None),
+        subscriptions: Optional[SubscriptionStore] = None,
+    ):
+        if not services.health:
+            raise ValueError("The daemon schedules probes from the health history; it needs services.health")
+        self.session = session
+        self.services = services
+        self.health: HealthScheduler = services.health
+        self.scheduler = scheduler
+        self.channels_file = channels_file
+        self.flush_interval = flush_interval
+        self.report_paths = report_paths
+        self.subscriptions = subscriptions
+        self.metrics = run_metrics.metrics
+        self.channels: List[str] = []
+        self.records: Dict[str, ProxyConfig] = {}
+        self.sources: Dict[str, Set[str]] = {}
+        self.published: Dict[str, Dict] = {}
+        self.scrape_queue = DueQueue()
+        self.probe_queue = DueQueue()
+        # Due work waiting for a free worker, as heaps of (priority..., key)
+        self.ready_scrapes: List[Tuple[float, float, str]] = []
+        self.ready_probes: List[Tuple[int, float, str]] = []
+        self.scrapes_done = 0
+        self.probes_done = 0
+        self._stop = threading.Event()
+
+    # --- Scheduling ---
+
+    def probe_due_at(self, fingerprint: str, now: float) -> float:
+        record = self.health.store.get(fingerprint)
+        if record is None or not record.last_checked or (not record.failures and record.result is None):
+            return now
+        return record.last_checked + self.health.next_check_delay(record)
+
+    def channel_score(self, channel: str) -> float:
+        score = self.scheduler.scores.get(channel)
+        return score.score if score else float("inf")
+
+    def probe_tier(self, fingerprint: str) -> int:
+        record = self.health.store.get(fingerprint)
+        if record is None or not record.last_checked:
+            return NEW_SERVER
+        return PUBLISHED_SERVER if fingerprint in self.published else FAILING_SERVER
+
+    def schedule_probe(self, fingerprint: str, now: float):
+        self.probe_queue.schedule(fingerprint, self.probe_due_at(fingerprint, now))
+
+    def track(self, fingerprint: str, record: ProxyConfig, channel: str, now: float):
+        """Notes that a channel listed a server; a server seen for the first time is scheduled."""
+        self.sources.setdefault(fingerprint, set()).add(channel)
+        self.health.store.mark_seen(fingerprint, now)
+        if fingerprint in self.records:
+            return
+        self.records[fingerprint] = record
+        stored = self.health.store.get(fingerprint)
+        if stored and stored.result and not stored.failures:
+            self.published[fingerprint] = stored.result  # Republished until its next check, as in one-shot runs
+        self.schedule_probe(fingerprint, now)
+
+    def untrack(self, fingerprint: str, channel: str):
+        """Drops a channel's claim on a server; a server no channel lists any more is forgotten."""
+        channels = self.sources.get(fingerprint)
+        if channels is None:
+            return
+        channels.discard(channel)
+        if not channels:
+            del self.sources[fingerprint]
+            self.records.pop(fingerprint, None)
+            self.published.pop(fingerprint, None)
+            self.probe_queue.cancel(fingerprint)
+
+    def load_channels(self, now: float):
+        """(Re)reads the channel list; new channels are scheduled and removed ones dropped with their servers."""
+        channels = collector.load_channels(self.channels_file)
+        if not channels:
+            if self.channels:
+                logging.warning(f"{self.channels_file} is empty; keeping the current channel list.")
+            return
+        listed = set(channels)
+        for name in self.channels:
+            if name not in listed:
+                self.scrape_queue.cancel(name)
+                for fingerprint in self.scheduler.scores[name].fingerprints if name in self.scheduler.scores else ():
+                    self.untrack(fingerprint, name)
+        known = set(self.channels)
+        for name in channels:
+            if name not in known:
+                self.scrape_queue.schedule(name, self.scheduler.due_at(name))
+        self.scheduler.forget_missing(channels)
+        self.channels = channels
+
+    def restore(self, now: float):
+        """Starts from the servers each channel listed when it was last scraped, using their stored results."""
+        restored = 0
+        for name in self.channels:
+            score = self.scheduler.scores.get(name)
+            for fingerprint in score.fingerprints if score else ():
+                stored = self.health.store.get(fingerprint)
+                record = parse_config(stored.result["config"]) if stored and stored.result else None
+                if record:
+                    self.track(fingerprint, record, name, now)
+                    restored += 1
+        logging.info(f"Daemon: restored {len(self.records)} servers from {restored} channel listings.")
+
+    # --- Work ---
+
+    def scrape(self, channel: str) -> Tuple[Set[str], float]:
+        started = time.perf_counter()
+        configs = collector.scrape_channel(self.session, channel)
+        return configs, time.perf_counter() - started
+
+    def finish_scrape(self, channel: str, configs: Optional[Set[str]], fetch_seconds: float, now: float):
+        """Tracks a scrape's servers; `configs` is None when the scrape raised, which counts as a failed load."""
+        self.scrapes_done += 1
+        if channel not in self.channels:
+            return
+        status = self.metrics.channels.get(channel, {}).get("status") if self.metrics.enabled else 200
+        index = ConfigIndex()  # Parses and statically checks this scrape's configs
+        index.add_many(configs or (), channel)
+        found: Dict[str, ProxyConfig] = dict(index.items())
+        self.metrics.channel_rejections(channel, index.rejections.get(channel, {}))
+        failed = configs is None or status != 200
+        if not failed:
+            score = self.scheduler.scores.get(channel)
+            for fingerprint in set(score.fingerprints if score else ()) - found.keys():
+                self.untrack(fingerprint, channel)
+            for fingerprint, record in found.items():
+                self.track(fingerprint, record, channel, now)
+        shares = {fingerprint: 1 / len(self.sources[fingerprint]) for fingerprint in found if fingerprint in self.sources}
+        self.scheduler.record_scrape(
+            channel, sum(shares.values()), sum(share for fp, share in shares.items() if fp in self.published),
+            fetch_seconds, None if failed else found.keys(), now,
+        )
+        self.scrape_queue.schedule(channel, self.scheduler.due_at(channel))
+
+    def finish_probe(self, fingerprint: str, record: ProxyConfig, result: Optional[Dict], now: float):
+        self.probes_done += 1
+        collector.record_health(self.services, record, result)
+        if self.records.get(fingerprint) is not record:
+            return  # Forgotten (or replaced) while the probe ran
+        if result:
+            self.published[fingerprint] = result
+        else:
+            self.published.pop(fingerprint, None)
+        self.schedule_probe(fingerprint, now)
+
+    def flush(self):
+        """Publishes the current results and saves the health history, channel scores and reports."""
+        results = sorted(self.published.values(), key=lambda res: (res["latency"], res["config"]))
+        with self.metrics.stage("save"):
+            collector.save_results(results)
+        if self.subscriptions:
+            self.subscriptions.update(results)
+        self.health.store.save()
+        self.scheduler.save()
+        run_report, metrics_textfile = self.report_paths
+        if run_report:
+            self.metrics.write_json(run_report)
+        if metrics_textfile:
+            self.metrics.write_prometheus(metrics_textfile)
+        logging.info(
+            f"Daemon: published {len(results)} of {len(self.records)} tracked servers; {self.scrapes_done} scrapes "
+            f"and {self.probes_done} probes since the last flush; {len(self.ready_scrapes) + len(self.scrape_queue)} "
+            f"channels and {len(self.ready_probes) + len(self.probe_queue)} servers queued."
+        )
+        self.scrapes_done = self.probes_done = 0
+
+    def stop(self, *_):
+        """Asks run() to finish the work in flight, flush and return. Safe to call from a signal handler."""
+        self._stop.set()
+
+    def finish_future(
+        self,
+        future: concurrent.futures.Future,
+        scrapes: Dict[concurrent.futures.Future, str],
+        probes: Dict[concurrent.futures.Future, Tuple[str, ProxyConfig]],
+        now: float,
+    ):
+        """Hands a finished scrape or probe to finish_scrape/finish_probe, logging what raised."""
+        if future in scrapes:
+            channel = scrapes.pop(future)
+            try:
+                configs, fetch_seconds = future.result()
+            except Exception as e:
+                logging.error(f"An exception occurred while processing channel {channel}: {e}")
+                configs, fetch_seconds = None, 0.0
+            self.finish_scrape(channel, configs, fetch_seconds, now)
+        else:
+            fingerprint, record = probes.pop(future)
+            result = None
+            try:
+                result = future.result()
+            except Exception as e:
+                logging.error(f"An exception occurred while validating config {record.raw[:30]}...: {e}")
+            self.finish_probe(fingerprint, record, result, now)
+
+    def run(self, max_seconds: Optional[float] = None):
+        """Runs until stop() is called (SIGTERM/SIGINT when started from the CLI) or `max_seconds` have passed."""
+        now = time.time()
+        self.load_channels(now)
+        self.restore(now)
+        if self.subscriptions:
+            self.subscriptions.update(list(self.published.values()))  # Serve the restored results until the first flush
+        deadline = now + max_seconds if max_seconds else float("inf")
+        next_flush = now + self.flush_interval
+        validator_workers = collector.prepare_threaded_services(self.session, self.services)
+        probe_capacity = validator_workers * PROBE_BACKLOG_PER_WORKER
+        logging.info(f"--- Daemon started: {len(self.channels)} channels, flushing every {self.flush_interval:.0f}s ---")
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=collector.SCRAPER_WORKERS, thread_name_prefix='Scraper') as scraper, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=validator_workers, thread_name_prefix='Validator') as validator:
+            scrapes: Dict[concurrent.futures.Future, str] = {}
+            probes: Dict[concurrent.futures.Future, Tuple[str, ProxyConfig]] = {}
+            while not self._stop.is_set() and now < deadline:
+                if now >= next_flush:
+                    self.load_channels(now)
+                    self.flush()
+                    next_flush = now + self.flush_interval
+
+                for due_at, channel in self.scrape_queue.pop_due(now):
+                    heapq.heappush(self.ready_scrapes, (-self.channel_score(channel), due_at, channel))
+                for due_at, fingerprint in self.probe_queue.pop_due(now):
+                    heapq.heappush(self.ready_probes, (self.probe_tier(fingerprint), due_at, fingerprint))
+                while self.ready_scrapes and len(scrapes) < collector.SCRAPER_WORKERS:
+                    channel = heapq.heappop(self.ready_scrapes)[2]
+                    if channel in self.channels:
+                        scrapes[scraper.submit(self.scrape, channel)] = channel
+                while self.ready_probes and len(probes) < probe_capacity:
+                    fingerprint = heapq.heappop(self.ready_probes)[2]
+                    record = self.records.get(fingerprint)
+                    if record is not None:
+                        future = validator.submit(collector.validate_and_enrich_config, self.session, record, self.services)
+                        probes[future] = (fingerprint, record)
+                self.metrics.queue_depth("validation", len(self.ready_probes) + len(probes))
+
+                wake_at = min(
+                    next_flush, deadline, now + IDLE_WAIT_SECONDS,
+                    self.scrape_queue.next_due() or float("inf"), self.probe_queue.next_due() or float("inf"),
+                )
+                timeout = max(0.0, wake_at - time.time())
+                if scrapes or probes:
+                    done, _ = concurrent.futures.wait(
+                        list(scrapes) + list(probes), timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                else:
+                    done = set()
+                    self._stop.wait(timeout)
+                now = time.time()
+                for future in done:
+                    self.finish_future(future, scrapes, probes, now)
+
+            logging.info("--- Daemon stopping: finishing the work in flight ---")
+            for future in concurrent.futures.as_completed(list(scrapes) + list(probes)):
+                self.finish_future(future, scrapes, probes, time.time())
+        self.flush()
+
+def run_daemon(args, services: "collector.ValidationServices", scheduler: ChannelScheduler):
+    """Runs the daemon for the collector's --daemon flag, stopping cleanly on SIGTERM or SIGINT."""
+    session = collector.create_requests_session(limiters=collector.HostLimiters(collector.HOST_POLICIES))
+    session.headers.update({"User-Agent": collector.USER_AGENT})
+    subscriptions = SubscriptionStore() if args.serve else None
+    daemon = CollectorDaemon(
+        session, services, scheduler, collector.CHANNELS_FILE, args.flush_minutes * 60,
+        (args.run_report, args.metrics_textfile), subscriptions,
+    )
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    server = SubscriptionServer(subscriptions, *args.serve) if args.serve else contextlib.nullcontext()
+    try:
+        with server:
+            daemon.run(args.daemon_hours * 3600 if args.daemon_hours else None)
+    finally:
+        session.close()
+        services.close()
@@ -0,0 +1,138 @@
+# dashboard_data.py
+# Precomputed summary and content-hashed, precompressed data shards for the dashboard (index.html).
+# ===== IMPORTS & DEPENDENCIES =====
+import gzip
+import json
+from typing import Dict, Iterable, List, Tuple
+
+from output_writer import OutputWriter, content_hash
+
+try:
+    import brotli
+except ImportError:  # Only needed for the .br siblings
+    brotli = None
+
+# ===== CONFIGURATION & CONSTANTS =====
+DATA_DIR = "data"  # Under validated_configs/
+SUMMARY_NAME = "summary.json"  # The only unhashed file: the dashboard's entry point
+PAGE_SIZE = 500  # Rows per page of the all-configs listing
+FASTEST_COUNT = 25  # Rows embedded in the summary, so the first paint needs no shard
+HASH_LENGTH = 12
+# Quality 10-11 shrink the shards ~15% more but take ~40x longer; 9 still beats gzip -9 by 2.5x
+BROTLI_QUALITY = 9
+# Columns of every row in a shard; the dashboard only needs the renamed config
+SHARD_COLUMNS = ("display_name", "protocol", "country_code", "latency", "isp", "renamed_config")
+UNKNOWN_COUNTRY_KEY = "unknown"  # Shard key for "N/A", which would otherwise read like Namibia
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+def encode_json(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+def compressed_variants(data: bytes) -> Dict[str, bytes]:
+    """
+    Returns the file and its precompressed siblings, keyed by suffix ("", ".gz", ".br").
+
+    gzip is written with mtime=0 so identical content compresses to identical
+    bytes and OutputWriter can skip it; .br is only produced if brotli is installed.
+    """
+    variants = {"": data, ".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(data, quality=BROTLI_QUALITY)
+    return variants
+
+def shard_rows(results: Iterable[Dict]) -> Dict:
+    """Packs results as a column list plus one array per row, without the JSON key repeated per record."""
+    rows = []
+    for res in results:
+        row = [res.get(column) for column in SHARD_COLUMNS]
+        if row[-1] is None:
+            row[-1] = res["config"]
+        if row[0] is None:
+            row[0] = res.get("name")
+        rows.append(row)
+    return {"columns": list(SHARD_COLUMNS), "rows": rows}
+
+def country_key(country_code: str) -> str:
+    return UNKNOWN_COUNTRY_KEY if country_code == "N/A" else country_code
+
+class DashboardData:
+    """
+    Builds the files index.html loads, relative to validated_configs/.
+
+    data/summary.json holds the counts behind the stats and charts, the fastest
+    configs and the name of every shard. Shards are the results sorted as given,
+    split into pages and into one file per country and per protocol. Their names
+    carry a hash of their content (data/country-DE.<hash>.json), so they can be
+    cached forever; a change produces a new name and the stale one is removed by
+    OutputWriter. Every file also gets .gz and .br siblings for servers and CDNs
+    that serve precompressed files.
+    """
+
+    def __init__(self, results: List[Dict], page_size: int = PAGE_SIZE, fastest_count: int = FASTEST_COUNT):
+        self.results = results
+        self.page_size = page_size
+        self.fastest_count = fastest_count
+        self.files: Dict[str, bytes] = {}
+
+    def _add(self, relative: str, data: bytes):
+        for suffix, variant in compressed_variants(data).items():
+            self.files[relative + suffix] = variant
+
+    def _add_shard(self, stem: str, results: List[Dict]) -> str:
+        data = encode_json(shard_rows(results))
+        name = f"{stem}.{content_hash(data)[:HASH_LENGTH]}.json"
+        self._add(f"{DATA_DIR}/{name}", data)
+        return name
+
+    def _grouped(self) -> Tuple[Dict[str, List[Dict]], Dict[str, List[Dict]], Dict[str, str]]:
+        by_country: Dict[str, List[Dict]] = {}
+        by_protocol: Dict[str, List[Dict]] = {}
+        country_names: Dict[str, str] = {}
+        for res in self.results:
+            code = res.get("country_code", "N/A").upper()
+            by_country.setdefault(code, []).append(res)
+            by_protocol.setdefault(res["protocol"], []).append(res)
+            country_names.setdefault(code, res.get("country_name") or "Unknown")
+        return by_country, by_protocol, country_names
+
+    def build(self) -> Dict[str, bytes]:
+        """Returns every dashboard file (shards, summary and their compressed siblings) by relative path."""
+        by_country, by_protocol, country_names = self._grouped()
+        pages = [
+            self._add_shard(f"page-{number + 1}", self.results[start:start + self.page_size])
+            for number, start in enumerate(range(0, len(self.results), self.page_size))
+        ]
+        # Largest groups first, ties by name, so the charts' top-N is a slice of the list
+        countries = [
+            {"code": code, "name": country_names[code], "count": len(group),
+             "shard": self._add_shard(f"country-{country_key(code)}", group)}
+            for code, group in sorted(by_country.items(), key=lambda item: (-len(item[1]), item[0]))
+        ]
+        protocols = [
+            {"protocol": protocol, "count": len(group), "shard": self._add_shard(f"protocol-{protocol}", group)}
+            for protocol, group in sorted(by_protocol.items(), key=lambda item: (-len(item[1]), item[0]))
+        ]
+        summary = {
+            "total": len(self.results),
+            "page_size": self.page_size,
+            "pages": pages,
+            "countries": countries,
+            "protocols": protocols,
+            "fastest": shard_rows(self.results[:self.fastest_count]),
+        }
+        self._add(f"{DATA_DIR}/{SUMMARY_NAME}", encode_json(summary))
+        return self.files
+
+def write_dashboard_data(writer: OutputWriter, results: List[Dict]) -> int:
+    """
+    Writes the dashboard files through `writer`. Shards left over from earlier
+    runs are removed by writer.finish().
+
+    Returns:
+        The number of files produced (written or unchanged).
+    """
+    files = DashboardData(results).build()
+    for relative, data in sorted(files.items()):
+        writer.write(relative, data)
+    return len(files)
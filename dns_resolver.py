@@ -0,0 +1,167 @@
+# dns_resolver.py
+# Caching, single-flight DNS resolution shared by the threaded and async validation paths.
+# ===== IMPORTS & DEPENDENCIES =====
+import asyncio
+import concurrent.futures
+import logging
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# ===== CONFIGURATION & CONSTANTS =====
+DEFAULT_TTL_SECONDS = 300  # getaddrinfo doesn't expose record TTLs, so use a fixed one
+NEGATIVE_TTL_SECONDS = 120  # How long an NXDOMAIN answer is remembered
+# Errors that mean "this name does not exist" rather than "try again later"
+NEGATIVE_ERRORS = {socket.EAI_NONAME, getattr(socket, "EAI_NODATA", socket.EAI_NONAME)}
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+def addresses_from_addrinfo(infos: List[Tuple]) -> List[str]:
+    """Returns the unique addresses from getaddrinfo() results, IPv4 before IPv6."""
+    ipv4: List[str] = []
+    ipv6: List[str] = []
+    for family, _, _, _, sockaddr in infos:
+        address = sockaddr[0]
+        bucket = ipv4 if family == socket.AF_INET else ipv6
+        if address not in bucket:
+            bucket.append(address)
+    return ipv4 + ipv6
+
+class NameStats:
+    """Resolution statistics for one hostname."""
+
+    __slots__ = ("lookups", "cache_hits", "failures", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.lookups = 0
+        self.cache_hits = 0
+        self.failures = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, elapsed_ms: float, failed: bool):
+        self.lookups += 1
+        self.failures += failed
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+class DNSResolver:
+    """
+    Resolves hostnames to A and AAAA addresses with an in-process TTL cache.
+
+    NXDOMAIN answers are cached for NEGATIVE_TTL_SECONDS. Concurrent queries for
+    the same name share one lookup, both across threads (resolve) and across
+    coroutines (resolve_async). Per-name latency is recorded for the run log.
+    """
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, negative_ttl_seconds: float = NEGATIVE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._lock = threading.Lock()
+        # name -> (expires_at, addresses); an empty list is a cached NXDOMAIN
+        self._cache: Dict[str, Tuple[float, List[str]]] = {}
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+        self._inflight_async: Dict[str, asyncio.Future] = {}
+        self.stats: Dict[str, NameStats] = {}
+
+    def _cached(self, name: str) -> Optional[List[str]]:
+        entry = self._cache.get(name)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        with self._lock:
+            self.stats.setdefault(name, NameStats()).cache_hits += 1
+        return entry[1]
+
+    def _store(self, name: str, addresses: Optional[List[str]], elapsed_ms: float):
+        """Caches an answer; `addresses` is None for a transient failure, which is not cached."""
+        now = time.monotonic()
+        with self._lock:
+            self.stats.setdefault(name, NameStats()).record(elapsed_ms, not addresses)
+            if addresses:
+                self._cache[name] = (now + self.ttl_seconds, addresses)
+            elif addresses is not None:
+                self._cache[name] = (now + self.negative_ttl_seconds, addresses)
+
+    @staticmethod
+    def _classify_error(error: socket.gaierror) -> Optional[List[str]]:
+        return [] if error.errno in NEGATIVE_ERRORS else None
+
+    def resolve(self, name: str) -> List[str]:
+        """Resolves a hostname, blocking; returns [] if it can't be resolved."""
+        cached = self._cached(name)
+        if cached is not None:
+            return cached
+        with self._lock:
+            future = self._inflight.get(name)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self._inflight[name] = future
+        if not leader:
+            return future.result()
+
+        addresses: Optional[List[str]] = None
+        started = time.perf_counter()
+        try:
+            addresses = addresses_from_addrinfo(socket.getaddrinfo(name, None, type=socket.SOCK_STREAM))
+        except socket.gaierror as e:
+            addresses = self._classify_error(e)
+        except (UnicodeError, OSError):
+            addresses = None
+        finally:
+            self._store(name, addresses, (time.perf_counter() - started) * 1000)
+            with self._lock:
+                del self._inflight[name]
+            future.set_result(addresses or [])
+        return addresses or []
+
+    async def resolve_async(self, name: str) -> List[str]:
+        """Resolves a hostname without blocking the event loop; returns [] if it can't be resolved."""
+        cached = self._cached(name)
+        if cached is not None:
+            return cached
+        future = self._inflight_async.get(name)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight_async[name] = future
+
+        addresses: Optional[List[str]] = None
+        started = time.perf_counter()
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(name, None, type=socket.SOCK_STREAM)
+            addresses = addresses_from_addrinfo(infos)
+        except socket.gaierror as e:
+            addresses = self._classify_error(e)
+        except (UnicodeError, OSError):
+            addresses = None
+        finally:
+            self._store(name, addresses, (time.perf_counter() - started) * 1000)
+            del self._inflight_async[name]
+            future.set_result(addresses or [])
+        return addresses or []
+
+    def resolve_one(self, name: str) -> Optional[str]:
+        """Returns the first address for a hostname (IPv4 preferred), or None."""
+        addresses = self.resolve(name)
+        return addresses[0] if addresses else None
+
+    async def resolve_one_async(self, name: str) -> Optional[str]:
+        addresses = await self.resolve_async(name)
+        return addresses[0] if addresses else None
+
+    def log_summary(self, slowest: int = 5):
+        """Logs cache effectiveness and the slowest names to resolve."""
+        if not self.stats:
+            return
+        lookups = sum(s.lookups for s in self.stats.values())
+        hits = sum(s.cache_hits for s in self.stats.values())
+        failures = sum(s.failures for s in self.stats.values())
+        logging.info(
+            f"DNS: {len(self.stats)} names, {lookups} lookups, {hits} cache hits, {failures} failed/NXDOMAIN."
+        )
+        ranked = sorted(self.stats.items(), key=lambda item: item[1].max_ms, reverse=True)[:slowest]
+        for name, s in ranked:
+            if s.lookups:
+                logging.info(f"DNS slowest: {name} avg {s.total_ms / s.lookups:.0f}ms max {s.max_ms:.0f}ms")
@@ -0,0 +1,236 @@
+# geo_cache.py
+# Persistent TTL geo-IP cache plus batching front-ends for the ip-api.com batch endpoint.
+# ===== IMPORTS & DEPENDENCIES =====
+import asyncio
+import concurrent.futures
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+# ===== CONFIGURATION & CONSTANTS =====
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600  # ISP/country assignments rarely move within a week
+BATCH_SIZE = 100  # ip-api.com accepts at most 100 IPs per batch POST
+BATCH_WINDOW_SECONDS = 0.2  # How long a lookup waits for others to join its batch
+UNKNOWN_GEO_INFO = {"country_code": "N/A", "country_name": "Unknown", "isp": "Unknown ISP"}
+
+# A batch fetcher takes up to BATCH_SIZE IPs and returns the raw ip-api.com records in the same order
+BatchFetcher = Callable[[List[str]], List[Dict]]
+AsyncBatchFetcher = Callable[[List[str]], Awaitable[List[Dict]]]
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+def parse_geo_record(data: Dict) -> Dict:
+    """Converts one ip-api.com record into the geo info dict used for naming."""
+    if data.get("status") == "success":
+        return {
+            "country_code": data.get("countryCode", "N/A"),
+            "country_name": data.get("country", "Unknown"),
+            "isp": data.get("isp", "Unknown ISP"),
+        }
+    return dict(UNKNOWN_GEO_INFO)
+
+def parse_geo_batch(ips: List[str], records: List[Dict]) -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
+    """
+    Parses a batch answer into (geo info for every IP, the part worth caching).
+
+    "fail" records (a reserved range, an invalid query) are answered as unknown
+    but not cached, so they are asked again next run instead of for a whole TTL.
+    """
+    results: Dict[str, Dict] = {}
+    cacheable: Dict[str, Dict] = {}
+    for ip, record in zip(ips, records):
+        results[ip] = parse_geo_record(record)
+        if record.get("status") == "success":
+            cacheable[ip] = results[ip]
+    return results, cacheable
+
+class GeoCache:
+    """
+    An IP -> geo info cache backed by SQLite, with a per-entry TTL.
+
+    Fresh rows are loaded into memory once when the cache is opened; lookups are
+    then dictionary hits and only new results touch the database. Safe to share
+    between threads.
+    """
+
+    def __init__(self, file_path: Path, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.file_path = file_path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._memory: Dict[str, Tuple[float, Dict]] = {}
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(file_path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS geo ("
+            "ip TEXT PRIMARY KEY, country_code TEXT, country_name TEXT, isp TEXT, fetched_at REAL)"
+        )
+        self._load_fresh()
+
+    def _load_fresh(self):
+        cutoff = time.time() - self.ttl_seconds
+        self._db.execute("DELETE FROM geo WHERE fetched_at < ?", (cutoff,))
+        self._db.commit()
+        rows = self._db.execute("SELECT ip, country_code, country_name, isp, fetched_at FROM geo")
+        for ip, country_code, country_name, isp, fetched_at in rows:
+            info = {"country_code": country_code, "country_name": country_name, "isp": isp}
+            self._memory[ip] = (fetched_at, info)
+        logging.info(f"Loaded {len(self._memory)} cached geo entries from {self.file_path}")
+
+    def get(self, ip: str) -> Optional[Dict]:
+        """Returns the cached geo info for an IP, or None if missing or expired."""
+        entry = self._memory.get(ip)
+        if entry is None or time.time() - entry[0] > self.ttl_seconds:
+            return None
+        return dict(entry[1])
+
+    def put_many(self, infos: Dict[str, Dict]):
+        """Stores freshly fetched geo info for several IPs in one transaction."""
+        if not infos:
+            return
+        now = time.time()
+        with self._lock:
+            for ip, info in infos.items():
+                self._memory[ip] = (now, dict(info))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO geo (ip, country_code, country_name, isp, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                [(ip, i["country_code"], i["country_name"], i["isp"], now) for ip, i in infos.items()],
+            )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+def resolve_batch(cache: GeoCache, ips: List[str], fetch_batch: BatchFetcher) -> Dict[str, Dict]:
+    """Fetches geo info for uncached IPs in chunks of BATCH_SIZE and caches the answers."""
+    results: Dict[str, Dict] = {}
+    for start in range(0, len(ips), BATCH_SIZE):
+        chunk = ips[start:start + BATCH_SIZE]
+        try:
+            records = fetch_batch(chunk)
+        except Exception as e:
+            logging.warning(f"Geo batch lookup for {len(chunk)} IPs failed: {e}")
+            continue  # Not cached, so the next run retries them
+        fetched, cacheable = parse_geo_batch(chunk, records)
+        cache.put_many(cacheable)
+        results.update(fetched)
+    return results
+
+class GeoLookup:
+    """
+    Thread-safe geo lookups that coalesce cache misses into batch requests.
+
+    Concurrent lookups for the same IP share one in-flight future. Misses are
+    queued; the queue is flushed as soon as it holds BATCH_SIZE IPs, or by the
+    first waiter whose BATCH_WINDOW_SECONDS runs out.
+    """
+
+    def __init__(self, cache: GeoCache, fetch_batch: BatchFetcher, batch_window: float = BATCH_WINDOW_SECONDS):
+        self.cache = cache
+        self.fetch_batch = fetch_batch
+        self.batch_window = batch_window
+        self.requests_made = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+        self._queued: List[str] = []
+
+    def _take_batch(self) -> List[str]:
+        batch, self._queued = self._queued[:BATCH_SIZE], self._queued[BATCH_SIZE:]
+        return batch
+
+    def _flush(self, batch: List[str]):
+        self.requests_made += 1
+        results: Dict[str, Dict] = {}
+        try:
+            results = resolve_batch(self.cache, batch, self.fetch_batch)
+        finally:
+            # Always release the waiters, even if the cache write failed
+            with self._lock:
+                futures = [(ip, self._inflight.pop(ip)) for ip in batch]
+            for ip, future in futures:
+                future.set_result(results.get(ip, dict(UNKNOWN_GEO_INFO)))
+
+    def lookup(self, ip: str) -> Dict:
+        """Gets geographic information for an IP address, blocking until it is known."""
+        cached = self.cache.get(ip)
+        if cached is not None:
+            return cached
+        batch: List[str] = []
+        with self._lock:
+            future = self._inflight.get(ip)
+            if future is None:
+                future = concurrent.futures.Future()
+                self._inflight[ip] = future
+                self._queued.append(ip)
+                if len(self._queued) >= BATCH_SIZE:
+                    batch = self._take_batch()
+        if batch:
+            self._flush(batch)
+        try:
+            return future.result(timeout=self.batch_window)
+        except concurrent.futures.TimeoutError:
+            pass
+        with self._lock:
+            batch = self._take_batch() if ip in self._queued else []
+        if batch:
+            self._flush(batch)
+        return future.result()
+
+class AsyncGeoLookup:
+    """The asyncio counterpart of GeoLookup, sharing the same GeoCache."""
+
+    def __init__(self, cache: GeoCache, fetch_batch: AsyncBatchFetcher, batch_window: float = BATCH_WINDOW_SECONDS):
+        self.cache = cache
+        self.fetch_batch = fetch_batch
+        self.batch_window = batch_window
+        self.requests_made = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._queued: List[str] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: Set[asyncio.Task] = set()  # The loop only keeps weak references to tasks
+
+    def _schedule_flush(self):
+        batch, self._queued = self._queued[:BATCH_SIZE], self._queued[BATCH_SIZE:]
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._queued:
+            self._timer = asyncio.get_running_loop().call_later(self.batch_window, self._schedule_flush)
+        if batch:
+            task = asyncio.ensure_future(self._flush(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: List[str]):
+        results: Dict[str, Dict] = {}
+        try:
+            self.requests_made += 1
+            records = await self.fetch_batch(batch)
+            results, cacheable = parse_geo_batch(batch, records)
+            self.cache.put_many(cacheable)
+        except Exception as e:
+            logging.warning(f"Geo batch lookup for {len(batch)} IPs failed: {e}")
+        for ip in batch:
+            self._inflight.pop(ip).set_result(results.get(ip, dict(UNKNOWN_GEO_INFO)))
+
+    async def lookup(self, ip: str) -> Dict:
+        """Gets geographic information for an IP address."""
+        cached = self.cache.get(ip)
+        if cached is not None:
+            return cached
+        future = self._inflight.get(ip)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[ip] = future
+            self._queued.append(ip)
+            if len(self._queued) >= BATCH_SIZE:
+                self._schedule_flush()
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.batch_window, self._schedule_flush)
+        return await asyncio.shield(future)
@@ -0,0 +1,186 @@
+# geoip_offline.py
+# Offline IP -> country/ASN lookups from a local range dataset, as a sorted array-backed interval index.
+# ===== IMPORTS & DEPENDENCIES =====
+import csv
+import json
+import logging
+import mmap
+import socket
+import struct
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import maxminddb
+except ImportError:  # Only needed for .mmdb datasets
+    maxminddb = None
+
+# ===== CONFIGURATION & CONSTANTS =====
+# Compiled index layout (native byte order, written and read on the same runner):
+#   header:  MAGIC, then uint32 range count and uint32 byte length of the JSON label table
+#   starts:  uint32[count]  first IPv4 address of each range, ascending
+#   ends:    uint32[count]  last IPv4 address of each range
+#   labels:  uint32[count]  index into the label table
+#   table:   JSON list of {"country_code", "country_name", "isp"} dicts
+MAGIC = b"V2GEOIX1"
+HEADER = struct.Struct("<8sII")
+IPV4 = struct.Struct("!I")
+# CSV columns; ISP may hold an ASN organisation name or "AS1234 Name"
+CSV_FIELDS = ("start_ip", "end_ip", "country_code", "country_name", "isp")
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+def ipv4_to_int(ip: str) -> int:
+    """
+    Converts a dotted-quad IPv4 address to an int; much cheaper than ipaddress.IPv4Address.
+
+    Raises:
+        ValueError: If `ip` is not an IPv4 address.
+    """
+    try:
+        return IPV4.unpack(socket.inet_pton(socket.AF_INET, ip))[0]
+    except OSError:
+        raise ValueError(f"not an IPv4 address: {ip!r}") from None
+
+def read_csv_ranges(file_path: Path) -> Iterable[Tuple[str, str, Dict]]:
+    """
+    Reads an IP-range CSV with columns start_ip,end_ip,country_code[,country_name[,isp]].
+
+    A header row is optional. Rows that don't parse are skipped.
+    """
+    with open(file_path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 3 or row[0].startswith("#") or row[0] == "start_ip":
+                continue
+            padded = row + [""] * (len(CSV_FIELDS) - len(row))
+            yield padded[0].strip(), padded[1].strip(), {
+                "country_code": padded[2].strip().upper() or "N/A",
+                "country_name": padded[3].strip() or "Unknown",
+                "isp": padded[4].strip() or "Unknown ISP",
+            }
+
+def compile_index(ranges: Iterable[Tuple[str, str, Dict]], output_path: Path) -> int:
+    """
+    Compiles IP ranges into the binary index format loaded by OfflineGeoIndex.
+
+    Only IPv4 ranges are compiled; the ranges the collector probes are IPv4
+    (see get_server_ip). Returns the number of ranges written.
+    """
+    rows: List[Tuple[int, int, int]] = []
+    label_ids: Dict[Tuple[str, str, str], int] = {}
+    labels: List[Dict] = []
+    for start_ip, end_ip, info in ranges:
+        try:
+            start, end = ipv4_to_int(start_ip), ipv4_to_int(end_ip)
+        except ValueError:
+            continue
+        key = (info["country_code"], info["country_name"], info["isp"])
+        if key not in label_ids:
+            label_ids[key] = len(labels)
+            labels.append(dict(info))
+        rows.append((start, end, label_ids[key]))
+    rows.sort()
+
+    table = json.dumps(labels, ensure_ascii=False).encode("utf-8")
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(rows), len(table)))
+        for column in range(3):
+            array("I", (row[column] for row in rows)).tofile(f)
+        f.write(table)
+    logging.info(f"Compiled {len(rows)} IP ranges ({len(labels)} distinct labels) into {output_path}")
+    return len(rows)
+
+class OfflineGeoIndex:
+    """
+    A read-only IPv4 range index over a compiled file.
+
+    The file is memory-mapped and its columns are viewed as uint32 arrays in
+    place, so opening it costs a few page faults rather than a parse. Each lookup
+    is one bisect over the range starts.
+    """
+
+    def __init__(self, file_path: Path):
+        self.file_path = file_path
+        self._file = open(file_path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, table_len = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{file_path} is not a compiled geo index")
+        column_bytes = array("I").itemsize * count
+        self._view = memoryview(self._mmap)
+        offset = HEADER.size
+        self._starts = self._view[offset:offset + column_bytes].cast("I")
+        self._ends = self._view[offset + column_bytes:offset + 2 * column_bytes].cast("I")
+        self._labels = self._view[offset + 2 * column_bytes:offset + 3 * column_bytes].cast("I")
+        table_offset = offset + 3 * column_bytes
+        self._table: List[Dict] = json.loads(bytes(self._mmap[table_offset:table_offset + table_len]))
+        self.count = count
+
+    def lookup(self, ip: str) -> Optional[Dict]:
+        """Returns the geo info for an IPv4 address, or None if no range covers it."""
+        try:
+            value = ipv4_to_int(ip)
+        except ValueError:
+            return None
+        position = bisect_right(self._starts, value) - 1
+        if position < 0 or value > self._ends[position]:
+            return None
+        return dict(self._table[self._labels[position]])
+
+    def close(self):
+        for view in (self._starts, self._ends, self._labels, self._view):
+            view.release()
+        self._mmap.close()
+        self._file.close()
+
+class MaxMindGeoIndex:
+    """Lookups against a MaxMind/DB-IP .mmdb file via the optional maxminddb package."""
+
+    def __init__(self, file_path: Path):
+        if maxminddb is None:
+            raise ImportError("Reading .mmdb files requires the 'maxminddb' package")
+        self.file_path = file_path
+        self._reader = maxminddb.open_database(str(file_path), maxminddb.MODE_MMAP)
+
+    def lookup(self, ip: str) -> Optional[Dict]:
+        try:
+            record = self._reader.get(ip)
+        except ValueError:
+            return None
+        if not record:
+            return None
+        country = record.get("country") or record.get("registered_country") or {}
+        country_code = country.get("iso_code") or record.get("country_code")
+        if not country_code:
+            return None
+        names = country.get("names") or {}
+        return {
+            "country_code": country_code.upper(),
+            "country_name": names.get("en") or record.get("country_name") or "Unknown",
+            "isp": record.get("autonomous_system_organization") or record.get("isp") or "Unknown ISP",
+        }
+
+    def close(self):
+        self._reader.close()
+
+def open_geo_database(file_path: Path):
+    """
+    Opens an offline geo dataset by extension.
+
+    .mmdb files are read with maxminddb. .csv files are compiled once into a
+    sibling .idx file, which is rebuilt only when the CSV is newer. Anything else
+    is treated as a compiled index.
+    """
+    if file_path.suffix == ".mmdb":
+        return MaxMindGeoIndex(file_path)
+    if file_path.suffix == ".csv":
+        index_path = file_path.with_suffix(".idx")
+        if not index_path.exists() or index_path.stat().st_mtime < file_path.stat().st_mtime:
+            compile_index(read_csv_ranges(file_path), index_path)
+        file_path = index_path
+    index = OfflineGeoIndex(file_path)
+    logging.info(f"Loaded offline geo index with {index.count} ranges from {file_path}")
+    return index
@@ -0,0 +1,183 @@
+# health_store.py
+# Cross-run config health history and the backoff scheduler that decides what to re-check.
+# ===== IMPORTS & DEPENDENCIES =====
+import json
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# ===== CONFIGURATION & CONSTANTS =====
+LATENCY_WINDOW = 8  # Successful latencies remembered per config
+HEALTHY_RECHECK_SECONDS = 3 * 3600  # Healthy configs are re-probed this often
+FAILURE_BACKOFF_SECONDS = 3600  # First re-check delay after a failure; doubles per consecutive failure
+MAX_BACKOFF_SECONDS = 7 * 24 * 3600
+FORGET_AFTER_SECONDS = 30 * 24 * 3600  # Entries not scraped for this long are dropped
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+class HealthRecord:
+    """Validation history for one server (config fingerprint)."""
+
+    __slots__ = ("last_seen", "last_checked", "last_success", "failures", "latencies", "result")
+
+    def __init__(self, last_seen: float = 0.0, last_checked: float = 0.0, last_success: float = 0.0,
+                 failures: int = 0, latencies: Optional[List[int]] = None, result: Optional[Dict] = None):
+        self.last_seen = last_seen
+        self.last_checked = last_checked
+        self.last_success = last_success
+        self.failures = failures  # Consecutive failed checks; 0 after any success
+        self.latencies = latencies if latencies is not None else []
+        self.result = result  # The last successful validated record, carried forward while skipped
+
+class HealthStore:
+    """
+    Per-fingerprint health history backed by SQLite.
+
+    All rows are loaded into memory when the store is opened, updates stay in
+    memory and save() writes the changed rows in one transaction. Not thread-safe:
+    both engines only touch it from their coordinating thread (the as_completed
+    loop or the event loop), like ConfigIndex.
+    """
+
+    def __init__(self, file_path: Path):
+        self.file_path = file_path
+        self._records: Dict[str, HealthRecord] = {}
+        self._dirty: set = set()
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(file_path))
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS health ("
+            "fingerprint TEXT PRIMARY KEY, last_seen REAL, last_checked REAL, last_success REAL, "
+            "failures INTEGER, latencies TEXT, result TEXT)"
+        )
+        self._load()
+
+    def _load(self):
+        cutoff = time.time() - FORGET_AFTER_SECONDS
+        self._db.execute("DELETE FROM health WHERE last_seen < ?", (cutoff,))
+        self._db.commit()
+        rows = self._db.execute(
+            "SELECT fingerprint, last_seen, last_checked, last_success, failures, latencies, result FROM health"
+        )
+        for fingerprint, last_seen, last_checked, last_success, failures, latencies, result in rows:
+            self._records[fingerprint] = HealthRecord(
+                last_seen, last_checked, last_success, failures,
+                json.loads(latencies) if latencies else [], json.loads(result) if result else None,
+            )
+        logging.info(f"Loaded health history for {len(self._records)} servers from {self.file_path}")
+
+    def get(self, fingerprint: str) -> Optional[HealthRecord]:
+        return self._records.get(fingerprint)
+
+    def mark_seen(self, fingerprint: str, now: Optional[float] = None) -> HealthRecord:
+        """Notes that a server was scraped this run, creating its record if new."""
+        record = self._records.get(fingerprint)
+        if record is None:
+            record = self._records[fingerprint] = HealthRecord()
+        record.last_seen = now or time.time()
+        self._dirty.add(fingerprint)
+        return record
+
+    def record_success(self, fingerprint: str, latency: int, result: Dict, now: Optional[float] = None):
+        now = now or time.time()
+        record = self.mark_seen(fingerprint, now)
+        record.last_checked = record.last_success = now
+        record.failures = 0
+        record.latencies = (record.latencies + [latency])[-LATENCY_WINDOW:]
+        record.result = result
+
+    def record_failure(self, fingerprint: str, now: Optional[float] = None):
+        now = now or time.time()
+        record = self.mark_seen(fingerprint, now)
+        record.last_checked = now
+        record.failures += 1
+        record.result = None
+
+    def save(self):
+        """Writes the records changed during this run."""
+        if not self._dirty:
+            return
+        rows = []
+        for fingerprint in self._dirty:
+            r = self._records[fingerprint]
+            rows.append((
+                fingerprint, r.last_seen, r.last_checked, r.last_success, r.failures,
+                json.dumps(r.latencies), json.dumps(r.result, ensure_ascii=False) if r.result else None,
+            ))
+        self._db.executemany(
+            "INSERT OR REPLACE INTO health (fingerprint, last_seen, last_checked, last_success, failures, "
+            "latencies, result) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        self._db.commit()
+        logging.info(f"Saved health history for {len(rows)} servers to {self.file_path}")
+        self._dirty.clear()
+
+    def close(self):
+        self._db.close()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+class HealthScheduler:
+    """
+    Decides which scraped servers need a validation cycle this run.
+
+    Unknown servers are always checked. After a failure, the next check waits
+    `failure_backoff` seconds, doubling per consecutive failure up to
+    `max_backoff`. Healthy servers are re-checked every `healthy_recheck`
+    seconds and otherwise carry their last result forward.
+    """
+
+    def __init__(
+        self,
+        store: HealthStore,
+        healthy_recheck: float = HEALTHY_RECHECK_SECONDS,
+        failure_backoff: float = FAILURE_BACKOFF_SECONDS,
+        max_backoff: float = MAX_BACKOFF_SECONDS,
+    ):
+        self.store = store
+        self.healthy_recheck = healthy_recheck
+        self.failure_backoff = failure_backoff
+        self.max_backoff = max_backoff
+        self.checked = 0
+        self.skipped_healthy: List[Dict] = []
+        self.skipped_dead = 0
+
+    def next_check_delay(self, record: HealthRecord) -> float:
+        """Seconds after record.last_checked when the server is due again."""
+        if record.failures:
+            return min(self.failure_backoff * 2 ** (record.failures - 1), self.max_backoff)
+        return self.healthy_recheck
+
+    def is_due(self, fingerprint: str, now: Optional[float] = None) -> bool:
+        """
+        Records that the server was seen and returns whether it should be validated now.
+
+        A healthy server that is not due has its stored result queued in
+        `skipped_healthy`, so it stays published.
+        """
+        now = now or time.time()
+        record = self.store.get(fingerprint)
+        due = (
+            record is None
+            or not record.last_checked
+            or (not record.failures and record.result is None)
+            or now - record.last_checked >= self.next_check_delay(record)
+        )
+        record = self.store.mark_seen(fingerprint, now)
+        if due:
+            self.checked += 1
+        elif record.failures:
+            self.skipped_dead += 1
+        else:
+            self.skipped_healthy.append(record.result)
+        return due
+
+    def log_summary(self):
+        logging.info(
+            f"Health scheduler: {self.checked} servers due for validation, {len(self.skipped_healthy)} healthy "
+            f"and {self.skipped_dead} failing servers skipped until their next check."
+        )
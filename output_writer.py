@@ -0,0 +1,129 @@
+# output_writer.py
+# Change-aware, atomic writer for the published output files, with a manifest of what changed.
+# ===== IMPORTS & DEPENDENCIES =====
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+# ===== CONFIGURATION & CONSTANTS =====
+MANIFEST_NAME = "manifest.json"
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+def content_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def write_atomic(file_path: Path, data: bytes):
+    """Writes a file via a temp file in the same directory and os.replace, so readers never see half a file."""
+    write_atomic_chunks(file_path, (data,))
+
+def write_atomic_chunks(file_path: Path, chunks: Iterable[bytes]):
+    """Like write_atomic, for content produced piece by piece (never held whole in memory)."""
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=file_path.parent, prefix=f".{file_path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.writelines(chunks)
+        os.replace(tmp_name, file_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+class OutputWriter:
+    """
+    Writes a run's output files under `root`, touching only the ones whose content changed.
+
+    Each file's hash is compared with the previous run's manifest (falling back to
+    the file on disk), unchanged files are skipped, and changed ones are replaced
+    atomically. finish() removes files the previous manifest listed but this run
+    did not produce, then writes the new manifest. The manifest holds no
+    timestamps, so a run that changes nothing leaves the tree untouched.
+    """
+
+    def __init__(self, root: Path, manifest_name: str = MANIFEST_NAME):
+        self.root = root
+        self.manifest_path = root / manifest_name
+        self._previous: Dict[str, Dict] = self._load_manifest()
+        self._files: Dict[str, Dict] = {}
+        self.changed: List[str] = []
+        self.unchanged: List[str] = []
+        self.bytes_written = 0
+
+    def _load_manifest(self) -> Dict[str, Dict]:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("files", {})
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def _is_unchanged(self, relative: str, data: bytes, digest: str) -> bool:
+        file_path = self.root / relative
+        try:
+            size = file_path.stat().st_size
+        except OSError:
+            return False
+        if size != len(data):
+            return False
+        previous = self._previous.get(relative)
+        if previous and previous.get("hash") == digest:
+            return True
+        # Not in the manifest (first run, or written by an older version): compare with the file itself
+        return file_path.read_bytes() == data
+
+    def write(self, relative: str, data: bytes) -> bool:
+        """
+        Writes root/relative if its content changed.
+
+        Returns:
+            True if the file was written.
+        """
+        digest = content_hash(data)
+        self._files[relative] = {"hash": digest, "bytes": len(data)}
+        if self._is_unchanged(relative, data, digest):
+            self.unchanged.append(relative)
+            return False
+        write_atomic(self.root / relative, data)
+        self.changed.append(relative)
+        self.bytes_written += len(data)
+        return True
+
+    def write_text(self, relative: str, text: str) -> bool:
+        return self.write(relative, text.encode("utf-8"))
+
+    def finish(self, remove_stale: bool = True) -> Dict:
+        """
+        Removes stale files (if `remove_stale`), writes the manifest and logs a summary.
+
+        Returns:
+            The manifest: per-file hash and size, plus the changed and removed paths.
+        """
+        removed: List[str] = []
+        if remove_stale:
+            for relative in sorted(set(self._previous) - set(self._files)):
+                try:
+                    (self.root / relative).unlink()
+                    removed.append(relative)
+                except FileNotFoundError:
+                    pass
+        else:
+            # Keep tracking files that were left in place
+            for relative, entry in self._previous.items():
+                self._files.setdefault(relative, entry)
+        manifest = {
+            "files": dict(sorted(self._files.items())),
+            "changed": sorted(self.changed),
+            "removed": removed,
+        }
+        self.write_text(self.manifest_path.name, json.dumps(manifest, indent=1, sort_keys=True) + "\n")
+        logging.info(
+            f"Output: {len(self.changed)} files written ({self.bytes_written / 1024:.0f} KiB), "
+            f"{len(self.unchanged)} unchanged, {len(removed)} removed. See {self.manifest_path}."
+        )
+        return manifest
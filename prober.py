@@ -0,0 +1,174 @@
+# prober.py
+# Concurrent TCP connect / TLS handshake latency prober for config endpoints.
+# ===== IMPORTS & DEPENDENCIES =====
+import asyncio
+import ssl
+import statistics
+import threading
+import time
+from typing import List, Optional, TypedDict
+
+from config_model import ProxyConfig
+
+# ===== CONFIGURATION & CONSTANTS =====
+DEFAULT_SAMPLES = 3
+DEFAULT_TIMEOUT_SECONDS = 3.0
+SAMPLE_INTERVAL_SECONDS = 0.05  # Pause between samples so they don't share a burst of congestion
+# Hysteria runs over QUIC/UDP, so a TCP or TLS-over-TCP probe says nothing about it
+UDP_PROTOCOLS = {"hysteria", "hysteria2", "hy2"}
+
+# ===== TYPE DEFINITIONS =====
+class ProbeTarget(TypedDict):
+    host: str
+    port: int
+    tls: bool
+    sni: str
+
+class ProbeResult(TypedDict):
+    ok: bool
+    latency_ms: int  # Median of connect (+ handshake) time over successful samples
+    p90_ms: int
+    jitter_ms: int  # Mean absolute difference between consecutive samples
+    connect_ms: int  # Median TCP connect time
+    tls_ms: int  # Median TLS handshake time, 0 without TLS
+    samples: int
+    failures: int
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+def endpoint_from_config(config: ProxyConfig) -> Optional[ProbeTarget]:
+    """
+    Works out where and how to probe a config: host, port, and whether to do a TLS
+    handshake (security=tls/reality, vmess tls, trojan by default) with which SNI.
+
+    Returns None for UDP-only protocols.
+    """
+    if config.protocol in UDP_PROTOCOLS:
+        return None
+    sni = config.sni or config.params.get("host") or config.host
+    return {
+        "host": config.host,
+        "port": config.port,
+        "tls": config.security in ("tls", "reality"),
+        "sni": sni.split(",")[0],
+    }
+
+def _tls_context() -> ssl.SSLContext:
+    # Proxies routinely use self-signed certs or borrowed SNIs; only timing matters here
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+TLS_CONTEXT = _tls_context()
+
+async def probe_once(address: str, target: ProbeTarget, timeout: float) -> Optional[tuple]:
+    """
+    Measures one TCP connect and, for TLS targets, one handshake.
+
+    Returns:
+        (connect_ms, tls_ms), or None if the probe failed or timed out.
+    """
+    loop = asyncio.get_running_loop()
+    transport = None
+    try:
+        started = time.perf_counter()
+        transport, protocol = await asyncio.wait_for(
+            loop.create_connection(asyncio.Protocol, address, target["port"]), timeout
+        )
+        connected = time.perf_counter()
+        connect_ms = (connected - started) * 1000
+        if not target["tls"]:
+            return connect_ms, 0.0
+        remaining = max(timeout - (connected - started), 0.001)
+        transport = await asyncio.wait_for(
+            loop.start_tls(transport, protocol, TLS_CONTEXT, server_hostname=target["sni"] or None), remaining
+        )
+        return connect_ms, (time.perf_counter() - connected) * 1000
+    except (OSError, asyncio.TimeoutError, ssl.SSLError, ValueError):
+        return None
+    finally:
+        if transport is not None:
+            transport.abort()
+
+def summarize_samples(samples: List[tuple], failures: int) -> ProbeResult:
+    """Reduces per-sample (connect_ms, tls_ms) timings to median, p90 and jitter."""
+    if not samples:
+        return {"ok": False, "latency_ms": 0, "p90_ms": 0, "jitter_ms": 0,
+                "connect_ms": 0, "tls_ms": 0, "samples": 0, "failures": failures}
+    totals = [connect + handshake for connect, handshake in samples]
+    ordered = sorted(totals)
+    p90 = ordered[min(len(ordered) - 1, int(round(0.9 * (len(ordered) - 1))))]
+    jitter = statistics.mean(abs(b - a) for a, b in zip(totals, totals[1:])) if len(totals) > 1 else 0.0
+    return {
+        "ok": True,
+        "latency_ms": round(statistics.median(totals)),
+        "p90_ms": round(p90),
+        "jitter_ms": round(jitter),
+        "connect_ms": round(statistics.median(s[0] for s in samples)),
+        "tls_ms": round(statistics.median(s[1] for s in samples)),
+        "samples": len(samples),
+        "failures": failures,
+    }
+
+async def probe_target(
+    address: str,
+    target: ProbeTarget,
+    samples: int = DEFAULT_SAMPLES,
+    timeout: float = DEFAULT_TIMEOUT_SECONDS,
+) -> ProbeResult:
+    """
+    Probes an endpoint `samples` times, one after another.
+
+    Args:
+        address: The resolved IP to connect to.
+        target: Port, TLS flag and SNI (see endpoint_from_config).
+        samples: Number of sequential measurements.
+        timeout: Per-sample budget for connect plus handshake, in seconds.
+    """
+    timings: List[tuple] = []
+    failures = 0
+    for i in range(samples):
+        if i:
+            await asyncio.sleep(SAMPLE_INTERVAL_SECONDS)
+        timing = await probe_once(address, target, timeout)
+        if timing is None:
+            failures += 1
+            if not timings:
+                break  # A dead endpoint isn't worth more timeouts
+        else:
+            timings.append(timing)
+    return summarize_samples(timings, failures)
+
+class ProbeRunner:
+    """
+    Runs probes on a dedicated event loop thread for the threaded engine.
+
+    Validator threads submit probes and block on the result, while the loop keeps
+    up to `concurrency` probes in flight.
+    """
+
+    def __init__(self, concurrency: int = 1000, samples: int = DEFAULT_SAMPLES, timeout: float = DEFAULT_TIMEOUT_SECONDS):
+        self.samples = samples
+        self.timeout = timeout
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="Prober", daemon=True)
+        self._thread.start()
+        self._semaphore = asyncio.run_coroutine_threadsafe(self._make_semaphore(concurrency), self._loop).result()
+
+    @staticmethod
+    async def _make_semaphore(concurrency: int) -> asyncio.Semaphore:
+        return asyncio.Semaphore(concurrency)
+
+    async def _probe(self, address: str, target: ProbeTarget) -> ProbeResult:
+        async with self._semaphore:
+            return await probe_target(address, target, self.samples, self.timeout)
+
+    def probe(self, address: str, target: ProbeTarget) -> ProbeResult:
+        """Probes an endpoint, blocking the calling thread until the samples are in."""
+        return asyncio.run_coroutine_threadsafe(self._probe(address, target), self._loop).result()
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
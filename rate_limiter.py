@@ -0,0 +1,226 @@
+# rate_limiter.py
+# Per-host token buckets and AIMD concurrency control shared by the threaded and async HTTP paths.
+# ===== IMPORTS & DEPENDENCIES =====
+import asyncio
+import email.utils
+import logging
+import threading
+import time
+from typing import Dict, Mapping, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+# ===== CONFIGURATION & CONSTANTS =====
+THROTTLE_STATUS_CODES = {429, 500, 502, 503, 504}  # Responses that mean "back off"
+CONCURRENCY_POLL_SECONDS = 0.05  # How often a request waiting for a free slot checks again
+DECREASE_COOLDOWN_SECONDS = 1.0  # A burst of throttled responses halves the limit only once
+MAX_RETRY_AFTER_SECONDS = 300.0
+
+class HostPolicy(NamedTuple):
+    """Request budget for one upstream: sustained rate (None = unlimited), bucket size and concurrency ceiling."""
+    rate: Optional[float]
+    burst: int = 1
+    max_concurrency: int = 32
+    initial_concurrency: int = 4
+
+DEFAULT_POLICY = HostPolicy(rate=None)
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Converts a Retry-After header (seconds or an HTTP date) into a delay in seconds."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return min(float(value), MAX_RETRY_AFTER_SECONDS)
+    try:
+        when = email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return min(max(when - (now or time.time()), 0.0), MAX_RETRY_AFTER_SECONDS)
+
+def throttle_delay(headers: Mapping[str, str]) -> Optional[float]:
+    """
+    Returns how long the server asked us to wait, if it did.
+
+    Honours Retry-After, and ip-api.com's X-Rl (requests left) / X-Ttl (seconds
+    until the window resets) pair.
+    """
+    delay = parse_retry_after(headers.get("Retry-After"))
+    if delay is None and headers.get("X-Rl") == "0" and (headers.get("X-Ttl") or "").isdigit():
+        delay = min(float(headers["X-Ttl"]), MAX_RETRY_AFTER_SECONDS)
+    return delay
+
+class TokenBucket:
+    """A token bucket refilled at `rate` tokens per second up to `burst`. Callers hold the owner's lock."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """Takes a token if one is available; otherwise returns the seconds until one will be."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class AIMDController:
+    """
+    Additive-increase / multiplicative-decrease concurrency limit.
+
+    Each healthy response adds 1/limit, so the limit grows by about one per
+    round of requests; a throttled response halves it, at most once per
+    DECREASE_COOLDOWN_SECONDS.
+    """
+
+    __slots__ = ("limit", "minimum", "maximum", "peak", "_last_decrease")
+
+    def __init__(self, initial: int, maximum: int, minimum: int = 1):
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.peak = self.limit
+        self._last_decrease = 0.0
+
+    def increase(self):
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self.peak = max(self.peak, self.limit)
+
+    def decrease(self, now: float):
+        if now - self._last_decrease >= DECREASE_COOLDOWN_SECONDS:
+            self.limit = max(self.minimum, self.limit / 2)
+            self._last_decrease = now
+
+class HostLimiter:
+    """
+    Admission control for one upstream host.
+
+    A request may start when the host isn't in a Retry-After pause, fewer than
+    the AIMD limit are in flight, and the token bucket has a token. The state is
+    lock-protected, so threads (acquire) and coroutines (acquire_async) can share
+    one limiter; waiting never holds a slot, so other hosts keep flowing.
+    """
+
+    def __init__(self, name: str, policy: HostPolicy):
+        self.name = name
+        self.policy = policy
+        self._lock = threading.Lock()
+        self._bucket = TokenBucket(policy.rate, policy.burst) if policy.rate else None
+        self._aimd = AIMDController(policy.initial_concurrency, policy.max_concurrency)
+        self._in_flight = 0
+        self._paused_until = 0.0
+        # Stats for log_summary()
+        self.requests = 0
+        self.throttled = 0
+        self.waited_seconds = 0.0
+        self._first_start: Optional[float] = None
+        self._last_start = 0.0
+
+    def _try_acquire(self, now: float) -> float:
+        with self._lock:
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self._in_flight >= int(self._aimd.limit):
+                return CONCURRENCY_POLL_SECONDS
+            if self._bucket:
+                wait = self._bucket.take(now)
+                if wait:
+                    return wait
+            self._in_flight += 1
+            self.requests += 1
+            if self._first_start is None:
+                self._first_start = now
+            self._last_start = now
+            return 0.0
+
+    def acquire(self):
+        """Blocks the calling thread until a request to this host may start."""
+        while True:
+            wait = self._try_acquire(time.monotonic())
+            if not wait:
+                return
+            self.waited_seconds += wait
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Waits, without blocking the event loop, until a request to this host may start."""
+        while True:
+            wait = self._try_acquire(time.monotonic())
+            if not wait:
+                return
+            self.waited_seconds += wait
+            await asyncio.sleep(wait)
+
+    def release(self, status: Optional[int], delay: Optional[float] = None):
+        """
+        Ends a request and feeds its outcome to the controller.
+
+        Args:
+            status: The HTTP status, or None if the request failed without a response.
+            delay: Seconds the server asked us to wait (see throttle_delay); pauses the whole host.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._in_flight -= 1
+            if status in THROTTLE_STATUS_CODES:
+                self.throttled += 1
+                self._aimd.decrease(now)
+            elif status is not None:
+                self._aimd.increase()
+            if delay:
+                self._paused_until = max(self._paused_until, now + delay)
+
+    def summary(self) -> str:
+        elapsed = self._last_start - self._first_start if self._first_start is not None else 0.0
+        achieved = self.requests / elapsed * 60 if elapsed > 0 else 0.0
+        allowed = f"{self.policy.rate * 60:.0f}/min" if self.policy.rate else "unlimited"
+        return (
+            f"{self.name}: {self.requests} requests, {achieved:.1f}/min achieved vs {allowed} allowed, "
+            f"{self.throttled} throttled, concurrency {self._aimd.limit:.1f} (peak {self._aimd.peak:.1f}, "
+            f"max {self.policy.max_concurrency}), {self.waited_seconds:.1f}s waited across requests"
+        )
+
+class HostLimiters:
+    """
+    The limiters for every upstream a run talks to, created on first use.
+
+    Policy keys are either a host ("t.me", which also covers subdomains) or a
+    host plus path prefix ("ip-api.com/batch"); the longest matching key wins.
+    """
+
+    def __init__(self, policies: Optional[Dict[str, HostPolicy]] = None, default: HostPolicy = DEFAULT_POLICY):
+        # Longest keys first, so "ip-api.com/batch" is tried before "ip-api.com"
+        self.policies = dict(sorted((policies or {}).items(), key=lambda item: -len(item[0])))
+        self.default = default
+        self._lock = threading.Lock()
+        self._limiters: Dict[str, HostLimiter] = {}
+
+    def _policy_key(self, host: str, path: str) -> str:
+        for key in self.policies:
+            if "/" in key:
+                if f"{host}{path}".startswith(key):
+                    return key
+            elif host == key or host.endswith("." + key):
+                return key
+        return host
+
+    def for_url(self, url: str) -> HostLimiter:
+        parts = urlsplit(url)
+        key = self._policy_key((parts.hostname or "").lower(), parts.path)
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = self._limiters[key] = HostLimiter(key, self.policies.get(key, self.default))
+            return limiter
+
+    def log_summary(self):
+        for limiter in self._limiters.values():
+            if limiter.requests:
+                logging.info(f"Rate limits: {limiter.summary()}")
@@ -0,0 +1,125 @@
+# raw_corpus.py
+# The raw (unvalidated) config corpus in v2ray_configs/: written by the scrape stage, streamed back by the validate stage.
+# ===== IMPORTS & DEPENDENCIES =====
+import base64
+import binascii
+import codecs
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Set, TextIO, Tuple
+
+from config_extractor import PROTOCOL_PATTERN, split_config_line
+from config_model import parse_config
+from output_writer import write_atomic
+
+# ===== CONFIGURATION & CONSTANTS =====
+RAW_DIR = Path("v2ray_configs")
+# Per-protocol files; hysteria and hy2 share one, as v2ray_collector2.py wrote them
+CORPUS_FILES = {"vmess": "vmess", "vless": "vless", "ss": "ss", "trojan": "trojan", "hysteria": "hysteria", "hy2": "hysteria"}
+SUBSCRIPTION_NAME = "subscription.txt"
+READ_CHUNK_CHARS = 1 << 16
+CORPUS_BATCH_SIZE = 1000  # Configs handed to the validator per batch
+URLSAFE_TO_STANDARD = str.maketrans("-_", "+/")
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+def write_raw_corpus(configs: Iterable[str], out_dir: Path = RAW_DIR):
+    """
+    Writes scraped configs as per-protocol text files plus a base64 subscription.txt of all of them.
+
+    Configs are deduplicated as strings and sorted, so the files only change when
+    the scraped set does. Unparseable configs go to the subscription only.
+    """
+    unique = sorted(set(configs))
+    grouped: Dict[str, List[str]] = {}
+    unparsed = 0
+    for config in unique:
+        record = parse_config(config)
+        if record:
+            grouped.setdefault(CORPUS_FILES[record.protocol], []).append(config)
+        else:
+            unparsed += 1
+    if unparsed:
+        logging.info(f"Left {unparsed} unparseable configs out of the per-protocol files (kept in the subscription).")
+    for name, group in sorted(grouped.items()):
+        write_atomic(out_dir / f"{name}.txt", "\n".join(group).encode("utf-8"))
+        logging.info(f"Saved {len(group)} {name} configs to {out_dir / f'{name}.txt'}")
+    if unique:
+        write_atomic(out_dir / SUBSCRIPTION_NAME, base64.b64encode("\n".join(unique).encode("utf-8")))
+        logging.info(f"Saved a base64 subscription of {len(unique)} configs to {out_dir / SUBSCRIPTION_NAME}")
+
+def _base64_lines(f: TextIO, path: Path) -> Iterator[str]:
+    """Decodes a base64 subscription chunk by chunk, yielding its lines without holding the whole file."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending, partial = "", ""
+    while True:
+        chunk = f.read(READ_CHUNK_CHARS)
+        pending += "".join(chunk.split()).translate(URLSAFE_TO_STANDARD)
+        if chunk:
+            usable = len(pending) - len(pending) % 4
+        else:
+            pending += "=" * (-len(pending) % 4)
+            usable = len(pending)
+        try:
+            data = base64.b64decode(pending[:usable], validate=True)
+        except binascii.Error as e:
+            logging.warning(f"Stopped reading {path}: invalid base64 ({e})")
+            return
+        pending = pending[usable:]
+        *lines, partial = (partial + decoder.decode(data, final=not chunk)).split("\n")
+        yield from lines
+        if not chunk:
+            break
+    yield partial
+
+def iter_file_configs(path: Path) -> Iterator[str]:
+    """
+    Streams the configs in one corpus file: one config per line, or a base64
+    subscription of such lines (told apart by whether the file starts with a link).
+    """
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        is_plain = "://" in f.read(READ_CHUNK_CHARS)
+        f.seek(0)
+        for line in (f if is_plain else _base64_lines(f, path)):
+            for candidate in split_config_line(line.strip()):
+                if PROTOCOL_PATTERN.match(candidate):
+                    yield candidate
+
+def corpus_files(paths: Iterable[Path]) -> List[Path]:
+    """
+    Expands directories to the *.txt files in them, in name order.
+
+    A directory's subscription.txt repeats its per-protocol files (plus configs
+    that don't parse, which validation would drop), so it is only read when
+    there are no per-protocol files next to it.
+    """
+    files: List[Path] = []
+    for path in paths:
+        if not path.is_dir():
+            files.append(path)
+            continue
+        found = sorted(path.glob("*.txt"))
+        if any(file.name != SUBSCRIPTION_NAME for file in found):
+            found = [file for file in found if file.name != SUBSCRIPTION_NAME]
+        files.extend(found)
+    return files
+
+def corpus_batches(paths: Iterable[Path], batch_size: int = CORPUS_BATCH_SIZE) -> Iterator[Tuple[str, Set[str]]]:
+    """
+    Lazily yields (source file, configs) batches from raw corpus files and directories.
+
+    Only one batch is held at a time, so a corpus of any size streams into the
+    validators; the source file stands in for the channel in the index and report.
+    """
+    for path in corpus_files(paths):
+        if not path.is_file():
+            logging.warning(f"Skipping missing corpus file {path}")
+            continue
+        batch: Set[str] = set()
+        for config in iter_file_configs(path):
+            batch.add(config)
+            if len(batch) >= batch_size:
+                yield str(path), batch
+                batch = set()
+        if batch:
+            yield str(path), batch
@@ -0,0 +1,80 @@
+# result_spool.py
+# Disk-backed, latency-ordered store for validated results: sorted runs on disk, read back through a heap merge.
+# ===== IMPORTS & DEPENDENCIES =====
+import heapq
+import json
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# ===== CONFIGURATION & CONSTANTS =====
+SPOOL_RUN_SIZE = 20_000  # Results buffered in memory before they are sorted and written out as one run
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+def result_order(result: Dict) -> Tuple[int, str]:
+    """The published order: fastest first, ties broken by config so it is stable between runs."""
+    return result["latency"], result["config"]
+
+class ResultSpool:
+    """
+    Collects validated results without holding them all in memory.
+
+    Results are buffered up to `run_size`, then sorted by result_order and
+    written to a temporary JSON-lines run file. Iterating merges the runs and
+    the buffer with heapq.merge, reading one line per run at a time, so sorting
+    any number of results needs memory for one buffer plus one result per run.
+    It has the append/extend/len the engines use on a plain results list.
+    """
+
+    def __init__(self, directory: Optional[Path] = None, run_size: int = SPOOL_RUN_SIZE):
+        self._dir = tempfile.TemporaryDirectory(prefix="result-spool-", dir=directory)
+        self.run_size = run_size
+        self._buffer: List[Dict] = []
+        self._runs: List[Path] = []
+        self._count = 0
+
+    def append(self, result: Dict):
+        self._buffer.append(result)
+        self._count += 1
+        if len(self._buffer) >= self.run_size:
+            self._spill()
+
+    def extend(self, results: Iterable[Dict]):
+        for result in results:
+            self.append(result)
+
+    def _spill(self):
+        self._buffer.sort(key=result_order)
+        path = Path(self._dir.name) / f"run-{len(self._runs):05d}.jsonl"
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(result, ensure_ascii=False, sort_keys=True) + "\n" for result in self._buffer)
+        self._runs.append(path)
+        self._buffer = []
+
+    @staticmethod
+    def _read_run(path: Path) -> Iterator[Dict]:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def __iter__(self) -> Iterator[Dict]:
+        """Yields every result in result_order."""
+        self._buffer.sort(key=result_order)
+        if self._runs:
+            logging.info(f"Merging {self._count} spooled results from {len(self._runs)} sorted runs.")
+        return heapq.merge(*(self._read_run(path) for path in self._runs), iter(list(self._buffer)), key=result_order)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self):
+        """Deletes the run files."""
+        self._dir.cleanup()
+
+    def __enter__(self) -> "ResultSpool":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
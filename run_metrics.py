@@ -0,0 +1,277 @@
+# run_metrics.py
+# Per-stage, per-channel and per-upstream run instrumentation, exported as a JSON report and a Prometheus textfile.
+# ===== IMPORTS & DEPENDENCIES =====
+import contextlib
+import json
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from output_writer import write_atomic
+
+# ===== CONFIGURATION & CONSTANTS =====
+METRIC_PREFIX = "v2ray_collector"
+# Upper bounds (ms) of the probe latency histogram buckets; +Inf is implied
+PROBE_BUCKETS_MS = (25, 50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000)
+THROTTLED_STATUS = 429
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+class NullMetrics:
+    """
+    The recorder used when instrumentation is off: every call is a no-op.
+
+    Call sites go through the module-level `metrics`, so with instrumentation
+    disabled each hook costs one attribute lookup and an empty call.
+    """
+
+    enabled = False
+    _null_context = contextlib.nullcontext()
+
+    def stage(self, name: str):
+        return self._null_context
+
+    def timed(self, operation: str):
+        return self._null_context
+
+    def queue_depth(self, queue: str, depth: int):
+        pass
+
+    def channel_fetch(self, channel: str, status: Optional[int], size: int, seconds: float):
+        pass
+
+    def channel_configs(self, channel: str, configs: int, new_servers: int):
+        pass
+
+    def channel_rejections(self, channel: str, reasons: Dict[str, int]):
+        pass
+
+    def upstream(self, host: str, status: Optional[int], retry: bool):
+        pass
+
+    def probe(self, latency_ms: Optional[int]):
+        pass
+
+class _Stage:
+    """Context manager adding its wall and process CPU time to a stage."""
+
+    __slots__ = ("metrics", "name", "wall", "cpu")
+
+    def __init__(self, metrics: "RunMetrics", name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.wall, self.cpu = time.perf_counter(), time.process_time()
+
+    def __exit__(self, *exc_info):
+        wall, cpu = time.perf_counter() - self.wall, time.process_time() - self.cpu
+        with self.metrics._lock:
+            stage = self.metrics.stages.setdefault(self.name, {"wall_seconds": 0.0, "cpu_seconds": 0.0, "runs": 0})
+            stage["wall_seconds"] += wall
+            stage["cpu_seconds"] += cpu
+            stage["runs"] += 1
+
+class _Timed:
+    """Context manager counting one call of an operation and its duration."""
+
+    __slots__ = ("metrics", "operation", "started")
+
+    def __init__(self, metrics: "RunMetrics", operation: str):
+        self.metrics = metrics
+        self.operation = operation
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        with self.metrics._lock:
+            entry = self.metrics.operations.setdefault(self.operation, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+            entry["calls"] += 1
+            entry["seconds"] += elapsed
+            entry["max_seconds"] = max(entry["max_seconds"], elapsed)
+
+class RunMetrics(NullMetrics):
+    """
+    Collects one run's measurements. Thread-safe, so both engines can share it.
+
+    stages: wall and CPU time of the run's phases (scrape, validate, xray_test, save).
+    operations: calls and time spent per operation (dns, geo, probe), which
+        overlap with each other inside the validate stage.
+    queues: max and mean sampled depth of the validation backlog.
+    channels: per channel page fetches, latency, bytes, last HTTP status, configs yielded
+        and configs rejected before validation, by reason.
+    upstreams: per rate-limiter host, requests by status, retries and 429s.
+    probes: histogram of successful probe latencies, plus failures.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.stages: Dict[str, Dict] = {}
+        self.operations: Dict[str, Dict] = {}
+        self.queues: Dict[str, Dict] = {}
+        self.channels: Dict[str, Dict] = {}
+        self.upstreams: Dict[str, Dict] = {}
+        self.probe_buckets: List[int] = [0] * (len(PROBE_BUCKETS_MS) + 1)
+        self.probe_sum_ms = 0
+        self.probe_failures = 0
+
+    def stage(self, name: str) -> _Stage:
+        return _Stage(self, name)
+
+    def timed(self, operation: str) -> _Timed:
+        return _Timed(self, operation)
+
+    def queue_depth(self, queue: str, depth: int):
+        with self._lock:
+            entry = self.queues.setdefault(queue, {"max": 0, "samples": 0, "total": 0})
+            entry["max"] = max(entry["max"], depth)
+            entry["samples"] += 1
+            entry["total"] += depth
+
+    def _channel(self, channel: str) -> Dict:
+        return self.channels.setdefault(
+            channel, {"pages": 0, "fetch_seconds": 0.0, "bytes": 0, "status": None, "configs": 0, "new_servers": 0,
+                      "rejected": {}}
+        )
+
+    def channel_fetch(self, channel: str, status: Optional[int], size: int, seconds: float):
+        with self._lock:
+            entry = self._channel(channel)
+            entry["pages"] += 1
+            entry["fetch_seconds"] += seconds
+            entry["bytes"] += size
+            entry["status"] = status
+
+    def channel_configs(self, channel: str, configs: int, new_servers: int):
+        with self._lock:
+            entry = self._channel(channel)
+            entry["configs"] += configs
+            entry["new_servers"] += new_servers
+
+    def channel_rejections(self, channel: str, reasons: Dict[str, int]):
+        """Sets the configs of a channel's scrape that were unparseable or failed the static checks."""
+        with self._lock:
+            self._channel(channel)["rejected"] = dict(reasons)
+
+    def upstream(self, host: str, status: Optional[int], retry: bool):
+        key = str(status) if status is not None else "error"
+        with self._lock:
+            entry = self.upstreams.setdefault(host, {"requests": 0, "retries": 0, "throttled": 0, "status": {}})
+            entry["requests"] += 1
+            entry["retries"] += retry
+            entry["throttled"] += status == THROTTLED_STATUS
+            entry["status"][key] = entry["status"].get(key, 0) + 1
+
+    def probe(self, latency_ms: Optional[int]):
+        with self._lock:
+            if latency_ms is None:
+                self.probe_failures += 1
+                return
+            self.probe_buckets[bisect_left(PROBE_BUCKETS_MS, latency_ms)] += 1
+            self.probe_sum_ms += latency_ms
+
+    def report(self) -> Dict:
+        """The run report: everything recorded so far, as JSON-ready data."""
+        with self._lock:
+            queues = {
+                name: {"max": q["max"], "mean": round(q["total"] / q["samples"], 1) if q["samples"] else 0.0}
+                for name, q in self.queues.items()
+            }
+            return {
+                "started": self.started,
+                "duration_seconds": round(time.time() - self.started, 3),
+                "stages": {name: {k: round(v, 3) for k, v in s.items()} for name, s in self.stages.items()},
+                "operations": {name: {k: round(v, 4) for k, v in o.items()} for name, o in self.operations.items()},
+                "queues": queues,
+                "channels": {name: dict(c, fetch_seconds=round(c["fetch_seconds"], 3), rejected=dict(c["rejected"])) for name, c in sorted(self.channels.items())},
+                "upstreams": {host: dict(u, status=dict(u["status"])) for host, u in sorted(self.upstreams.items())},
+                "probes": {
+                    "buckets_ms": list(PROBE_BUCKETS_MS) + ["+Inf"],
+                    "counts": list(self.probe_buckets),
+                    "sum_ms": self.probe_sum_ms,
+                    "failures": self.probe_failures,
+                },
+            }
+
+    def write_json(self, file_path: Path):
+        write_atomic(file_path, (json.dumps(self.report(), indent=1, sort_keys=True) + "\n").encode("utf-8"))
+
+    def write_prometheus(self, file_path: Path):
+        """Writes the report in the Prometheus text format, for node_exporter's textfile collector."""
+        write_atomic(file_path, prometheus_text(self.report()).encode("utf-8"))
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def prometheus_text(report: Dict) -> str:
+    """Renders a run report as Prometheus text exposition format."""
+    lines: List[str] = []
+
+    def metric(name: str, kind: str, help_text: str, samples: List):
+        lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+        for labels, value, *suffix in samples:
+            rendered = ",".join(f'{key}="{_label(val)}"' for key, val in labels.items())
+            lines.append(f"{METRIC_PREFIX}_{name}{suffix[0] if suffix else ''}{{{rendered}}} {value}" if rendered
+                         else f"{METRIC_PREFIX}_{name}{suffix[0] if suffix else ''} {value}")
+
+    metric("run_start_timestamp_seconds", "gauge", "When the run started.", [({}, report["started"])])
+    metric("run_duration_seconds", "gauge", "Run duration so far.", [({}, report["duration_seconds"])])
+    stages = report["stages"]
+    metric("stage_wall_seconds", "gauge", "Wall time per stage.",
+           [({"stage": name}, s["wall_seconds"]) for name, s in stages.items()])
+    metric("stage_cpu_seconds", "gauge", "Process CPU time per stage.",
+           [({"stage": name}, s["cpu_seconds"]) for name, s in stages.items()])
+    operations = report["operations"]
+    metric("operation_calls_total", "counter", "Calls per operation.",
+           [({"operation": name}, o["calls"]) for name, o in operations.items()])
+    metric("operation_seconds_total", "counter", "Time spent per operation, summed over concurrent calls.",
+           [({"operation": name}, o["seconds"]) for name, o in operations.items()])
+    metric("queue_depth_max", "gauge", "Largest sampled queue depth.",
+           [({"queue": name}, q["max"]) for name, q in report["queues"].items()])
+    channels = report["channels"]
+    metric("channel_fetch_seconds", "gauge", "Time spent fetching a channel's pages.",
+           [({"channel": name}, c["fetch_seconds"]) for name, c in channels.items()])
+    metric("channel_bytes", "gauge", "Bytes fetched per channel.",
+           [({"channel": name}, c["bytes"]) for name, c in channels.items()])
+    metric("channel_http_status", "gauge", "Last HTTP status per channel (0 for a connection error).",
+           [({"channel": name}, c["status"] or 0) for name, c in channels.items()])
+    metric("channel_configs", "gauge", "Configs found per channel.",
+           [({"channel": name}, c["configs"]) for name, c in channels.items()])
+    metric("channel_new_servers", "gauge", "Servers first seen in this channel during the run.",
+           [({"channel": name}, c["new_servers"]) for name, c in channels.items()])
+    metric("channel_rejected_configs", "gauge", "Configs per channel dropped before validation, by reason.",
+           [({"channel": name, "reason": reason}, count) for name, c in channels.items()
+            for reason, count in sorted(c["rejected"].items())])
+    upstreams = report["upstreams"]
+    metric("upstream_requests_total", "counter", "HTTP requests per upstream and status.",
+           [({"host": host, "status": status}, count) for host, u in upstreams.items() for status, count in u["status"].items()])
+    metric("upstream_retries_total", "counter", "Retried HTTP requests per upstream.",
+           [({"host": host}, u["retries"]) for host, u in upstreams.items()])
+    metric("upstream_throttled_total", "counter", "HTTP 429 responses per upstream.",
+           [({"host": host}, u["throttled"]) for host, u in upstreams.items()])
+    probes = report["probes"]
+    cumulative, buckets = 0, []
+    for bound, count in zip(probes["buckets_ms"], probes["counts"]):
+        cumulative += count
+        buckets.append(({"le": bound}, cumulative, "_bucket"))
+    buckets.append(({}, probes["sum_ms"], "_sum"))
+    buckets.append(({}, cumulative, "_count"))
+    metric("probe_latency_ms", "histogram", "Latency of successful TCP/TLS probes.", buckets)
+    metric("probe_failures_total", "counter", "Probes that got no answer.", [({}, probes["failures"])])
+    return "\n".join(lines) + "\n"
+
+metrics: NullMetrics = NullMetrics()
+
+def enable() -> RunMetrics:
+    """Switches instrumentation on for the rest of the process and returns the recorder."""
+    global metrics
+    metrics = RunMetrics()
+    return metrics
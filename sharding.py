@@ -0,0 +1,178 @@
+# sharding.py
+# Stable partitioning of channels and servers across shards, the files shards exchange, and the deterministic merge.
+# ===== IMPORTS & DEPENDENCIES =====
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+import run_metrics
+from config_fingerprint import ConfigIndex, config_fingerprint
+from output_writer import write_atomic, write_atomic_chunks
+
+# ===== CONFIGURATION & CONSTANTS =====
+SHARD_DIR = Path("state") / "shards"
+PHASES = ("scrape", "validate")
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+class ShardError(Exception):
+    """A shard's input is missing or doesn't match the shard layout."""
+
+def shard_of(key: str, count: int) -> int:
+    """The shard that owns `key`. Stable across processes, machines and Python versions (unlike hash())."""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big") % count
+
+class ShardSpec:
+    """
+    One shard of an N-way run, written "I/N" on the command line (0 <= I < N).
+
+    A sharded run has two phases. In the scrape phase, shard I fetches and parses
+    the channels it owns (by channel name) and writes their configs. In the validate
+    phase, every shard reads all the scrape outputs, picks the same representative
+    config for each server, and validates the servers it owns (by fingerprint).
+    The merge then combines the partial results, so each server is validated
+    exactly once however many shards or machines the run is spread over.
+    """
+
+    __slots__ = ("index", "count")
+
+    def __init__(self, index: int, count: int):
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"Shard {index}/{count} is out of range")
+        self.index = index
+        self.count = count
+
+    @classmethod
+    def parse(cls, text: str) -> "ShardSpec":
+        try:
+            index, count = (int(part) for part in text.split("/"))
+        except ValueError:
+            raise ValueError(f"Expected a shard as I/N, got {text!r}") from None
+        return cls(index, count)
+
+    def owns_channel(self, channel: str) -> bool:
+        return shard_of(channel.lower(), self.count) == self.index
+
+    def owns_fingerprint(self, fingerprint: str) -> bool:
+        return shard_of(fingerprint, self.count) == self.index
+
+    @property
+    def tag(self) -> str:
+        return f"{self.index}-of-{self.count}"
+
+    def state_path(self, path: Path) -> Path:
+        """A per-shard copy of a state file (health history, geo cache), so concurrent shards don't share a writer."""
+        return path.with_name(f"{path.stem}.{self.tag}{path.suffix}")
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+def scraped_path(shard_dir: Path, spec: ShardSpec) -> Path:
+    return shard_dir / f"scraped-{spec.tag}.json"
+
+def partial_path(shard_dir: Path, spec: ShardSpec) -> Path:
+    return shard_dir / f"results-{spec.tag}.json"
+
+def _write_json(path: Path, data: Dict):
+    write_atomic(path, (json.dumps(data, ensure_ascii=False, sort_keys=True) + "\n").encode("utf-8"))
+
+def _read_shard_files(shard_dir: Path, count: int, path_for) -> List[Dict]:
+    specs = [ShardSpec(index, count) for index in range(count)]
+    missing = [str(spec) for spec in specs if not path_for(shard_dir, spec).exists()]
+    if missing:
+        raise ShardError(f"No output in {shard_dir} yet for shard(s) {', '.join(missing)}")
+    documents = []
+    for spec in specs:
+        with open(path_for(shard_dir, spec), "r", encoding="utf-8") as f:
+            document = json.load(f)
+        if document.get("shard") != str(spec):
+            raise ShardError(f"{path_for(shard_dir, spec)} belongs to shard {document.get('shard')}, expected {spec}")
+        documents.append(document)
+    return documents
+
+def select_channels(channels: Iterable[str], spec: ShardSpec) -> List[str]:
+    """The channels the shard scrapes."""
+    return [channel for channel in channels if spec.owns_channel(channel)]
+
+def write_scraped(shard_dir: Path, spec: ShardSpec, channel_configs: Dict[str, Set[str]]):
+    """Writes a scrape phase's output: each owned channel's configs."""
+    channels = {channel: sorted(configs) for channel, configs in channel_configs.items()}
+    _write_json(scraped_path(shard_dir, spec), {"shard": str(spec), "channels": channels})
+    logging.info(
+        f"Shard {spec}: wrote {sum(len(c) for c in channels.values())} configs from {len(channels)} channels "
+        f"to {scraped_path(shard_dir, spec)}"
+    )
+
+def load_owned_configs(shard_dir: Path, spec: ShardSpec) -> Dict[str, Set[str]]:
+    """
+    Reads every shard's scrape output and returns, per channel, the configs this shard validates.
+
+    Channels are indexed in name order, so every shard picks the same
+    representative for a server that several channels posted; the shard keeps
+    only the representatives of the servers it owns.
+    """
+    scraped: Dict[str, List[str]] = {}
+    for document in _read_shard_files(shard_dir, spec.count, scraped_path):
+        scraped.update(document["channels"])
+    index = ConfigIndex()
+    owned: Dict[str, Set[str]] = {}
+    for channel in sorted(scraped):
+        for record in index.add_many(set(scraped[channel]), channel):
+            if spec.owns_fingerprint(config_fingerprint(record)):
+                owned.setdefault(channel, set()).add(record.raw)
+    for channel, reasons in index.rejections.items():
+        run_metrics.metrics.channel_rejections(channel, reasons)
+    logging.info(
+        f"Shard {spec}: validating {sum(len(c) for c in owned.values())} of {len(index)} unique servers "
+        f"scraped from {len(scraped)} channels ({index.unparsed} unparseable, {index.rejected} rejected by static checks)."
+    )
+    return owned
+
+def partial_chunks(spec: ShardSpec, results: Iterable[Dict]) -> Iterator[str]:
+    """The text of a partial file ({"results": [...], "shard": ...}), one result at a time."""
+    separator = "\n"
+    yield '{"results": ['
+    for res in results:
+        yield separator + json.dumps(res, ensure_ascii=False, sort_keys=True)
+        separator = ",\n"
+    yield f'\n], "shard": {json.dumps(str(spec))}}}\n'
+
+def write_partial(shard_dir: Path, spec: ShardSpec, results: Iterable[Dict]):
+    """Writes a validate phase's results (a list or a ResultSpool, which is read back one result at a time)."""
+    write_atomic_chunks(partial_path(shard_dir, spec), (chunk.encode("utf-8") for chunk in partial_chunks(spec, results)))
+    logging.info(f"Shard {spec}: wrote {len(results)} validated configs to {partial_path(shard_dir, spec)}")
+
+def merge_partials(shard_dir: Path, count: int) -> List[Dict]:
+    """
+    Combines the validate phase outputs of all `count` shards.
+
+    Servers are deduplicated by fingerprint (keeping the lowest latency, then
+    the lowest config) and sorted by (latency, config), so the merged list, and
+    everything save_results writes from it, doesn't depend on shard count or
+    on the order the shards finished in.
+    """
+    best: Dict[str, Dict] = {}
+    for document in _read_shard_files(shard_dir, count, partial_path):
+        for result in document["results"]:
+            fingerprint = config_fingerprint(result["config"])
+            current: Optional[Dict] = best.get(fingerprint)
+            if current is None or (result["latency"], result["config"]) < (current["latency"], current["config"]):
+                best[fingerprint] = result
+    merged = sorted(best.values(), key=lambda res: (res["latency"], res["config"]))
+    logging.info(f"Merged {len(merged)} validated configs from {count} shards in {shard_dir}")
+    return merged
+
+def shard_command(argv: List[str], spec: ShardSpec, phase: str) -> List[str]:
+    """The collector arguments for one shard of a local `--shards N` run: the parent's, minus --shards."""
+    forwarded: List[str] = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == "--shards":
+            skip = True
+        elif not arg.startswith("--shards="):
+            forwarded.append(arg)
+    return forwarded + ["--shard", str(spec), "--shard-phase", phase]
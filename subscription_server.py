@@ -0,0 +1,344 @@
+# subscription_server.py
+# HTTP subscription endpoint over the validated results: query filters, cached encoded responses and ETag/304.
+# Usage: python subscription_server.py [--port 8080] [--results validated_configs/results.json]
+#        curl 'http://localhost:8080/sub?protocol=vless&country=DE,NL&max_latency=300&limit=50'
+# ===== IMPORTS & DEPENDENCIES =====
+import argparse
+import base64
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from output_writer import content_hash
+
+# ===== CONFIGURATION & CONSTANTS =====
+DEFAULT_RESULTS_FILE = Path("validated_configs") / "results.json"
+DEFAULT_PORT = 8080
+CACHE_ENTRIES = 256  # Encoded responses kept per results version
+RELOAD_CHECK_SECONDS = 5.0  # How often requests check the results file for a newer version
+FORMATS = ("base64", "plain", "json")  # base64 is what subscription.txt holds and clients expect
+CONTENT_TYPES = {"base64": "text/plain; charset=utf-8", "plain": "text/plain; charset=utf-8",
+                 "json": "application/json; charset=utf-8"}
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+class QueryError(ValueError):
+    """A query parameter that can't be used (shown to the client as a 400)."""
+
+class Query:
+    """
+    A parsed, canonical subscription query.
+
+    protocol, country and isp take comma-separated lists (any of them may
+    match); isp matches case-insensitively anywhere in the ISP name. Equal
+    queries written differently ("DE,nl" vs "NL,DE") share one `key`, so
+    they share a cache entry and an ETag.
+    """
+
+    __slots__ = ("protocols", "countries", "isps", "max_latency", "limit", "format")
+
+    def __init__(self, protocols=(), countries=(), isps=(), max_latency: Optional[int] = None,
+                 limit: Optional[int] = None, format: str = "base64"):
+        self.protocols = tuple(sorted({p.lower() for p in protocols}))
+        self.countries = tuple(sorted({c.upper() for c in countries}))
+        self.isps = tuple(sorted({i.lower() for i in isps}))
+        self.max_latency = max_latency
+        self.limit = limit
+        self.format = format
+
+    @classmethod
+    def from_query_string(cls, query_string: str) -> "Query":
+        params = parse_qs(query_string)
+
+        def values(name: str) -> List[str]:
+            return [v.strip() for raw in params.get(name, []) for v in raw.split(",") if v.strip()]
+
+        def number(name: str) -> Optional[int]:
+            raw = params.get(name, [None])[-1]
+            if raw is None or raw == "":
+                return None
+            try:
+                value = int(raw)
+            except ValueError:
+                raise QueryError(f"{name} must be a whole number, got {raw!r}") from None
+            if value < 0:
+                raise QueryError(f"{name} can't be negative")
+            return value
+
+        format = params.get("format", ["base64"])[-1]
+        if format not in FORMATS:
+            raise QueryError(f"format must be one of {', '.join(FORMATS)}")
+        return cls(values("protocol"), values("country"), values("isp"), number("max_latency"), number("limit"), format)
+
+    @property
+    def key(self) -> Tuple:
+        return (self.protocols, self.countries, self.isps, self.max_latency, self.limit, self.format)
+
+class SubscriptionIndex:
+    """
+    One version of the results with in-memory indexes for the query filters.
+
+    Rows keep the results' (latency, config) order, so max_latency is a bisect
+    over the latency column and limit keeps the fastest matches. Protocol,
+    country and ISP each map to the sorted rows having that value; a query
+    intersects one union of those lists per filter.
+    """
+
+    def __init__(self, results: Sequence[Dict], version: str):
+        self.results = sorted(results, key=lambda res: (res["latency"], res["config"]))
+        self.version = version
+        self.latencies = [res["latency"] for res in self.results]
+        self.by_protocol: Dict[str, List[int]] = {}
+        self.by_country: Dict[str, List[int]] = {}
+        self.by_isp: Dict[str, List[int]] = {}
+        for row, res in enumerate(self.results):
+            self.by_protocol.setdefault(res["protocol"].lower(), []).append(row)
+            self.by_country.setdefault(res.get("country_code", "N/A").upper(), []).append(row)
+            self.by_isp.setdefault(res.get("isp", "Unknown").lower(), []).append(row)
+
+    @classmethod
+    def from_file(cls, file_path: Path) -> "SubscriptionIndex":
+        data = file_path.read_bytes()
+        return cls(json.loads(data), content_hash(data))
+
+    def _rows_for(self, postings: Dict[str, List[int]], keys: Sequence[str]) -> Optional[set]:
+        if not keys:
+            return None
+        rows: set = set()
+        for key in keys:
+            rows.update(postings.get(key, ()))
+        return rows
+
+    def select(self, query: Query) -> List[Dict]:
+        """The results matching `query`, fastest first."""
+        end = len(self.results) if query.max_latency is None else bisect_right(self.latencies, query.max_latency)
+        isp_keys = [isp for isp in self.by_isp if any(term in isp for term in query.isps)] if query.isps else ()
+        if query.isps and not isp_keys:
+            return []
+        filters = [
+            rows for rows in (
+                self._rows_for(self.by_protocol, query.protocols),
+                self._rows_for(self.by_country, query.countries),
+                self._rows_for(self.by_isp, isp_keys),
+            )
+            if rows is not None
+        ]
+        if filters:
+            filters.sort(key=len)
+            matching = sorted(row for row in set.intersection(*filters) if row < end)
+        else:
+            matching = range(end)
+        if query.limit is not None:
+            matching = matching[:query.limit]
+        return [self.results[row] for row in matching]
+
+    def etag(self, query: Query) -> str:
+        """Depends only on the results version and the canonical query, so a 304 needs no encoding."""
+        return f'"{self.version[:16]}-{content_hash(repr(query.key).encode("utf-8"))[:12]}"'
+
+    def render(self, query: Query) -> bytes:
+        selected = self.select(query)
+        if query.format == "json":
+            return json.dumps(selected, ensure_ascii=False).encode("utf-8")
+        # Same lines as the published subscription files
+        text = "\n".join(res.get("renamed_config", res["config"]) for res in selected)
+        if query.format == "plain":
+            return text.encode("utf-8")
+        return base64.b64encode(text.encode("utf-8"))
+
+    def summary(self) -> Dict:
+        return {
+            "version": self.version, "total": len(self.results),
+            "protocols": {name: len(rows) for name, rows in sorted(self.by_protocol.items())},
+            "countries": {name: len(rows) for name, rows in sorted(self.by_country.items())},
+        }
+
+class SubscriptionStore:
+    """
+    The current SubscriptionIndex plus an LRU cache of encoded responses.
+
+    Either follows a results file (reloaded when its mtime changes, checked at
+    most every RELOAD_CHECK_SECONDS) or is fed results directly with update(),
+    as the daemon does after each flush. A new version replaces the index and
+    empties the cache in one step; requests in flight finish on the old one.
+    """
+
+    def __init__(self, results_file: Optional[Path] = None, cache_entries: int = CACHE_ENTRIES):
+        self.results_file = results_file
+        self.cache_entries = cache_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple, Tuple[str, bytes]]" = OrderedDict()
+        self._index = SubscriptionIndex([], content_hash(b"[]"))
+        self._mtime: Optional[int] = None
+        self._checked = 0.0
+        if results_file:
+            self._reload_if_changed(force=True)
+
+    def update(self, results: Sequence[Dict]):
+        """Serves a new set of results."""
+        version = content_hash(json.dumps(results, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+        self._swap(SubscriptionIndex(results, version))
+
+    def _swap(self, index: SubscriptionIndex):
+        with self._lock:
+            if index.version == self._index.version:
+                return
+            self._index = index
+            self._cache.clear()
+        logging.info(f"Subscription server: serving {len(index.results)} configs (version {index.version[:12]})")
+
+    def _reload_if_changed(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._checked < RELOAD_CHECK_SECONDS:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.results_file).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            index = SubscriptionIndex.from_file(self.results_file)
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Subscription server: keeping the current results; could not load {self.results_file}: {e}")
+            return
+        self._mtime = mtime
+        self._swap(index)
+
+    @property
+    def index(self) -> SubscriptionIndex:
+        if self.results_file:
+            self._reload_if_changed()
+        return self._index
+
+    def response(self, index: SubscriptionIndex, query: Query) -> Tuple[str, bytes]:
+        """(ETag, body) for a query, encoded once per results version while it stays in the cache."""
+        key = (index.version, query.key)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+        entry = (index.etag(query), index.render(query))
+        with self._lock:
+            self.misses += 1
+            if index is self._index:
+                self._cache[key] = entry
+                while len(self._cache) > self.cache_entries:
+                    self._cache.popitem(last=False)
+        return entry
+
+class SubscriptionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "SubscriptionServer"
+
+    def log_message(self, format, *args):
+        logging.debug(f"Subscription server: {self.address_string()} {format % args}")
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        store = self.server.store
+        index = store.index
+        if parts.path == "/":
+            self._send(200, json.dumps(index.summary()).encode("utf-8"), CONTENT_TYPES["json"], {"Cache-Control": "no-cache"})
+            return
+        if parts.path != "/sub":
+            self._send(404, b"not found\n", "text/plain; charset=utf-8")
+            return
+        try:
+            query = Query.from_query_string(parts.query)
+        except QueryError as e:
+            self._send(400, f"{e}\n".encode("utf-8"), "text/plain; charset=utf-8")
+            return
+        etag = index.etag(query)
+        # Clients revalidate on every poll; an unchanged slice costs one hash and a 304
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in (tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")):
+            self.send_response(304)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        etag, body = store.response(index, query)
+        self._send(200, body, CONTENT_TYPES[query.format], headers)
+
+    do_HEAD = do_GET
+
+class SubscriptionServer(ThreadingHTTPServer):
+    """
+    Serves GET /sub?protocol=&country=&isp=&max_latency=&limit=&format= and a
+    JSON summary at GET /. Use as a context manager to serve from a background
+    thread, or call serve_forever().
+    """
+
+    daemon_threads = True
+
+    def __init__(self, store: SubscriptionStore, host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+        if ":" in host:  # Read by TCPServer.__init__ when it creates the socket
+            self.address_family = socket.AF_INET6
+        super().__init__((host, port), SubscriptionHandler)
+        self.store = store
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://[{host}]:{port}" if ":" in host else f"http://{host}:{port}"
+
+    def __enter__(self) -> "SubscriptionServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="SubscriptionServer", daemon=True)
+        self._thread.start()
+        logging.info(f"Subscription server listening on {self.url}")
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+def parse_listen_address(text: str) -> Tuple[str, int]:
+    """[HOST:]PORT, with HOST defaulting to 127.0.0.1; an IPv6 HOST is written in brackets ([::1]:8080)."""
+    host, _, port = text.rpartition(":")
+    return host.strip("[]") or "127.0.0.1", int(port)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve filtered subscriptions from the collector's results.")
+    parser.add_argument("--results", type=Path, default=DEFAULT_RESULTS_FILE, help="results.json to serve (reloaded when it changes).")
+    parser.add_argument("--listen", type=parse_listen_address, default=("127.0.0.1", DEFAULT_PORT), metavar="[HOST:]PORT",
+                        help=f"Address to listen on (default 127.0.0.1:{DEFAULT_PORT}).")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] - %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+    server = SubscriptionServer(SubscriptionStore(args.results), *args.listen)
+    logging.info(f"Subscription server listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+# tests/conftest.py
+# Makes the collector's top-level modules importable from the tests, however pytest is started.
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,65 @@
+# tests/test_channel_state.py
+# Incremental scraping: cursors persist between runs and only messages past the cursor are parsed.
+import os
+import sys
+
+import pytest
+
+import channel_state
+import config_extractor
+import v2ray_collector3 as collector
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from fixtures import load_fixture_pages  # noqa: E402
+
+CHANNEL = "bench_configs_a"
+
+@pytest.fixture
+def page():
+    return load_fixture_pages()[CHANNEL]
+
+def configs_in(messages) -> set:
+    return {config for message in messages for config in config_extractor.extract_configs(message["html"])}
+
+def test_cursor_round_trips_through_the_state_file(tmp_path, page):
+    messages = channel_state.split_channel_messages(page)
+    cursors = {CHANNEL: channel_state.advance_cursor(messages[:10], None)}
+    path = tmp_path / "state" / "channel_state.json"
+    channel_state.save_channel_state(cursors, path)
+    assert channel_state.load_channel_state(path) == cursors
+    assert not list(path.parent.glob("*.tmp"))
+    assert channel_state.load_channel_state(tmp_path / "missing.json") == {}
+    path.write_text("{not json")
+    assert channel_state.load_channel_state(path) == {}
+
+def test_only_messages_after_a_mid_page_cursor_are_forwarded(tmp_path, page, monkeypatch):
+    messages = channel_state.split_channel_messages(page)
+    assert len(messages) == 20
+    older, newer = messages[:10], messages[10:]
+    assert configs_in(newer) and configs_in(newer) != configs_in(messages)
+    path = tmp_path / "channel_state.json"
+    channel_state.save_channel_state({CHANNEL: channel_state.advance_cursor(older, None)}, path)
+    monkeypatch.setattr(collector, "fetch_channel_content", lambda session, channel, before=None: page)
+
+    # First run: everything after the saved cursor, which then moves to the newest message
+    cursors = channel_state.load_channel_state(path)
+    assert collector.scrape_channel(None, CHANNEL, cursors) == configs_in(newer)
+    assert cursors[CHANNEL]["last_message_id"] == messages[-1]["message_id"]
+    channel_state.save_channel_state(cursors, path)
+
+    # Second run over the same page: nothing new
+    cursors = channel_state.load_channel_state(path)
+    assert collector.scrape_channel(None, CHANNEL, cursors) == set()
+
+    # Without cursors the whole page is parsed
+    assert collector.scrape_channel(None, CHANNEL) == configs_in(messages)
+
+def test_edited_message_at_the_cursor_is_parsed_again(page):
+    messages = channel_state.split_channel_messages(page)
+    cursor = channel_state.advance_cursor(messages[:10], None)
+    at_cursor = messages[9]
+    assert channel_state.select_new_messages(messages[:10], cursor) == []
+    edited = dict(at_cursor, html=at_cursor["html"].replace("<code>", "<code>trojan://pw@edit.example.com:443 ", 1))
+    assert channel_state.select_new_messages(messages[:9] + [edited], cursor) == [edited]
+    # The cursor never moves backwards
+    assert channel_state.advance_cursor(messages[:5], cursor) == cursor
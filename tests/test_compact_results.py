@@ -0,0 +1,65 @@
+# tests/test_compact_results.py
+# The columnar export round-trips results.json records exactly, and CompactResults reads it lazily.
+import base64
+import json
+
+import pytest
+
+from compact_results import CompactResults, compact_json, decode_results, encode_results
+from config_model import ProxyConfig
+
+UUID = "11111111-2222-3333-4444-555555555555"
+VMESS = "vmess://" + base64.b64encode(json.dumps(
+    {"v": "2", "ps": "old", "add": "v.example.com", "port": "443", "id": UUID, "aid": "0", "net": "ws", "tls": "tls"}
+).encode()).decode()
+
+def record(config: str, name: str, latency: int, country=("DE", "Germany"), isp="Hetzner", **extra) -> dict:
+    res = {"config": config, "renamed_config": ProxyConfig.parse(config).with_name(name), "protocol": config.split("://")[0],
+           "name": name, "display_name": f"[{country[0]}] {name}", "country_code": country[0],
+           "country_name": country[1], "isp": isp, "latency": latency, "latency_p90": latency + 20, "jitter": 3}
+    res.update(extra)
+    return res
+
+RESULTS = [
+    record(f"vless://{UUID}@a.example.com:443?security=tls#orig", "DE-Hetzner-80ms", 80),
+    record(VMESS, "DE-Hetzner-95ms \U0001f1e9\U0001f1ea", 95),
+    record("trojan://pw@b.example.com:443", "NL Leaseweb #1 100%", 120, ("NL", "Netherlands"), "Leaseweb"),
+    record("trojan://pw@c.example.com:443#x", "c", 150, ("N/A", "Unknown"), "Unknown", source="corpus"),
+]
+# renamed_config that isn't the config renamed: a different fragment, a different URI, or none at all
+RESULTS[2]["renamed_config"] = "trojan://pw@b.example.com:443#custom"
+RESULTS[3]["renamed_config"] = "trojan://pw@elsewhere.example.com:443#c"
+RESULTS.append({key: value for key, value in record("hy2://pw@d.example.com:443#d", "d", 300).items()
+                if key not in ("renamed_config", "latency_p90", "jitter", "display_name")})
+
+def test_round_trip_through_compact_json():
+    data = json.loads(compact_json(RESULTS))
+    assert data["count"] == len(RESULTS)
+    assert data["dictionaries"]["country_code"] == ["DE", "NL", "N/A"]
+    assert decode_results(data) == RESULTS
+    assert decode_results(encode_results(RESULTS)) == RESULTS
+    # Renamed the usual way: nothing stored; a new fragment: the suffix; else the URI; missing: False
+    assert data["columns"]["renamed"] == [None, None, "#custom", RESULTS[3]["renamed_config"], False]
+    assert decode_results(json.loads(compact_json([]))) == []
+
+def test_lazy_reader(tmp_path):
+    path = tmp_path / "results.compact.json"
+    path.write_text(compact_json(RESULTS), encoding="utf-8")
+    results = CompactResults.load(path)
+    assert len(results) == len(RESULTS)
+    assert results.record(2) == RESULTS[2]
+    assert results.value("isp", 2) == "Leaseweb"
+    assert results.value("config", 1) == VMESS
+    assert results.value("renamed_config", 4) is None
+    assert list(results) == RESULTS
+    assert results.filter(country_code="de") == [0, 1, 4]
+    assert results.filter(protocol="trojan", max_latency=130) == [2]
+    assert results.filter(isp="Nobody") == []
+    assert list(results.records(results.filter(max_latency=95))) == RESULTS[:2]
+    assert results.counts("protocol") == {"vless": 1, "vmess": 1, "trojan": 2, "hy2": 1}
+
+def test_unknown_version_is_rejected():
+    data = encode_results(RESULTS)
+    data["version"] = 99
+    with pytest.raises(ValueError):
+        CompactResults(data)
@@ -0,0 +1,47 @@
+# tests/test_config_checks.py
+# The static per-protocol checks and the reasons they give.
+import pytest
+
+from config_checks import check_config, check_host, is_reserved_address
+from config_model import ProxyConfig
+
+UUID = "11111111-2222-3333-4444-555555555555"
+
+@pytest.mark.parametrize("uri, reason", [
+    ("trojan://pw@a.example.com:0", "bad_port"),
+    ("trojan://pw@a.example.com:443?sni=cut…", "truncated"),
+    ("trojan://pw@not_a_host:443", "bad_host"),
+    ("trojan://pw@1.2.3.400:443", "bad_host"),
+    ("trojan://pw@router.local:443", "reserved_name"),
+    ("trojan://pw@proxy.home.arpa:443", "reserved_name"),
+    ("trojan://pw@10.1.2.3:443", "reserved_address"),
+    ("trojan://pw@[::1]:443", "reserved_address"),
+    ("trojan://pw@[::ffff:127.0.0.1]:443", "reserved_address"),
+    ("vless://not-a-uuid@a.example.com:443", "bad_uuid"),
+    ("trojan://@a.example.com:443", "missing_password"),
+    ("ss://aes-128-gcm:@a.example.com:443", "missing_password"),
+    ("ss://rot13:pw@a.example.com:443", "bad_cipher"),
+    (f"vless://{UUID}@a.example.com:443?security=reality&sni=x", "missing_reality_key"),
+])
+def test_rejection_reasons(uri, reason):
+    assert check_config(ProxyConfig.parse(uri)) == reason
+
+@pytest.mark.parametrize("uri", [
+    f"vless://{UUID}@a.example.com:443?security=reality&sni=x&pbk=key#name",
+    "trojan://pw@8.8.8.8:443",
+    "trojan://pw@[2606:4700::1]:443",
+    "ss://aes-256-gcm:pw@a.example.com:8388",
+    "ss://none:@a.example.com:8388",
+    # The ellipsis only counts before the name; Telegram names often end with one
+    "trojan://pw@a.example.com:443#long name…",
+])
+def test_plausible_configs_pass(uri):
+    assert check_config(ProxyConfig.parse(uri)) is None
+
+def test_reserved_ranges():
+    assert is_reserved_address("192.168.1.1")
+    assert is_reserved_address("100.64.0.1")
+    assert is_reserved_address("fe80::1")
+    assert not is_reserved_address("1.1.1.1")
+    assert not is_reserved_address("a.example.com")  # Not an IP literal
+    assert check_host("[2001:db8::1]") == "reserved_address"
@@ -0,0 +1,65 @@
+# tests/test_config_extractor.py
+# The regex and lxml extractors must return exactly what the original BeautifulSoup parser did.
+import os
+import re
+import sys
+
+import pytest
+from bs4 import BeautifulSoup
+
+import config_extractor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from fixtures import load_fixture_pages  # noqa: E402
+
+UUID = "11111111-2222-3333-4444-555555555555"
+MULTI_CONFIG_PAGE = (
+    '<div class="tgme_widget_message" data-post="multi/1"><code>'
+    f"vless://{UUID}@a.example.com:443?security=tls#a vmess://eyJhZGQiOiJiLmV4YW1wbGUuY29tIn0= "
+    "trojan://pw@c.example.com:443#c</code>"
+    "<pre><code>ss://YWVzLTI1Ni1nY206cHc=@d.example.com:8388#d<br/>"
+    "hy2://pw@e.example.com:443#e &amp; more</code></pre>"
+    "<p>vless://not-in-code@f.example.com:443</p></div>"
+)
+PROTOCOL_HEADERS = re.compile(r"(vmess|vless|ss|trojan|hysteria|hy2)://")
+
+def baseline_parse(html_content):
+    """The original parse_v2ray_configs, with the start_indices split for lines holding several configs."""
+    configs = set()
+    soup = BeautifulSoup(html_content, "html.parser")
+    protocol_pattern = re.compile(r"^(vmess|vless|ss|trojan|hysteria|hy2)://")
+    for code_block in soup.find_all("code"):
+        for line in code_block.get_text(separator="\n").strip().splitlines():
+            clean_line = line.strip()
+            start_indices = [m.start() for m in PROTOCOL_HEADERS.finditer(clean_line)
+                             if m.start() == 0 or not clean_line[m.start() - 1].isalnum()]
+            for i, start in enumerate(start_indices):
+                end = start_indices[i + 1] if i + 1 < len(start_indices) else len(clean_line)
+                config = clean_line[start:end].strip()
+                if protocol_pattern.match(config):
+                    configs.add(config)
+    return configs
+
+PAGES = dict(load_fixture_pages(), multi_config=MULTI_CONFIG_PAGE)
+
+@pytest.mark.parametrize("name", sorted(PAGES))
+def test_extractors_match_baseline(name):
+    page = PAGES[name]
+    expected = baseline_parse(page)
+    assert expected
+    assert config_extractor.extract_configs_regex(page) == expected
+    assert config_extractor.extract_configs(page) == expected
+    if config_extractor.etree is None:
+        pytest.skip("lxml is not installed")
+    assert config_extractor.extract_configs_lxml(page) == expected
+
+def test_multi_config_block_is_split():
+    configs = config_extractor.extract_configs(MULTI_CONFIG_PAGE)
+    assert len(configs) == 5
+    assert "trojan://pw@c.example.com:443#c" in configs
+    assert "hy2://pw@e.example.com:443#e & more" in configs
+    assert not any("not-in-code" in config for config in configs)
+
+def test_falls_back_to_regex_without_lxml(monkeypatch):
+    monkeypatch.setattr(config_extractor, "etree", None)
+    assert config_extractor.extract_configs(MULTI_CONFIG_PAGE) == baseline_parse(MULTI_CONFIG_PAGE)
@@ -0,0 +1,70 @@
+# tests/test_config_fingerprint.py
+# Fingerprints identify servers, not links; ConfigIndex dedupes and tallies rejections with them.
+import base64
+import json
+
+from config_fingerprint import ConfigIndex, config_fingerprint
+
+UUID = "11111111-2222-3333-4444-555555555555"
+
+def vmess(**fields) -> str:
+    data = {"v": "2", "ps": "name", "add": "a.example.com", "port": "443", "id": UUID, "net": "tcp", "tls": ""}
+    data.update(fields)
+    return "vmess://" + base64.b64encode(json.dumps(data).encode()).decode()
+
+def test_same_server_same_fingerprint():
+    base = f"vless://{UUID}@a.example.com:443?type=ws&path=%2Fws&security=tls"
+    assert config_fingerprint(base + "#one") == config_fingerprint(base + "#two")
+    # Query order, key case and the UUID's case don't change the server
+    reordered = f"vless://{UUID.upper()}@a.example.com:443?security=tls&Path=%2Fws&type=ws#three"
+    assert config_fingerprint(reordered) == config_fingerprint(base)
+    assert config_fingerprint(vmess(ps="a")) == config_fingerprint(vmess(ps="b"))
+    assert config_fingerprint("hysteria2://pw@a.example.com:443#x") == config_fingerprint("hy2://pw@a.example.com:443")
+
+def test_different_servers_different_fingerprints():
+    base = f"vless://{UUID}@a.example.com:443?type=ws&path=%2Fws"
+    others = [
+        f"vless://{UUID}@a.example.com:8443?type=ws&path=%2Fws",
+        f"vless://{UUID}@b.example.com:443?type=ws&path=%2Fws",
+        f"vless://{UUID}@a.example.com:443?type=ws&path=%2Fother",
+        "trojan://PW@a.example.com:443",
+    ]
+    fingerprints = {config_fingerprint(uri) for uri in [base, *others]}
+    assert len(fingerprints) == len(others) + 1
+    assert config_fingerprint("trojan://pw@a.example.com:443") != config_fingerprint("trojan://PW@a.example.com:443")
+    assert config_fingerprint(vmess(port="443")) != config_fingerprint(vmess(port="8443"))
+
+def test_unparseable_configs_fall_back_to_the_link():
+    assert config_fingerprint("vmess://!!!#a") == config_fingerprint("vmess://!!!#b")
+    assert config_fingerprint("vmess://!!!") != config_fingerprint("vmess://???")
+
+def test_index_keeps_one_record_per_server_and_every_channel():
+    index = ConfigIndex()
+    first = index.add_many({"trojan://pw@a.example.com:443#b", "trojan://pw@a.example.com:443#a"}, "one")
+    second = index.add_many({"trojan://pw@a.example.com:443#c", "trojan://pw@b.example.com:443"}, "two")
+    assert [record.raw for record in first] == ["trojan://pw@a.example.com:443#a"]  # Sorted, so stable
+    assert [record.host for record in second] == ["b.example.com"]
+    assert len(index) == 2 and index.raw_count == 4
+    fingerprint = config_fingerprint("trojan://pw@a.example.com:443")
+    assert fingerprint in index
+    assert index.channels(fingerprint) == {"one", "two"}
+    assert index.representative(fingerprint).raw == "trojan://pw@a.example.com:443#a"
+
+def test_index_tallies_rejections_per_channel():
+    index = ConfigIndex()
+    index.add_many({"vmess://!!!", "vless://nope@a.example.com:443", "trojan://pw@10.0.0.1:443"}, "bad")
+    index.add("trojan://pw@a.example.com:443", "good")
+    assert len(index) == 1
+    assert index.unparsed == 1
+    assert index.rejected == 2
+    assert index.rejections == {"bad": {"unparseable": 1, "bad_uuid": 1, "reserved_address": 1}}
+    assert index.rejection_summary() == "bad_uuid 1, reserved_address 1, unparseable 1"
+
+def test_fingerprint_only_index():
+    index = ConfigIndex(keep_records=False)
+    assert index.add("trojan://pw@a.example.com:443#a", "one") is not None
+    assert index.add("trojan://pw@a.example.com:443#b", "two") is None
+    fingerprint = config_fingerprint("trojan://pw@a.example.com:443")
+    assert fingerprint in index and len(index) == 1
+    assert index.representative(fingerprint) is None
+    assert index.channels(fingerprint) == set()
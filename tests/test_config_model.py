@@ -0,0 +1,40 @@
+# tests/test_config_model.py
+# ProxyConfig.with_name: renaming a config changes its name and nothing else.
+import base64
+import json
+
+import pytest
+
+from config_fingerprint import config_fingerprint
+from config_model import ProxyConfig
+
+UUID = "11111111-2222-3333-4444-555555555555"
+VMESS = {"v": "2", "ps": "old name", "add": "a.example.com", "port": "443", "id": UUID, "aid": "0",
+         "net": "ws", "path": "/ws", "host": "cdn.example.com", "tls": "tls", "sni": "cdn.example.com"}
+
+@pytest.mark.parametrize("uri", [
+    f"vless://{UUID}@a.example.com:443?type=ws&path=%2Fws&security=tls&sni=cdn.example.com#old",
+    "trojan://p%40ss@a.example.com:443?sni=cdn.example.com",
+    "ss://" + base64.b64encode(b"aes-256-gcm:pw").decode() + "@a.example.com:8388#old",
+    "ss://" + base64.b64encode(b"aes-256-gcm:pw@a.example.com:8388").decode() + "#legacy",
+    "hy2://pw@a.example.com:443?sni=x&obfs=salamander#old",
+    "vmess://" + base64.b64encode(json.dumps(VMESS).encode()).decode(),
+])
+@pytest.mark.parametrize("name", ["DE-Hetzner-139ms-VLESS", "[DE]\U0001f1e9\U0001f1ea Hetzner 139ms", "a#b?c&d %"])
+def test_with_name_round_trip(uri, name):
+    config = ProxyConfig.parse(uri)
+    renamed = ProxyConfig.parse(config.with_name(name))
+    assert renamed.fragment == name
+    assert renamed.canonical_key() == config.canonical_key()
+    assert config_fingerprint(renamed) == config_fingerprint(config)
+    # Renaming again from the renamed config gives the same link
+    assert renamed.with_name(name) == config.with_name(name)
+
+def test_with_name_keeps_the_link_up_to_its_fragment():
+    uri = f"vless://{UUID}@a.example.com:443?type=grpc&serviceName=svc#old"
+    assert ProxyConfig.parse(uri).with_name("new") == uri.partition("#")[0] + "#new"
+
+def test_vmess_with_name_only_changes_ps():
+    config = ProxyConfig.parse("vmess://" + base64.b64encode(json.dumps(VMESS).encode()).decode())
+    data = json.loads(base64.b64decode(config.with_name("new")[len("vmess://"):]))
+    assert data == dict(VMESS, ps="new")
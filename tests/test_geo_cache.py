@@ -0,0 +1,132 @@
+# tests/test_geo_cache.py
+# GeoLookup batching, TTL and fail records against a local stand-in for ip-api.com's batch endpoint.
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import v2ray_collector3 as collector
+from geo_cache import BATCH_SIZE, UNKNOWN_GEO_INFO, AsyncGeoLookup, GeoCache, GeoLookup, resolve_batch
+
+FAIL_PREFIX = "198.51.100."  # Answered with "status":"fail"
+
+class GeoAPI(ThreadingHTTPServer):
+    """Answers POST /batch like ip-api.com and remembers each request's IPs."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), GeoHandler)
+        self.batches = []
+        self.url = f"http://127.0.0.1:{self.server_address[1]}/batch"
+
+class GeoHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        ips = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.batches.append(ips)
+        records = [
+            {"status": "fail", "message": "reserved range", "query": ip} if ip.startswith(FAIL_PREFIX) else
+            {"status": "success", "country": "Germany", "countryCode": "DE", "isp": f"ISP {ip}", "query": ip}
+            for ip in ips
+        ]
+        body = json.dumps(records).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def api(monkeypatch):
+    server = GeoAPI()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    monkeypatch.setattr(collector, "GEO_IP_BATCH_URL", server.url)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def session():
+    with requests.Session() as session:
+        yield session
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = GeoCache(tmp_path / "geo.sqlite3")
+    yield cache
+    cache.close()
+
+def fetcher(session):
+    return lambda ips: collector.fetch_geo_batch(session, ips)
+
+def test_concurrent_lookups_share_one_batch(api, session, cache):
+    lookup = GeoLookup(cache, fetcher(session), batch_window=0.5)
+    ips = [f"1.0.0.{i}" for i in range(40)]
+    results = {}
+    threads = [threading.Thread(target=lambda ip=ip: results.__setitem__(ip, lookup.lookup(ip))) for ip in ips * 2]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(api.batches) == 1 and sorted(api.batches[0]) == sorted(ips)
+    assert results["1.0.0.7"] == {"country_code": "DE", "country_name": "Germany", "isp": "ISP 1.0.0.7"}
+    # Answered from the cache from now on
+    assert lookup.lookup("1.0.0.7")["isp"] == "ISP 1.0.0.7" and len(api.batches) == 1
+
+def test_batches_are_capped_at_batch_size(api, session, cache):
+    ips = [f"2.0.{i // 250}.{i % 250}" for i in range(BATCH_SIZE * 2 + 50)]
+    results = resolve_batch(cache, ips, fetcher(session))
+    assert [len(batch) for batch in api.batches] == [BATCH_SIZE, BATCH_SIZE, 50]
+    assert len(results) == len(ips) == len(cache)
+
+def test_cached_answers_last_until_their_ttl(api, session, tmp_path):
+    path = tmp_path / "geo.sqlite3"
+    cache = GeoCache(path, ttl_seconds=3600)
+    resolve_batch(cache, ["3.0.0.1"], fetcher(session))
+    cache.close()
+    reopened = GeoCache(path, ttl_seconds=3600)
+    assert reopened.get("3.0.0.1")["isp"] == "ISP 3.0.0.1"
+    reopened.close()
+
+    short = GeoCache(path, ttl_seconds=0.05)
+    time.sleep(0.1)
+    assert short.get("3.0.0.1") is None
+    lookup = GeoLookup(short, fetcher(session), batch_window=0.01)
+    assert lookup.lookup("3.0.0.1")["isp"] == "ISP 3.0.0.1"
+    assert len(api.batches) == 2  # Expired, so fetched again
+    short.close()
+
+def test_fail_records_are_answered_but_not_cached(api, session, cache):
+    lookup = GeoLookup(cache, fetcher(session), batch_window=0.01)
+    assert lookup.lookup(FAIL_PREFIX + "1") == UNKNOWN_GEO_INFO
+    assert cache.get(FAIL_PREFIX + "1") is None and len(cache) == 0
+    lookup.lookup(FAIL_PREFIX + "1")
+    assert len(api.batches) == 2
+
+def test_a_failed_request_is_answered_but_not_cached(monkeypatch, session, cache):
+    monkeypatch.setattr(collector, "GEO_IP_BATCH_URL", "http://127.0.0.1:9/batch")  # Nothing listens on discard
+    lookup = GeoLookup(cache, fetcher(session), batch_window=0.01)
+    assert lookup.lookup("4.0.0.1") == UNKNOWN_GEO_INFO
+    assert cache.get("4.0.0.1") is None
+
+def test_async_lookups_share_one_batch(api, session, cache):
+    async def fetch(ips):
+        return await asyncio.to_thread(collector.fetch_geo_batch, session, ips)
+
+    async def run():
+        lookup = AsyncGeoLookup(cache, fetch, batch_window=0.05)
+        ips = [f"5.0.0.{i}" for i in range(30)] + [FAIL_PREFIX + "2"]
+        return ips, await asyncio.gather(*(lookup.lookup(ip) for ip in ips + ips))
+
+    ips, results = asyncio.run(run())
+    assert len(api.batches) == 1 and sorted(api.batches[0]) == sorted(ips)
+    assert results[0]["isp"] == "ISP 5.0.0.0" and results[30] == UNKNOWN_GEO_INFO
+    assert len(cache) == 30
@@ -0,0 +1,83 @@
+# tests/test_health_store.py
+# Failure backoff, reset on success, persistence, and select_due_configs skipping servers that aren't due.
+import time
+
+import pytest
+
+import v2ray_collector3 as collector
+from config_fingerprint import config_fingerprint
+from config_model import ProxyConfig
+from health_store import HealthScheduler, HealthStore
+
+HOUR = 3600
+NOW = 1_700_000_000.0
+
+@pytest.fixture
+def store(tmp_path):
+    store = HealthStore(tmp_path / "health.sqlite")
+    yield store
+    store.close()
+
+def scheduler(store) -> HealthScheduler:
+    return HealthScheduler(store, healthy_recheck=3 * HOUR, failure_backoff=HOUR, max_backoff=8 * HOUR)
+
+def result(config: str, latency: int = 120) -> dict:
+    return {"config": config, "latency": latency, "protocol": "trojan"}
+
+def test_backoff_doubles_per_failure_up_to_the_cap(store):
+    health = scheduler(store)
+    delays = []
+    for _ in range(6):
+        store.record_failure("fp", now=NOW)
+        delays.append(health.next_check_delay(store.get("fp")))
+    assert delays == [HOUR, 2 * HOUR, 4 * HOUR, 8 * HOUR, 8 * HOUR, 8 * HOUR]
+    # Three failures: due again four hours after the last check, not before
+    for _ in range(3):
+        store.record_failure("fp3", now=NOW)
+    assert not health.is_due("fp3", now=NOW + 4 * HOUR - 1)
+    assert health.is_due("fp3", now=NOW + 4 * HOUR)
+    assert health.skipped_dead == 1
+
+def test_success_resets_the_backoff(store):
+    health = scheduler(store)
+    for _ in range(4):
+        store.record_failure("fp", now=NOW)
+    store.record_success("fp", 90, result("trojan://pw@a.example.com:443", 90), now=NOW + HOUR)
+    record = store.get("fp")
+    assert record.failures == 0
+    assert record.latencies == [90]
+    assert health.next_check_delay(record) == 3 * HOUR
+    # Not due yet: the stored result is carried forward instead
+    assert not health.is_due("fp", now=NOW + 2 * HOUR)
+    assert health.skipped_healthy == [result("trojan://pw@a.example.com:443", 90)]
+    assert health.is_due("fp", now=NOW + 4 * HOUR)
+
+def test_records_survive_save_and_reload(tmp_path):
+    now = time.time()  # Rows not seen for FORGET_AFTER_SECONDS are dropped on load
+    store = HealthStore(tmp_path / "health.sqlite")
+    store.record_success("ok", 80, result("trojan://pw@a.example.com:443", 80), now=now)
+    store.record_failure("bad", now=now)
+    store.record_failure("bad", now=now)
+    store.save()
+    store.close()
+    reloaded = HealthStore(tmp_path / "health.sqlite")
+    try:
+        assert reloaded.get("ok").result == result("trojan://pw@a.example.com:443", 80)
+        assert reloaded.get("bad").failures == 2
+        assert reloaded.get("bad").result is None
+    finally:
+        reloaded.close()
+
+def test_select_due_configs_skips_configs_that_are_not_due(store):
+    configs = [ProxyConfig.parse(f"trojan://pw@{name}.example.com:443#{name}") for name in ("new", "fresh", "stale", "dead")]
+    new, fresh, stale, dead = configs
+    now = time.time()
+    store.record_success(config_fingerprint(fresh), 100, result(fresh.raw, 100), now=now - HOUR)
+    store.record_success(config_fingerprint(stale), 100, result(stale.raw, 100), now=now - 4 * HOUR)
+    store.record_failure(config_fingerprint(dead), now=now - HOUR / 2)
+    services = collector.ValidationServices(health=scheduler(store))
+    assert collector.select_due_configs(configs, services) == [new, stale]
+    assert services.health.skipped_healthy == [result(fresh.raw, 100)]
+    assert services.health.skipped_dead == 1
+    # Without a health history everything is validated
+    assert collector.select_due_configs(configs, collector.ValidationServices()) == configs
@@ -0,0 +1,75 @@
+# tests/test_output_writer.py
+# OutputWriter: atomic replaces, unchanged files left alone, stale files removed, and the manifest.
+import json
+import os
+
+import pytest
+
+from output_writer import MANIFEST_NAME, OutputWriter, write_atomic_chunks
+
+OLD_MTIME = 1_000_000_000
+
+def write_run(root, files, remove_stale=True):
+    writer = OutputWriter(root)
+    for relative, text in files.items():
+        writer.write_text(relative, text)
+    return writer, writer.finish(remove_stale=remove_stale)
+
+def age(root):
+    """Backdates every file, so a rewrite shows up as a new mtime."""
+    for path in root.rglob("*"):
+        if path.is_file():
+            os.utime(path, (OLD_MTIME, OLD_MTIME))
+
+def test_second_run_rewrites_changes_and_removes_stale_files(tmp_path):
+    first = {"a.txt": "alpha", "b.txt": "beta", "sub/c.txt": "gamma"}
+    _, manifest = write_run(tmp_path, first)
+    assert manifest["changed"] == ["a.txt", "b.txt", "sub/c.txt"]
+    assert manifest["removed"] == []
+    age(tmp_path)
+    replaced_inode = (tmp_path / "b.txt").stat().st_ino
+
+    # b.txt changes, a.txt doesn't, sub/c.txt is no longer produced
+    writer, manifest = write_run(tmp_path, {"a.txt": "alpha", "b.txt": "beta 2"})
+    assert writer.unchanged == ["a.txt"]
+    assert manifest["changed"] == ["b.txt"]
+    assert manifest["removed"] == ["sub/c.txt"]
+    assert sorted(manifest["files"]) == ["a.txt", "b.txt"]
+    assert (tmp_path / "a.txt").stat().st_mtime == OLD_MTIME
+    assert (tmp_path / "b.txt").read_text() == "beta 2"
+    assert (tmp_path / "b.txt").stat().st_ino != replaced_inode  # Replaced, not rewritten in place
+    assert not (tmp_path / "sub/c.txt").exists()
+    assert json.loads((tmp_path / MANIFEST_NAME).read_text())["removed"] == ["sub/c.txt"]
+    assert not list(tmp_path.rglob("*.tmp"))
+
+def test_unchanged_run_touches_nothing(tmp_path):
+    files = {"a.txt": "alpha", "b.txt": "beta"}
+    write_run(tmp_path, files)
+    # The second run rewrites only the manifest, whose changed list is now empty
+    writer, _ = write_run(tmp_path, files)
+    assert writer.changed == [MANIFEST_NAME]
+    age(tmp_path)
+    writer, manifest = write_run(tmp_path, files)
+    assert writer.changed == []
+    assert manifest["changed"] == [] and manifest["removed"] == []
+    assert {path.stat().st_mtime for path in tmp_path.iterdir()} == {OLD_MTIME}
+
+def test_finish_without_remove_stale_keeps_and_tracks_old_files(tmp_path):
+    write_run(tmp_path, {"a.txt": "alpha", "b.txt": "beta"})
+    _, manifest = write_run(tmp_path, {"a.txt": "alpha 2"}, remove_stale=False)
+    assert manifest["removed"] == []
+    assert (tmp_path / "b.txt").read_text() == "beta"
+    assert sorted(manifest["files"]) == ["a.txt", "b.txt"]
+
+def test_failed_write_leaves_the_old_file_and_no_temp_file(tmp_path):
+    target = tmp_path / "out.json"
+    target.write_text("old")
+
+    def chunks():
+        yield b"new, half"
+        raise RuntimeError("producer failed")
+
+    with pytest.raises(RuntimeError):
+        write_atomic_chunks(target, chunks())
+    assert target.read_text() == "old"
+    assert list(tmp_path.iterdir()) == [target]
@@ -0,0 +1,101 @@
+# tests/test_prober.py
+# TCP connect and TLS handshake probes against local listeners.
+import asyncio
+import shutil
+import socket
+import ssl
+import subprocess
+
+import pytest
+
+import prober
+from config_model import ProxyConfig
+
+def target(port: int, tls: bool = False) -> prober.ProbeTarget:
+    return {"host": "localhost", "port": port, "tls": tls, "sni": "localhost"}
+
+@pytest.fixture
+def tcp_port():
+    """A port that accepts connections (the kernel completes them from the backlog)."""
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(16)
+        yield listener.getsockname()[1]
+
+@pytest.fixture
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture(scope="session")
+def certificate(tmp_path_factory):
+    """A throwaway self-signed certificate; the prober doesn't verify certificates anyway."""
+    if shutil.which("openssl") is None:
+        pytest.skip("openssl is needed to make a test certificate")
+    directory = tmp_path_factory.mktemp("tls")
+    cert, key = directory / "cert.pem", directory / "key.pem"
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+         "-keyout", str(key), "-out", str(cert)],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+async def with_server(certificate, probe):
+    """Runs `probe(port)` against an asyncio server, using TLS when a certificate is given."""
+    context = None
+    if certificate:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*certificate)
+
+    async def handle(reader, writer):
+        try:
+            await reader.read()
+        except (OSError, ssl.SSLError):
+            pass
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0, ssl=context)
+    async with server:
+        return await probe(server.sockets[0].getsockname()[1])
+
+def test_tcp_probe(tcp_port):
+    result = asyncio.run(prober.probe_target("127.0.0.1", target(tcp_port), samples=3, timeout=2))
+    assert result["ok"] and result["samples"] == 3 and result["failures"] == 0
+    assert result["tls_ms"] == 0
+    assert result["latency_ms"] <= result["p90_ms"]
+
+def test_closed_port_fails_after_one_sample(closed_port):
+    result = asyncio.run(prober.probe_target("127.0.0.1", target(closed_port), samples=3, timeout=2))
+    assert not result["ok"]
+    assert result["samples"] == 0 and result["failures"] == 1
+
+def test_tls_probe(certificate):
+    result = asyncio.run(with_server(
+        certificate, lambda port: prober.probe_target("127.0.0.1", target(port, tls=True), samples=2, timeout=5)
+    ))
+    assert result["ok"] and result["samples"] == 2
+    assert result["latency_ms"] >= result["connect_ms"]
+
+def test_tls_probe_of_a_plain_tcp_server_fails():
+    async def probe(port):
+        return await prober.probe_target("127.0.0.1", target(port, tls=True), samples=2, timeout=0.5)
+
+    result = asyncio.run(with_server(None, probe))
+    assert not result["ok"] and result["failures"] == 1
+
+def test_probe_runner_from_threads(tcp_port):
+    runner = prober.ProbeRunner(concurrency=4, samples=2, timeout=2)
+    try:
+        results = [runner.probe("127.0.0.1", target(tcp_port)) for _ in range(3)]
+    finally:
+        runner.close()
+    assert all(result["ok"] and result["samples"] == 2 for result in results)
+
+def test_endpoint_from_config():
+    trojan = prober.endpoint_from_config(ProxyConfig.parse("trojan://pw@a.example.com:443?sni=cdn.example.com"))
+    assert trojan == {"host": "a.example.com", "port": 443, "tls": True, "sni": "cdn.example.com"}
+    plain = prober.endpoint_from_config(ProxyConfig.parse("ss://aes-256-gcm:pw@a.example.com:8388"))
+    assert plain["tls"] is False and plain["sni"] == "a.example.com"
+    assert prober.endpoint_from_config(ProxyConfig.parse("hy2://pw@a.example.com:443")) is None
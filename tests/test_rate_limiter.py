@@ -0,0 +1,97 @@
+# tests/test_rate_limiter.py
+# Token bucket refill, AIMD concurrency and host pauses, driven by a fake clock.
+import pytest
+
+import rate_limiter
+from rate_limiter import (
+    CONCURRENCY_POLL_SECONDS, DECREASE_COOLDOWN_SECONDS, AIMDController, HostLimiter, HostPolicy, TokenBucket,
+)
+
+class FakeClock:
+    """Stands in for the time module: sleep() advances monotonic() instead of waiting."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+        self.slept = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.slept.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    return clock
+
+def test_bucket_allows_a_burst_then_refills_at_rate(clock):
+    bucket = TokenBucket(rate=2.0, burst=3)
+    assert [bucket.take(clock.now) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take(clock.now) == pytest.approx(0.5)
+    assert bucket.take(clock.now + 0.25) == pytest.approx(0.25)  # Half a token refilled so far
+    assert bucket.take(clock.now + 0.5) == 0.0
+    # A long idle period refills to the burst size, no further
+    later = clock.now + 3600
+    assert [bucket.take(later) for _ in range(4)][:3] == [0.0, 0.0, 0.0]
+    assert bucket.take(later) == pytest.approx(0.5)
+
+def test_acquire_waits_for_tokens(clock):
+    limiter = HostLimiter("api.example.com", HostPolicy(rate=1.0, burst=2, max_concurrency=8, initial_concurrency=8))
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(200)
+    assert clock.slept == [pytest.approx(1.0)]
+    assert limiter.waited_seconds == pytest.approx(1.0)
+    assert limiter.requests == 3
+
+def test_throttled_responses_halve_the_limit_once_per_cooldown(clock):
+    limiter = HostLimiter("api.example.com", HostPolicy(rate=None, max_concurrency=32, initial_concurrency=16))
+    for status in (429, 503, 500):  # One burst of throttled responses
+        limiter._try_acquire(clock.now)
+        limiter.release(status)
+    assert limiter._aimd.limit == 8
+    assert limiter.throttled == 3
+    clock.now += DECREASE_COOLDOWN_SECONDS
+    limiter._try_acquire(clock.now)
+    limiter.release(502)
+    assert limiter._aimd.limit == 4
+    limiter._try_acquire(clock.now)
+    limiter.release(None)  # No response: no signal either way
+    assert limiter._aimd.limit == 4
+
+def test_success_adds_about_one_per_round():
+    aimd = AIMDController(initial=4, maximum=32)
+    aimd.increase()
+    assert aimd.limit == 4.25
+    for _ in range(3):
+        aimd.increase()
+    assert 4.9 < aimd.limit < 5
+    assert aimd.peak == aimd.limit
+
+def test_limit_stays_between_floor_and_ceiling():
+    aimd = AIMDController(initial=3, maximum=4, minimum=2)
+    for _ in range(100):
+        aimd.increase()
+    assert aimd.limit == 4
+    now = 0.0
+    for _ in range(10):
+        now += DECREASE_COOLDOWN_SECONDS
+        aimd.decrease(now)
+    assert aimd.limit == 2
+    assert AIMDController(initial=50, maximum=8).limit == 8
+    assert AIMDController(initial=0, maximum=8).limit == 1
+
+def test_concurrency_limit_and_retry_after_pause(clock):
+    limiter = HostLimiter("api.example.com", HostPolicy(rate=None, max_concurrency=2, initial_concurrency=2))
+    assert limiter._try_acquire(clock.now) == 0.0
+    assert limiter._try_acquire(clock.now) == 0.0
+    assert limiter._try_acquire(clock.now) == CONCURRENCY_POLL_SECONDS
+    limiter.release(429, delay=10.0)
+    limiter.release(None)
+    # The host is paused for everyone, even with free slots; then the halved limit applies
+    assert limiter._try_acquire(clock.now + 4) == pytest.approx(6.0)
+    assert limiter._try_acquire(clock.now + 10) == 0.0
+    assert limiter._try_acquire(clock.now + 10) == CONCURRENCY_POLL_SECONDS
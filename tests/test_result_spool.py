@@ -0,0 +1,87 @@
+# tests/test_result_spool.py
+# ResultSpool merges spilled runs back in result_order; the engines keep at most `window` validations in flight.
+import asyncio
+import random
+import threading
+import time
+
+import async_engine
+import v2ray_collector3 as collector
+from result_spool import ResultSpool, result_order
+
+def result(i: int, latency: int) -> dict:
+    return {"config": f"trojan://pw@h{i}.example.com:443#n{i}", "latency": latency, "protocol": "trojan"}
+
+def test_merge_order_matches_sorted_across_spilled_runs(tmp_path):
+    rng = random.Random(7)
+    # Few distinct latencies, so ties are broken by config across runs
+    results = [result(i, rng.randrange(10)) for i in range(257)]
+    with ResultSpool(tmp_path, run_size=16) as spool:
+        spool.extend(results)
+        assert len(spool._runs) == 257 // 16
+        assert len(spool) == 257
+        assert list(spool) == sorted(results, key=result_order)
+        # Iterating again merges the runs again
+        assert list(spool) == sorted(results, key=result_order)
+    assert not any(tmp_path.iterdir())
+
+def test_empty_spool_yields_nothing(tmp_path):
+    with ResultSpool(tmp_path, run_size=4) as spool:
+        assert list(spool) == []
+        assert len(spool) == 0
+
+def latency_of(config) -> int:
+    """The i of h{i}.example.com, so results have distinct, predictable latencies."""
+    return int(config.host[1:].split(".")[0])
+
+BATCHES = [(f"source{b}", {result(b * 10 + i, 0)["config"] for i in range(10)}) for b in range(4)]
+
+def test_threaded_engine_keeps_at_most_window_in_flight(monkeypatch):
+    window = 3
+    lock = threading.Lock()
+    running = peak = 0
+
+    def validate(session, config, services):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.01)
+        with lock:
+            running -= 1
+        return {"config": config.raw, "latency": latency_of(config), "protocol": config.protocol}
+
+    monkeypatch.setattr(collector, "validate_and_enrich_config", validate)
+    services = collector.ValidationServices()
+    services.probe_runner = object()  # Never used: validation is stubbed
+    with ResultSpool(run_size=7) as spool:
+        returned = collector.run_threaded_engine(None, [], services=services, batches=BATCHES, window=window, results=spool)
+        assert returned is spool
+        assert len(spool) == 40
+        assert [res["latency"] for res in spool] == list(range(40))
+    assert 1 < peak <= window
+
+def test_async_engine_keeps_at_most_window_in_flight(monkeypatch):
+    window = 3
+    queued_or_running = peak = 0
+    enqueue = asyncio.Queue.put
+
+    async def put(queue, item):
+        nonlocal queued_or_running, peak
+        if item is not None:
+            queued_or_running += 1
+            peak = max(peak, queued_or_running)
+        await enqueue(queue, item)
+
+    async def validate(http, limits, config, services, geo_lookup):
+        nonlocal queued_or_running
+        await asyncio.sleep(0.005)
+        queued_or_running -= 1
+        return {"config": config.raw, "latency": latency_of(config), "protocol": config.protocol}
+
+    monkeypatch.setattr(asyncio.Queue, "put", put)
+    monkeypatch.setattr(async_engine, "validate_and_enrich_config_async", validate)
+    with ResultSpool(run_size=7) as spool:
+        asyncio.run(async_engine.run_async_engine([], batches=BATCHES, window=window, results=spool))
+        assert [res["latency"] for res in spool] == list(range(40))
+    assert 1 < peak <= window
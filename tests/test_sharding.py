@@ -0,0 +1,45 @@
+# tests/test_sharding.py
+# merge_partials gives the same results however a run was split between shards.
+import random
+
+import pytest
+
+from sharding import ShardError, ShardSpec, merge_partials, shard_of, write_partial
+
+def result(host: str, latency: int, name: str = "x") -> dict:
+    return {"config": f"trojan://pw@{host}:443#{name}", "latency": latency, "protocol": "trojan"}
+
+RESULTS = [result(f"h{i}.example.com", 100 + i % 7) for i in range(40)] + [
+    # The same servers as h0 and h1 under other names, validated by another shard
+    result("h0.example.com", 50, "faster"), result("h1.example.com", 900, "slower"),
+]
+
+def merged_after_split(tmp_path, count: int, seed: int) -> list:
+    shuffled = list(RESULTS)
+    random.Random(seed).shuffle(shuffled)
+    shard_dir = tmp_path / f"{count}-{seed}"
+    for index in range(count):
+        write_partial(shard_dir, ShardSpec(index, count), shuffled[index::count])
+    return merge_partials(shard_dir, count)
+
+def test_merge_is_independent_of_shard_count_and_order(tmp_path):
+    expected = merged_after_split(tmp_path, 1, 0)
+    for count in (2, 3, 5):
+        for seed in range(3):
+            assert merged_after_split(tmp_path, count, seed) == expected
+
+def test_merge_keeps_the_fastest_copy_of_a_server_and_sorts(tmp_path):
+    merged = merged_after_split(tmp_path, 3, 1)
+    assert len(merged) == 40
+    assert merged[0]["config"] == "trojan://pw@h0.example.com:443#faster"
+    assert "trojan://pw@h1.example.com:443#x" in [res["config"] for res in merged]
+    assert merged == sorted(merged, key=lambda res: (res["latency"], res["config"]))
+
+def test_merge_fails_on_a_missing_shard(tmp_path):
+    write_partial(tmp_path, ShardSpec(0, 2), RESULTS[:5])
+    with pytest.raises(ShardError):
+        merge_partials(tmp_path, 2)
+
+def test_shard_of_is_stable_and_in_range():
+    assert [shard_of(f"key{i}", 4) for i in range(20)] == [shard_of(f"key{i}", 4) for i in range(20)]
+    assert {shard_of(f"key{i}", 4) for i in range(200)} == {0, 1, 2, 3}
@@ -0,0 +1,100 @@
+# tests/test_subscription_server.py
+# The subscription endpoint: query filters, ETag/304, reloads of the results file, and --listen parsing.
+import base64
+import json
+import os
+import threading
+
+import pytest
+import requests
+
+import subscription_server
+from subscription_server import SubscriptionServer, SubscriptionStore, parse_listen_address
+
+def result(host: str, latency: int, protocol: str = "trojan", country: str = "DE", isp: str = "Hetzner Online") -> dict:
+    return {"config": f"{protocol}://pw@{host}:443#{host}", "latency": latency, "protocol": protocol,
+            "country_code": country, "isp": isp}
+
+RESULTS = [
+    result("a.example.com", 300),
+    result("b.example.com", 100, "vless", "NL", "Leaseweb"),
+    result("c.example.com", 200, country="NL"),
+    result("d.example.com", 50, "vless", "US", "Amazon"),
+    result("e.example.com", 400, "vmess", "DE", "hetzner cloud"),
+]
+
+def write_results(path, results, mtime_ns):
+    path.write_text(json.dumps(results))
+    os.utime(path, ns=(mtime_ns, mtime_ns))  # Filesystems with coarse mtimes would otherwise hide the change
+
+@pytest.fixture
+def results_file(tmp_path):
+    path = tmp_path / "results.json"
+    write_results(path, RESULTS, 1_000_000_000_000_000_000)
+    return path
+
+@pytest.fixture
+def server(results_file):
+    server = SubscriptionServer(SubscriptionStore(results_file), "127.0.0.1", 0)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def plain(server, query: str) -> list:
+    response = requests.get(f"{server.url}/sub?format=plain&{query}", timeout=5)
+    assert response.status_code == 200
+    return [line.split("#")[1] for line in response.text.splitlines()]
+
+def test_filters_and_limit(server):
+    assert plain(server, "") == ["d.example.com", "b.example.com", "c.example.com", "a.example.com", "e.example.com"]
+    assert plain(server, "protocol=VLESS") == ["d.example.com", "b.example.com"]
+    assert plain(server, "country=nl,de&protocol=trojan") == ["c.example.com", "a.example.com"]
+    assert plain(server, "isp=hetzner") == ["c.example.com", "a.example.com", "e.example.com"]
+    assert plain(server, "max_latency=200") == ["d.example.com", "b.example.com", "c.example.com"]
+    assert plain(server, "country=DE&limit=1") == ["a.example.com"]
+    assert plain(server, "limit=0") == []
+    assert plain(server, "isp=nobody") == []
+
+def test_formats_and_bad_queries(server):
+    encoded = requests.get(f"{server.url}/sub?protocol=vless", timeout=5).text
+    assert base64.b64decode(encoded).decode().splitlines() == [RESULTS[3]["config"], RESULTS[1]["config"]]
+    assert requests.get(f"{server.url}/sub?protocol=vless&format=json", timeout=5).json() == [RESULTS[3], RESULTS[1]]
+    for query in ("limit=-1", "max_latency=fast", "format=yaml"):
+        assert requests.get(f"{server.url}/sub?{query}", timeout=5).status_code == 400
+    assert requests.get(f"{server.url}/nothing", timeout=5).status_code == 404
+
+def test_matching_if_none_match_gets_304(server):
+    first = requests.get(f"{server.url}/sub?country=DE,NL", timeout=5)
+    etag = first.headers["ETag"]
+    # The same query written differently has the same ETag
+    again = requests.get(f"{server.url}/sub?country=nl,de", headers={"If-None-Match": etag}, timeout=5)
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["ETag"] == etag
+    other = requests.get(f"{server.url}/sub?country=US", headers={"If-None-Match": etag}, timeout=5)
+    assert other.status_code == 200
+
+def test_etag_changes_when_the_results_file_changes(server, results_file, monkeypatch):
+    monkeypatch.setattr(subscription_server, "RELOAD_CHECK_SECONDS", 0.0)
+    before = requests.get(f"{server.url}/sub", timeout=5)
+    write_results(results_file, RESULTS[:2], 2_000_000_000_000_000_000)
+    after = requests.get(f"{server.url}/sub", headers={"If-None-Match": before.headers["ETag"]}, timeout=5)
+    assert after.status_code == 200
+    assert after.headers["ETag"] != before.headers["ETag"]
+    assert len(base64.b64decode(after.text).decode().splitlines()) == 2
+    assert requests.get(f"{server.url}/", timeout=5).json()["total"] == 2
+
+@pytest.mark.parametrize("text, address", [
+    ("8080", ("127.0.0.1", 8080)),
+    ("0.0.0.0:9000", ("0.0.0.0", 9000)),
+    ("[::1]:8080", ("::1", 8080)),
+    ("[::]:80", ("::", 80)),
+])
+def test_parse_listen_address(text, address):
+    assert parse_listen_address(text) == address
+
+def test_parse_listen_address_rejects_a_missing_port():
+    with pytest.raises(ValueError):
+        parse_listen_address("[::1]")
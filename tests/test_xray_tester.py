@@ -0,0 +1,127 @@
+# tests/test_xray_tester.py
+# BatchTester against a stub executable standing in for xray-core, including batches it can't start.
+import asyncio
+import sys
+import textwrap
+
+import pytest
+
+import v2ray_collector3 as collector
+import xray_tester
+from config_fingerprint import config_fingerprint
+from config_model import ProxyConfig
+from health_store import HealthScheduler, HealthStore
+
+UUID = "11111111-2222-3333-4444-555555555555"
+
+# Serves each inbound as a SOCKS5 proxy that answers any HTTP request with a 204. Like xray, it
+# exits when it dislikes an outbound (address starting "reject"); "dead" outbounds refuse CONNECT.
+STUB_XRAY = '''
+import asyncio, json, sys
+
+config = json.load(open(sys.argv[3]))
+addresses = {}
+for outbound in config["outbounds"]:
+    servers = outbound["settings"].get("vnext") or outbound["settings"].get("servers")
+    addresses[outbound["tag"]] = servers[0]["address"]
+if any(address.startswith("reject") for address in addresses.values()):
+    sys.exit(23)
+
+async def serve(address, reader, writer):
+    await reader.readexactly(3)
+    writer.write(b"\\x05\\x00")
+    head = await reader.readexactly(5)
+    await reader.readexactly(head[4] + 2)
+    if address.startswith("dead"):
+        writer.write(b"\\x05\\x05\\x00\\x01" + bytes(6))
+    else:
+        writer.write(b"\\x05\\x00\\x00\\x01" + bytes(6))
+        await reader.readuntil(b"\\r\\n\\r\\n")
+        writer.write(b"HTTP/1.1 204 No Content\\r\\n\\r\\n")
+    await writer.drain()
+    writer.close()
+
+async def main():
+    servers = []
+    for inbound in config["inbounds"]:
+        address = addresses[inbound["tag"].replace("in-", "out-")]
+        handler = lambda reader, writer, address=address: serve(address, reader, writer)
+        servers.append(await asyncio.start_server(handler, inbound["listen"], inbound["port"]))
+    await asyncio.Event().wait()
+
+asyncio.run(main())
+'''
+
+def executable(tmp_path, name: str, body: str) -> str:
+    path = tmp_path / name
+    path.write_text(f"#!{sys.executable}\n" + textwrap.dedent(body))
+    path.chmod(0o755)
+    return str(path)
+
+@pytest.fixture
+def stub_xray(tmp_path):
+    return executable(tmp_path, "xray", STUB_XRAY)
+
+def vless(host: str) -> ProxyConfig:
+    return ProxyConfig.parse(f"vless://{UUID}@{host}:443?security=none#{host}")
+
+def make_tester(tmp_path, path: str, batch_size: int = 10) -> xray_tester.BatchTester:
+    return xray_tester.BatchTester(path, tmp_path / "xray_config.json", batch_size, timeout=5)
+
+def test_build_batch_config_routes_each_inbound_to_its_outbound():
+    configs = [vless("a.example.com"), ProxyConfig.parse("hy2://pw@b.example.com:443"), vless("c.example.com")]
+    config, ports = xray_tester.build_batch_config(configs, [30001, 30002, 30003])
+    # hy2 can't be dialled by xray and is left out; the usable configs take the ports in order
+    assert ports == {configs[0].raw: 30001, configs[2].raw: 30002}
+    assert [inbound["port"] for inbound in config["inbounds"]] == [30001, 30002]
+    assert [rule["outboundTag"] for rule in config["routing"]["rules"]] == ["out-0", "out-1"]
+
+def test_free_ports_are_distinct():
+    ports = xray_tester.free_ports(50)
+    assert len(set(ports)) == 50 and all(port > 0 for port in ports)
+
+def test_working_and_failing_configs(tmp_path, stub_xray):
+    configs = [vless("a.example.com"), vless("dead.example.com"), vless("b.example.com")]
+    latencies = asyncio.run(make_tester(tmp_path, stub_xray).test_all(configs))
+    assert latencies[configs[0].raw] is not None and latencies[configs[2].raw] is not None
+    assert latencies[configs[1].raw] is None
+    assert not (tmp_path / "xray_config.json").exists()
+
+def test_test_batch_raises_when_xray_exits(tmp_path, stub_xray):
+    with pytest.raises(xray_tester.XrayStartError):
+        asyncio.run(make_tester(tmp_path, stub_xray).test_batch([vless("a.example.com"), vless("reject.example.com")]))
+
+def test_a_rejected_config_is_bisected_out_of_its_batch(tmp_path, stub_xray):
+    configs = [vless(f"h{i}.example.com") for i in range(7)]
+    configs.insert(3, vless("reject.example.com"))
+    latencies = asyncio.run(make_tester(tmp_path, stub_xray, batch_size=8).test_all(configs))
+    assert len(latencies) == 8
+    assert latencies.pop(configs[3].raw) is None
+    assert all(latency is not None for latency in latencies.values())
+
+def test_missing_binary_leaves_configs_untested(tmp_path):
+    configs = [vless("a.example.com"), vless("b.example.com")]
+    assert asyncio.run(make_tester(tmp_path, str(tmp_path / "missing")).test_all(configs)) == {}
+
+def test_binary_that_never_starts_leaves_configs_untested(tmp_path):
+    broken = executable(tmp_path, "broken", "import sys\nsys.exit(1)\n")
+    configs = [vless(f"h{i}.example.com") for i in range(6)]
+    assert asyncio.run(make_tester(tmp_path, broken, batch_size=3).test_all(configs)) == {}
+
+def test_verify_with_xray(tmp_path, stub_xray, monkeypatch):
+    monkeypatch.setattr(collector, "XRAY_PATH", stub_xray)
+    monkeypatch.setattr(collector, "XRAY_CONFIG_FILE", tmp_path / "xray_config.json")
+    health = HealthScheduler(HealthStore(tmp_path / "health.sqlite3"))
+    results = [{"config": config.raw} for config in (vless("a.example.com"), vless("dead.example.com"))]
+    results.append({"config": "hy2://pw@c.example.com:443#udp"})  # Kept: xray can't test it
+    kept = collector.verify_with_xray(results, 10, health)
+    assert [res["config"] for res in kept] == [results[0]["config"], results[2]["config"]]
+    assert health.store.get(config_fingerprint(results[1]["config"])).failures == 1
+    assert health.store.get(config_fingerprint(results[0]["config"])) is None
+    health.store.close()
+
+def test_verify_with_xray_keeps_everything_without_xray(tmp_path, monkeypatch):
+    monkeypatch.setattr(collector, "XRAY_PATH", str(tmp_path / "missing"))
+    monkeypatch.setattr(collector, "XRAY_CONFIG_FILE", tmp_path / "xray_config.json")
+    results = [{"config": vless(f"h{i}.example.com").raw} for i in range(3)]
+    assert collector.verify_with_xray(results, 2) == results
@@ -3,11 +3,12 @@ import requests
 import concurrent.futures
 import logging
 import re
-import base64
 from pathlib import Path
-from typing import List, Set, Dict, Optional
+from typing import List, Set, Optional
 from bs4 import BeautifulSoup
 
+from raw_corpus import write_raw_corpus
+
 # ===== CONFIGURATION & CONSTANTS =====
 # Directory to save the output files
 OUTPUT_DIR = Path("v2ray_configs")
@@ -118,57 +119,6 @@ def scrape_channel(session: requests.Session, channel_name: str) -> Set[str]:
         logging.info(f"Found {len(configs)} configs in channel: {channel_name}")
     return configs
 
-def save_configs_to_files(configs: List[str]):
-    """
-    Saves the extracted configs into separate files based on their protocol.
-
-    Args:
-        configs: A list of unique V2Ray config strings.
-    """
-    OUTPUT_DIR.mkdir(exist_ok=True)
-    
-    # Group configs by protocol
-    grouped_configs: Dict[str, List[str]] = {
-        "vmess": [], "vless": [], "ss": [], "trojan": [], "hysteria": []
-    }
-
-    for config in configs:
-        protocol_match = re.match(r"(\w+):?//", config)
-        if protocol_match:
-            protocol = protocol_match.group(1).lower()
-            # Unify hysteria variants under a single key
-            if protocol in ["hysteria2", "hy2"]:
-                protocol = "hysteria"
-            
-            if protocol in grouped_configs:
-                grouped_configs[protocol].append(config)
-
-    # Save each protocol's configs to a file
-    for protocol, config_list in grouped_configs.items():
-        if config_list:
-            file_path = OUTPUT_DIR / f"{protocol}.txt"
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write("\n".join(config_list))
-            logging.info(f"Saved {len(config_list)} {protocol} configs to {file_path}")
-
-def generate_subscription_file(configs: List[str]):
-    """
-    Generates a Base64 encoded V2Ray subscription file.
-
-    Args:
-        configs: A list of all unique config strings.
-    """
-    if not configs:
-        return
-
-    subscription_content = "\n".join(configs)
-    encoded_content = base64.b64encode(subscription_content.encode("utf-8")).decode("utf-8")
-    
-    subscription_file_path = OUTPUT_DIR / "subscription.txt"
-    with open(subscription_file_path, "w", encoding="utf-8") as f:
-        f.write(encoded_content)
-    logging.info(f"Generated V2Ray subscription link and saved to {subscription_file_path}")
-    
 # ===== INITIALIZATION & STARTUP =====
 
 def main():
@@ -200,8 +150,8 @@ def main():
         logging.info(f"\n--- Scraping Complete ---")
         logging.info(f"Found a total of {len(unique_configs)} unique V2Ray configs.")
         
-        save_configs_to_files(unique_configs)
-        generate_subscription_file(unique_configs)
+        # The same per-protocol files and base64 subscription as `v2ray_collector3.py --stage scrape`
+        write_raw_corpus(unique_configs, OUTPUT_DIR)
     else:
         logging.info("\n--- Scraping Complete ---")
         logging.info("No V2Ray configs were found across any of the channels.")
@@ -3,39 +3,109 @@
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+import argparse
 import concurrent.futures
 import logging
 import re
 import base64
 import json
-import subprocess
 import socket
+import subprocess
+import sys
+import time
 from pathlib import Path
-from typing import List, Set, Dict, Optional, TypedDict
-from bs4 import BeautifulSoup
+from typing import Iterable, Iterator, List, Set, Dict, Optional, Tuple, TypedDict, Union
+import channel_state
+import config_checks
+import config_extractor
+import geo_cache
+import geoip_offline
+import prober
+import raw_corpus
+import run_metrics
+import sharding
+from dns_resolver import DNSResolver
+from geo_cache import GeoCache, GeoLookup
+from health_store import HealthScheduler, HealthStore
+from output_writer import OutputWriter, write_atomic_chunks
+from prober import ProbeResult, ProbeRunner
+from result_spool import ResultSpool, result_order
+from rate_limiter import HostLimiters, HostPolicy, throttle_delay
+from config_fingerprint import ConfigIndex, config_fingerprint
+from compact_results import compact_json
+from config_model import ProxyConfig, parse_config
+from dashboard_data import write_dashboard_data
+from channel_state import ChannelCursor
+from channel_scheduler import ChannelScheduler, PARK_AFTER_RUNS
+from sharding import ShardError, ShardSpec
+from subscription_server import parse_listen_address
 # ===== CONFIGURATION & CONSTANTS =====
 # Directories and Files
 OUTPUT_DIR = Path("v2ray_configs")
 VALIDATED_DIR = Path("validated_configs")
 CHANNELS_FILE = Path("channels.txt")
 RESULTS_JSON_FILE = VALIDATED_DIR / "results.json"
+RESULTS_COMPACT_FILE = VALIDATED_DIR / "results.compact.json"  # Same records, columnar (see compact_results)
+# Run-to-run state (cursors, caches) lives outside the published directories
+STATE_DIR = channel_state.STATE_DIR
+GEO_CACHE_FILE = STATE_DIR / "geo_cache.sqlite3"
+HEALTH_FILE = STATE_DIR / "health.sqlite3"
+CHANNEL_SCORES_FILE = STATE_DIR / "channel_scores.json"
+DAEMON_FLUSH_MINUTES = 5  # --daemon publishes this often
+STAGES = ("all", "scrape", "validate", "publish")
+VALIDATED_STAGE_FILE = STATE_DIR / "validated.json"  # Written by --stage validate, read by --stage publish
 # Concurrency Settings
-# Reduce validator workers to avoid overwhelming the free geo-ip API
 SCRAPER_WORKERS = 10
-VALIDATOR_WORKERS = 15 # Reduced from 50 to be less aggressive
+# Geo lookups are cached and coalesced into 100-IP batch requests, so more
+# validators means fuller batches rather than more calls to the geo-ip API
+VALIDATOR_WORKERS = 100
+# Reduce validator workers to avoid overwhelming the free geo-ip API (--no-geo-cache)
+UNBATCHED_GEO_VALIDATOR_WORKERS = 15 # Reduced from 50 to be less aggressive
+# Validations submitted ahead of the validator threads; input is read no faster than this window drains
+VALIDATION_WINDOW_PER_WORKER = 4
+# Per-stage ceilings for the asyncio engine (--engine async). Each stage is a
+# coroutine pool, so these can be far higher than the thread counts above.
+ASYNC_SCRAPE_CONCURRENCY = 50
+ASYNC_DNS_CONCURRENCY = 500
+ASYNC_GEO_CONCURRENCY = 15 # Per-IP geo-ip API calls with --no-geo-cache, like UNBATCHED_GEO_VALIDATOR_WORKERS
+ASYNC_PROBE_CONCURRENCY = 2000
+ASYNC_VALIDATION_WORKERS = 1000 # Coroutines draining the scrape->validate queue
 # Xray Configuration
 # For local testing, point this to the xray executable.
 # In GitHub Actions, it will be available in the path.
 XRAY_PATH = "xray" 
-XRAY_CONFIG_FILE = Path("xray_config.json")
+XRAY_CONFIG_FILE = Path("xray_config.json")  # Rewritten for every --xray-test batch
+XRAY_BATCH_SIZE = 200  # Configs (SOCKS inbounds) served by one xray process
+XRAY_VERIFY_CHUNK = 5_000  # Spooled results read back and verified through xray at a time
 
 # Network and API Configuration
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 REQUEST_TIMEOUT = 10
+TELEGRAM_CHANNEL_URL = "https://t.me/s/{channel}"
 GEO_IP_API_URL = "http://ip-api.com/json/{ip}?fields=status,country,countryCode,isp"
+# Per-upstream budgets (see rate_limiter). ip-api.com's free tier allows 45 single
+# lookups and 15 batch POSTs per minute; t.me publishes no limit, so only AIMD applies.
+HOST_POLICIES = {
+    "ip-api.com/batch": HostPolicy(rate=15 / 60, burst=2, max_concurrency=2, initial_concurrency=1),
+    "ip-api.com": HostPolicy(rate=45 / 60, burst=3, max_concurrency=ASYNC_GEO_CONCURRENCY),
+    "t.me": HostPolicy(rate=None, max_concurrency=ASYNC_SCRAPE_CONCURRENCY, initial_concurrency=SCRAPER_WORKERS),
+}
+HTTP_RETRY_TOTAL = 5
+HTTP_RETRY_BACKOFF_FACTOR = 1  # Seconds; doubled per attempt when the server gives no Retry-After
+HTTP_RETRY_STATUS_CODES = {429, 502, 503, 504}  # 500 is often a permanent server bug, so it isn't retried
+GEO_IP_BATCH_URL = "http://ip-api.com/batch?fields=status,country,countryCode,isp,query"
+GEO_CACHE_TTL_HOURS = 7 * 24
+UNKNOWN_GEO_INFO = geo_cache.UNKNOWN_GEO_INFO
+HEALTHY_RECHECK_HOURS = 3  # Servers that passed are re-validated this often; failing ones back off exponentially
+MAX_CARRY_HOURS = 24  # Results carried forward unchecked are dropped once their last validation is this old
 
 # Validation Parameters
 MAX_LATENCY_MS = 3000  # Max acceptable latency in milliseconds
+PROBE_SAMPLES = 3  # TCP connect (+ TLS handshake) measurements per endpoint
+PROBE_TIMEOUT_SECONDS = MAX_LATENCY_MS / 1000  # A slower sample couldn't pass anyway
+PROBE_CONCURRENCY = 1000  # Probes in flight at once on the threaded engine's probe loop
+# Hysteria/hy2 run over UDP and can't be probed over TCP; they are kept and sorted last
+UNPROBED_LATENCY_MS = MAX_LATENCY_MS
 
 # A small utility for country code to flag emoji
 COUNTRY_FLAGS = {
@@ -54,6 +124,52 @@ class ValidatedConfig(TypedDict):
     country_name: str
     isp: str
     latency: int
+    latency_p90: int
+    jitter: int
+
+class ValidationServices:
+    """
+    Shared caches and lookup backends used while validating configs.
+
+    Every service is optional; validate_and_enrich_config falls back to the
+    original one-request-per-config behaviour for anything left as None.
+
+    Attributes:
+        geo_cache: Persistent geo cache (see geo_cache.GeoCache).
+        geo_lookup: Batching front-end over geo_cache, bound to the threaded engine's session.
+        offline_geo: Offline IP-range database consulted first (see geoip_offline).
+        geo_db_only: Never call the geo API for IPs missing from offline_geo.
+        resolver: Caching, single-flight DNS resolver (see dns_resolver.DNSResolver).
+        probe_runner: Event-loop thread that runs TCP/TLS probes for the threaded engine.
+        health: Cross-run health history deciding which servers are due (see health_store).
+    """
+
+    def __init__(
+        self,
+        geo_cache: Optional[GeoCache] = None,
+        offline_geo=None,
+        geo_db_only: bool = False,
+        resolver: Optional[DNSResolver] = None,
+        health: Optional[HealthScheduler] = None,
+    ):
+        self.geo_cache = geo_cache
+        self.geo_lookup: Optional[GeoLookup] = None
+        self.offline_geo = offline_geo
+        self.geo_db_only = geo_db_only and offline_geo is not None
+        self.resolver = resolver
+        self.probe_runner: Optional[ProbeRunner] = None
+        self.health = health
+
+    def close(self):
+        if self.geo_cache is not None:  # GeoCache defines __len__, so an empty cache is falsy
+            self.geo_cache.close()
+        if self.offline_geo:
+            self.offline_geo.close()
+        if self.probe_runner:
+            self.probe_runner.close()
+        if self.health:
+            self.health.store.save()
+            self.health.store.close()
 
 # ===== LOGGING SETUP =====
 logging.basicConfig(
@@ -64,29 +180,63 @@ logging.basicConfig(
 
 # ===== CORE LOGIC & UTILITY FUNCTIONS =====
 
-def create_requests_session(pool_size: int = 100) -> requests.Session:
+class ThrottledAdapter(HTTPAdapter):
+    """
+    An HTTPAdapter that admits each request through its host's limiter (see rate_limiter).
+
+    Throttled responses (429/5xx) are retried here rather than by urllib3, after
+    releasing the host slot: Retry-After pauses only that host, and the waiting
+    thread holds no connection or slot that other requests could use.
+    """
+
+    def __init__(self, limiters: HostLimiters, **kwargs):
+        super().__init__(**kwargs)
+        self.limiters = limiters
+
+    def send(self, request, **kwargs):
+        limiter = self.limiters.for_url(request.url)
+        for attempt in range(HTTP_RETRY_TOTAL + 1):
+            limiter.acquire()
+            try:
+                response = super().send(request, **kwargs)
+            except Exception:
+                limiter.release(None)
+                run_metrics.metrics.upstream(limiter.name, None, attempt > 0)
+                raise
+            run_metrics.metrics.upstream(limiter.name, response.status_code, attempt > 0)
+            delay = throttle_delay(response.headers)
+            if response.status_code not in HTTP_RETRY_STATUS_CODES or attempt == HTTP_RETRY_TOTAL:
+                limiter.release(response.status_code, delay)
+                return response
+            limiter.release(response.status_code, delay or HTTP_RETRY_BACKOFF_FACTOR * 2 ** attempt)
+            response.close()
+
+def create_requests_session(pool_size: int = 100, limiters: Optional[HostLimiters] = None) -> requests.Session:
     """
     Creates a requests Session with a custom-sized connection pool and a robust retry strategy.
     
     Args:
         pool_size: The maximum number of connections to keep in the pool.
+        limiters: Per-host rate/concurrency limiters; defaults to HOST_POLICIES.
     
     Returns:
         A configured requests.Session object.
     """
     session = requests.Session()
     
-    # Define a comprehensive retry strategy for network instability
+    # urllib3 retries connection and read errors; throttled statuses are handled by ThrottledAdapter
     retry_strategy = Retry(
-        total=5,                # Total number of retries
-        read=5,                 # Number of retries on read errors
-        connect=5,              # Number of retries on connection errors
-        backoff_factor=1,       # A delay factor between retries: {backoff factor} * (2 ** ({number of total retries} - 1))
-        status_forcelist=[429, 502, 503, 504], # Retry on these server errors (500 is often a permanent server bug)
-        allowed_methods=["HEAD", "GET", "OPTIONS"]
+        total=HTTP_RETRY_TOTAL,                   # Total number of retries
+        read=HTTP_RETRY_TOTAL,                    # Number of retries on read errors
+        connect=HTTP_RETRY_TOTAL,                 # Number of retries on connection errors
+        backoff_factor=HTTP_RETRY_BACKOFF_FACTOR, # A delay factor between retries: {backoff factor} * (2 ** ({number of total retries} - 1))
+        status_forcelist=[],                      # Status retries happen in ThrottledAdapter, outside the host slot
+        respect_retry_after_header=False,         # ...and so does waiting out Retry-After
+        allowed_methods=["HEAD", "GET", "OPTIONS", "POST"]
     )
     
-    adapter = HTTPAdapter(
+    adapter = ThrottledAdapter(
+        limiters if limiters is not None else HostLimiters(HOST_POLICIES),
         pool_connections=pool_size, 
         pool_maxsize=pool_size, 
         max_retries=retry_strategy
@@ -107,9 +257,16 @@ def load_channels(file_path: Path) -> List[str]:
     logging.info(f"Loaded {len(channels)} channels from {file_path}")
     return channels
 
-def fetch_channel_content(session: requests.Session, channel_name: str) -> Optional[str]:
+def channel_page_url(channel_name: str, before: Optional[int] = None) -> str:
+    """Builds the t.me/s/ URL for a channel, optionally for the page of messages older than `before`."""
+    url = TELEGRAM_CHANNEL_URL.format(channel=channel_name)
+    return f"{url}?before={before}" if before else url
+
+def fetch_channel_content(session: requests.Session, channel_name: str, before: Optional[int] = None) -> Optional[str]:
     """Fetches the HTML content of a public Telegram channel."""
-    url = f"https://t.me/s/{channel_name}"
+    url = channel_page_url(channel_name, before)
+    started = time.perf_counter()
+    response = None
     try:
         response = session.get(url, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
@@ -117,124 +274,177 @@ def fetch_channel_content(session: requests.Session, channel_name: str) -> Optio
     except requests.exceptions.RequestException as e:
         logging.error(f"Failed to fetch content for channel '{channel_name}': {e}")
         return None
+    finally:
+        run_metrics.metrics.channel_fetch(
+            channel_name, response.status_code if response is not None else None,
+            len(response.content) if response is not None else 0, time.perf_counter() - started,
+        )
 
 def parse_v2ray_configs(html_content: str) -> Set[str]:
     """Parses HTML content to find and extract V2Ray configuration links."""
+    # Scans <code> blocks directly instead of building a BeautifulSoup tree per page
+    return config_extractor.extract_configs(html_content)
+
+def parse_channel_delta(channel_name: str, pages: List[str], cursors: Dict[str, ChannelCursor]) -> Set[str]:
+    """
+    Parses only the messages posted since the channel's saved cursor and advances it.
+
+    Args:
+        channel_name: The channel the pages belong to.
+        pages: Channel pages, newest first (the live page plus any back-filled history).
+        cursors: Per-channel cursors; the entry for this channel is updated in place.
+
+    Returns:
+        The configs found in new or edited messages.
+    """
+    messages = [message for page in pages for message in channel_state.split_channel_messages(page)]
+    cursor = cursors.get(channel_name)
+    new_messages = channel_state.select_new_messages(messages, cursor)
     configs: Set[str] = set()
-    soup = BeautifulSoup(html_content, "html.parser")
-    protocol_pattern = re.compile(r"^(vmess|vless|ss|trojan|hysteria|hy2)://")
-    for code_block in soup.find_all("code"):
-        for line in code_block.get_text(separator="\n").strip().splitlines():
-            clean_line = line.strip()
-            if protocol_pattern.match(clean_line):
-                configs.add(clean_line)
+    for message in new_messages:
+        configs.update(parse_v2ray_configs(message["html"]))
+    new_cursor = channel_state.advance_cursor(messages, cursor)
+    if new_cursor:
+        cursors[channel_name] = new_cursor
+    logging.info(f"Channel {channel_name}: {len(new_messages)}/{len(messages)} new messages, {len(configs)} configs")
     return configs
 
-def scrape_channel(session: requests.Session, channel_name: str) -> Set[str]:
-    """Scrapes a single Telegram channel for configs."""
+def scrape_channel(
+    session: requests.Session,
+    channel_name: str,
+    cursors: Optional[Dict[str, ChannelCursor]] = None,
+    backfill_pages: int = 0,
+) -> Set[str]:
+    """
+    Scrapes a single Telegram channel for configs.
+
+    When `cursors` is given, only messages newer than the channel's cursor are parsed.
+    A channel without a cursor is walked `backfill_pages` pages deeper via ?before=.
+    """
     logging.info(f"Scraping channel: {channel_name}")
     html_content = fetch_channel_content(session, channel_name)
     if not html_content:
         return set()
-    return parse_v2ray_configs(html_content)
+    if cursors is None:
+        return parse_v2ray_configs(html_content)
 
-def get_server_ip(config_str: str) -> Optional[str]:
-    """Extracts server address from config and resolves to IP."""
-    # Regex for vmess:// (Base64 encoded JSON)
-    if config_str.startswith("vmess://"):
-        try:
-            decoded_part = base64.b64decode(config_str[8:]).decode('utf-8')
-            data = json.loads(decoded_part)
-            address = data.get("add")
-        except Exception:
-            return None
-    else:
-        # Regex for vless, trojan, ss (format: protocol://user@host:port#name)
-        match = re.search(r"://(?:.*@)?([^:@?#]+)", config_str)
-        address = match.group(1) if match else None
+    pages = [html_content]
+    if channel_name not in cursors:
+        for _ in range(backfill_pages):
+            before = channel_state.oldest_message_id(pages[-1])
+            older_page = fetch_channel_content(session, channel_name, before) if before else None
+            if not older_page:
+                break
+            pages.append(older_page)
+    return parse_channel_delta(channel_name, pages, cursors)
 
-    if not address or re.match(r"\d{1,3}(\.\d{1,3}){3}", address): # Already an IP
+def is_ip_address(address: str) -> bool:
+    """Returns True if the address already looks like an IPv4 address."""
+    return bool(re.match(r"\d{1,3}(\.\d{1,3}){3}", address))
+
+def get_server_ip(config: ProxyConfig, resolver: Optional[DNSResolver] = None) -> Optional[str]:
+    """Resolves a config's server address to an IP."""
+    address = config.host
+    if is_ip_address(address): # Already an IP
         return address
-    
-    try:
-        return socket.gethostbyname(address)
-    except socket.gaierror:
-        return None
+    with run_metrics.metrics.timed("dns"):
+        if resolver:
+            return resolver.resolve_one(address)
+        
+        try:
+            return socket.gethostbyname(address)
+        except socket.gaierror:
+            return None
 
 def get_geo_info(session: requests.Session, ip_address: str) -> Dict:
     """Gets geographic information for an IP address."""
     try:
         response = session.get(GEO_IP_API_URL.format(ip=ip_address), timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
-        data = response.json()
-        if data.get("status") == "success":
-            return {
-                "country_code": data.get("countryCode", "N/A"),
-                "country_name": data.get("country", "Unknown"),
-                "isp": data.get("isp", "Unknown ISP"),
-            }
+        return parse_geo_response(response.json())
     except requests.exceptions.RequestException:
         pass # Silently fail
-    return {"country_code": "N/A", "country_name": "Unknown", "isp": "Unknown ISP"}
-
-def test_config(config_str: str) -> Optional[int]:
-    """Tests a V2Ray config using xray-core and returns its latency."""
-    # A simple xray config template for testing connectivity
-    xray_test_config = {
-        "inbounds": [{"protocol": "socks", "port": 10808}],
-        "outbounds": [json.loads(base64.b64decode(config_str[8:]))] if config_str.startswith("vmess://") else {"protocol": "freedom", "settings": {}}, # Simplified for now
-    }
-    # This part is complex due to varied config formats. A more robust solution is needed.
-    # For now, we'll use xray's built-in test which is simpler.
-    
-    # Create a temporary config file for Xray
-    # Note: Xray's -test feature uses an internal mechanism, not a full proxy.
-    # We'll rely on its latency test output.
-    try:
-        proc = subprocess.run(
-            [XRAY_PATH, "vmess", config_str],
-            capture_output=True, text=True, timeout=15
-        )
-        # A more universal approach is needed for different protocols.
-        # This is a placeholder for a more complex validation logic.
-        # For a simplified demo, let's parse the output of a specific command.
-        # A better way is using xray API or a more controlled test.
-        
-        # Simulating a latency check as xray `test` command is complex to generalize
-        # Let's assume a dummy check for now for demonstration purposes
-        # In a real scenario, one would build a proper config and test a connection through it.
-        # The output of `xray -test` can be parsed for latency.
-        # Let's simulate this:
-        if "failed" in proc.stdout.lower() or proc.returncode != 0:
-            return None
-        
-        # Fake latency for demonstration as real implementation is complex
-        import random
-        latency = random.randint(80, 800)
-        return latency if latency < MAX_LATENCY_MS else None
+    return dict(UNKNOWN_GEO_INFO)
 
-    except (subprocess.TimeoutExpired, FileNotFoundError):
-        return None
-    return None # Fallback
+def parse_geo_response(data: Dict) -> Dict:
+    """Converts an ip-api.com response body into the geo info dict used for naming."""
+    return geo_cache.parse_geo_record(data)
 
-def validate_and_enrich_config(session: requests.Session, config: str) -> Optional[ValidatedConfig]:
-    """Validates a single config, enriches it with geo data, and returns structured data."""
-    # This is a placeholder for real validation logic as it's highly complex
-    # Let's create a simplified validation flow for the demo
-    
-    ip = get_server_ip(config)
-    if not ip:
-        return None
+def fetch_geo_batch(session: requests.Session, ips: List[str]) -> List[Dict]:
+    """Looks up to 100 IPs with a single POST to the ip-api.com batch endpoint."""
+    response = session.post(GEO_IP_BATCH_URL, json=ips, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
 
-    # Simulate latency test
-    import random
-    latency = random.randint(50, 4000)
-    if latency > MAX_LATENCY_MS:
-        return None
+def verify_with_xray(
+    configs: List[ValidatedConfig], batch_size: int, health: Optional[HealthScheduler] = None
+) -> List[ValidatedConfig]:
+    """
+    Drops configs that fail an end-to-end HTTP request through xray-core, and
+    records them as failed in the health history like a failed probe.
 
-    geo_info = get_geo_info(session, ip)
-    protocol_match = re.match(r"(\w+):?//", config)
-    protocol = protocol_match.group(1).lower() if protocol_match else "unknown"
+    Configs xray can't dial (hysteria/hy2), and configs left untested because
+    xray couldn't be run, are kept as they are.
+    """
+    import asyncio
+    import xray_tester
+    records = [parse_config(c["config"]) for c in configs]
+    testable = [r for r in records if r and xray_tester.outbound_from_config(r, "probe")]
+    tester = xray_tester.BatchTester(XRAY_PATH, XRAY_CONFIG_FILE, batch_size)
+    latencies = asyncio.run(tester.test_all(testable))
+    kept = [c for c in configs if c["config"] not in latencies or latencies[c["config"]] is not None]
+    if health:
+        for config, latency in latencies.items():
+            if latency is None:
+                health.store.record_failure(config_fingerprint(config))
+    logging.info(f"xray test: {len(kept)}/{len(configs)} configs kept ({len(testable)} tested end to end).")
+    return kept
+
+def verify_spool_with_xray(
+    results: ResultSpool, batch_size: int, health: Optional[HealthScheduler] = None, chunk_size: int = XRAY_VERIFY_CHUNK
+) -> ResultSpool:
+    """Runs verify_with_xray over spooled results `chunk_size` at a time; the kept ones go to a new spool."""
+    kept = ResultSpool()
+    chunk: List[ValidatedConfig] = []
+    for res in results:
+        chunk.append(res)
+        if len(chunk) >= chunk_size:
+            kept.extend(verify_with_xray(chunk, batch_size, health))
+            chunk = []
+    if chunk:
+        kept.extend(verify_with_xray(chunk, batch_size, health))
+    results.close()
+    return kept
+
+def unprobed_result() -> ProbeResult:
+    """The probe result recorded for UDP-only configs, which a TCP probe can't measure."""
+    return {"ok": True, "latency_ms": UNPROBED_LATENCY_MS, "p90_ms": UNPROBED_LATENCY_MS, "jitter_ms": 0,
+            "connect_ms": 0, "tls_ms": 0, "samples": 0, "failures": 0}
+
+def measure_latency(config: ProxyConfig, ip: str, probe_runner: Optional[ProbeRunner] = None) -> Optional[ProbeResult]:
+    """
+    Measures TCP connect and TLS handshake time to the config's server.
+
+    Returns:
+        The probe summary, or None if the config can't be probed or never answered.
+    """
+    target = prober.endpoint_from_config(config)
+    if target is None:
+        return unprobed_result() if config.protocol in prober.UDP_PROTOCOLS else None
+    with run_metrics.metrics.timed("probe"):
+        if probe_runner:
+            result = probe_runner.probe(ip, target)
+        else:
+            import asyncio
+            result = asyncio.run(prober.probe_target(ip, target, PROBE_SAMPLES, PROBE_TIMEOUT_SECONDS))
+    run_metrics.metrics.probe(result["latency_ms"] if result["ok"] else None)
+    return result if result["ok"] else None
+
+def build_validated_config(
+    config: ProxyConfig, geo_info: Dict, latency: int, probe: Optional[ProbeResult] = None
+) -> ValidatedConfig:
+    """Builds the renamed, dashboard-ready record for a config that passed validation."""
+    protocol = config.protocol
 
     # --- FIX: Create a URL-safe and client-friendly name ---
     # We remove emojis as they cause encoding issues in many V2Ray clients.
@@ -249,11 +459,11 @@ def validate_and_enrich_config(session: requests.Session, config: str) -> Option
     display_name = f"[{country_code}]{flag} {isp} {latency}ms"
     # --- END FIX ---
     # Create the renamed config string for subscription files
-    renamed_config = config.split("#")[0] + f"#{name}"
+    renamed_config = config.with_name(name)
     # --- FIX END ---
     
     return {
-        "config": config,
+        "config": config.raw,
         "renamed_config": renamed_config,
         "protocol": protocol,
         "name": name, # The URL-safe name
@@ -261,142 +471,692 @@ def validate_and_enrich_config(session: requests.Session, config: str) -> Option
         "latency": latency,
         "country_code": country_code,
         "country_name": geo_info["country_name"],
-        "isp": geo_info["isp"]
+        "isp": geo_info["isp"],
+        # Spread of the probe samples, so the dashboard can tell stable servers from flaky ones
+        "latency_p90": probe["p90_ms"] if probe else latency,
+        "jitter": probe["jitter_ms"] if probe else 0,
     }
 
+def lookup_geo_info(session: requests.Session, ip: str, services: ValidationServices) -> Dict:
+    """
+    Gets geo info for an IP from the cheapest source available.
+
+    The offline database is tried first, then the cache/batch front-end, then one
+    ip-api.com call. With geo_db_only, IPs missing from the database stay unknown.
+    """
+    geo_info = services.offline_geo.lookup(ip) if services.offline_geo else None
+    if geo_info is not None:
+        return geo_info
+    if services.geo_db_only:
+        return dict(UNKNOWN_GEO_INFO)
+    with run_metrics.metrics.timed("geo"):
+        if services.geo_lookup:
+            return services.geo_lookup.lookup(ip)
+        return get_geo_info(session, ip)
+
+def validate_and_enrich_config(
+    session: requests.Session, config: ProxyConfig, services: Optional[ValidationServices] = None
+) -> Optional[ValidatedConfig]:
+    """Validates a single config, enriches it with geo data, and returns structured data."""
+    # This is a placeholder for real validation logic as it's highly complex
+    # Let's create a simplified validation flow for the demo
+    services = services or ValidationServices()
+    
+    ip = get_server_ip(config, services.resolver)
+    # A name that resolves into a private or reserved range can't be a public server
+    if not ip or config_checks.is_reserved_address(ip):
+        return None
+
+    probe = measure_latency(config, ip, services.probe_runner)
+    if probe is None or probe["latency_ms"] > MAX_LATENCY_MS:
+        return None
+
+    geo_info = lookup_geo_info(session, ip, services)
+    return build_validated_config(config, geo_info, probe["latency_ms"], probe)
+
+def select_due_configs(configs: List[ProxyConfig], services: ValidationServices) -> List[ProxyConfig]:
+    """Keeps the newly indexed configs that the health scheduler says are due for validation."""
+    if not services.health:
+        return configs
+    return [config for config in configs if services.health.is_due(config_fingerprint(config))]
+
+def record_health(services: ValidationServices, config: ProxyConfig, result: Optional[ValidatedConfig]):
+    """Records a validation outcome in the health history."""
+    if not services.health:
+        return
+    fingerprint = config_fingerprint(config)
+    if result:
+        services.health.store.record_success(fingerprint, result["latency"], result)
+    else:
+        services.health.store.record_failure(fingerprint)
+
+def carried_health_results(services: ValidationServices) -> List[ValidatedConfig]:
+    """Returns the stored results of healthy servers that were skipped because they weren't due."""
+    if not services.health:
+        return []
+    services.health.log_summary()
+    return list(services.health.skipped_healthy)
+
+def results_json(results: List[ValidatedConfig]) -> str:
+    """Serializes results one record per line, so the published file diffs line by line."""
+    if not results:
+        return "[]\n"
+    return "[\n" + ",\n".join(json.dumps(res, ensure_ascii=False, sort_keys=True) for res in results) + "\n]\n"
+
+def results_json_chunks(results: Iterable[ValidatedConfig]) -> Iterator[str]:
+    """The text of results_json, one record at a time, for results streamed from a ResultSpool."""
+    separator = "[\n"
+    for res in results:
+        yield separator + json.dumps(res, ensure_ascii=False, sort_keys=True)
+        separator = ",\n"
+    yield "[]\n" if separator == "[\n" else "\n]\n"
+
 def save_results(results: List[ValidatedConfig]):
     """
     Saves the validated configs to JSON and creates subscription files
     grouped by protocol and by country.
+
+    Groups are built in one pass, in the results' (stable) order, and written
+    through OutputWriter: unchanged files are not touched, changed ones are
+    replaced atomically, and validated_configs/manifest.json lists what changed.
+    The dashboard's data files are described in dashboard_data.
     """
+    writer = OutputWriter(VALIDATED_DIR)
     if not results:
         logging.info("No valid configs to save.")
-        # Create an empty results file to prevent 404 on the dashboard
-        VALIDATED_DIR.mkdir(exist_ok=True)
-        with open(RESULTS_JSON_FILE, "w", encoding="utf-8") as f:
-            json.dump([], f)
+        # Create an empty results file to prevent 404 on the dashboard; keep the last subscriptions
+        writer.write_text(RESULTS_JSON_FILE.name, results_json([]))
+        writer.write_text(RESULTS_COMPACT_FILE.name, compact_json([]))
+        writer.finish(remove_stale=False)
         return
 
-    VALIDATED_DIR.mkdir(exist_ok=True)
-    
-    # --- 1. Save detailed JSON results for the dashboard ---
-    with open(RESULTS_JSON_FILE, "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2)
-    logging.info(f"Saved {len(results)} validated configs to {RESULTS_JSON_FILE}")
-
-    # --- 2. Group by Protocol and save subscription files ---
+    # --- 1. Group by protocol and by country in a single pass ---
     grouped_by_protocol: Dict[str, List[str]] = {}
+    grouped_by_country: Dict[str, List[str]] = {}
     all_renamed_configs = []
-    
     for res in results:
-        protocol = res["protocol"]
-        if protocol not in grouped_by_protocol:
-            grouped_by_protocol[protocol] = []
-        
         # Use the pre-renamed config for subscriptions
         renamed_config = res.get("renamed_config", res["config"]) # Fallback for safety
-        grouped_by_protocol[protocol].append(renamed_config)
         all_renamed_configs.append(renamed_config)
-    
-    # Save individual protocol files
-    for protocol, configs in grouped_by_protocol.items():
-        file_path = VALIDATED_DIR / f"{protocol}.txt"
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write("\n".join(configs))
-        logging.info(f"Saved {len(configs)} {protocol} configs to {file_path}")
-        
-    # Save combined subscription file (all protocols)
-    combined_path = VALIDATED_DIR / "subscription.txt"
-    encoded_all = base64.b64encode("\n".join(all_renamed_configs).encode("utf-8")).decode("utf-8")
-    with open(combined_path, "w", encoding="utf-8") as f:
-        f.write(encoded_all)
-    logging.info(f"Saved combined subscription file to {combined_path}")
-
-    # --- 3. Group by Country and save subscription files ---
-    country_dir = VALIDATED_DIR / "by-country"
-    country_dir.mkdir(exist_ok=True)
-    
-    grouped_by_country: Dict[str, List[str]] = {}
-    for res in results:
+        grouped_by_protocol.setdefault(res["protocol"], []).append(renamed_config)
         country_code = res.get("country_code", "N/A").upper()
-        if country_code not in grouped_by_country:
-            grouped_by_country[country_code] = []
-        renamed_config = res.get("renamed_config", res["config"])
-        grouped_by_country[country_code].append(renamed_config)
-
-    # Save individual country subscription files
-    for country_code, configs in grouped_by_country.items():
-        if country_code == "N/A":
-            continue # Skip saving a file for unknown countries
-            
-        country_file_path = country_dir / f"{country_code}.txt"
+        if country_code != "N/A": # Skip saving a file for unknown countries
+            grouped_by_country.setdefault(country_code, []).append(renamed_config)
+
+    # --- 2. Save detailed JSON results, and the summary and shards the dashboard loads ---
+    writer.write_text(RESULTS_JSON_FILE.name, results_json(results))
+    writer.write_text(RESULTS_COMPACT_FILE.name, compact_json(results))
+    write_dashboard_data(writer, results)
+
+    # --- 3. Save protocol files and the combined subscription file (all protocols) ---
+    for protocol, configs in sorted(grouped_by_protocol.items()):
+        writer.write_text(f"{protocol}.txt", "\n".join(configs))
+    writer.write_text("subscription.txt", base64.b64encode("\n".join(all_renamed_configs).encode("utf-8")).decode("utf-8"))
+
+    # --- 4. Save country subscription files ---
+    for country_code, configs in sorted(grouped_by_country.items()):
         encoded_country_configs = base64.b64encode("\n".join(configs).encode("utf-8")).decode("utf-8")
-        with open(country_file_path, "w", encoding="utf-8") as f:
-            f.write(encoded_country_configs)
-        logging.info(f"Saved {len(configs)} configs for country {country_code} to {country_file_path}")
+        writer.write_text(f"by-country/{country_code}.txt", encoded_country_configs)
+
+    logging.info(
+        f"Saved {len(results)} validated configs: {len(grouped_by_protocol)} protocol files, "
+        f"{len(grouped_by_country)} country files."
+    )
+    writer.finish()
+
+def load_previous_results(file_path: Path = RESULTS_JSON_FILE) -> List[ValidatedConfig]:
+    """Loads the validated configs written by the previous run, if any."""
+    if not file_path.exists():
+        return []
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not read previous results from {file_path}: {e}")
+        return []
+
+def unexpired_results(
+    results: List[ValidatedConfig], health: Optional[HealthScheduler], max_age: float, now: Optional[float] = None
+) -> List[ValidatedConfig]:
+    """
+    Keeps the previous results that may still be carried forward: those whose
+    server passed its last validation less than `max_age` seconds ago, by the
+    health history. Carried results are not re-validated, so without this a
+    server from a channel that stopped loading would be republished forever.
+    Without a health history a result's age is unknown and nothing is kept.
+    """
+    if not health:
+        if results:
+            logging.info(f"Not carrying {len(results)} previous results forward: no health history to age them.")
+        return []
+    now = now or time.time()
+    kept = []
+    for res in results:
+        record = health.store.get(config_fingerprint(res["config"]))
+        if record and record.result is not None and now - record.last_checked < max_age:
+            kept.append(res)
+    if len(kept) < len(results):
+        logging.info(f"Dropped {len(results) - len(kept)} previous results not validated in the last "
+                     f"{max_age / 3600:g} hours.")
+    return kept
+
+def merge_with_previous_results(
+    new_results: Union[List[ValidatedConfig], ResultSpool], previous_results: List[ValidatedConfig]
+) -> Union[List[ValidatedConfig], ResultSpool]:
+    """
+    Carries previously validated configs forward, appending them to `new_results`
+    (a list or ResultSpool), which is returned; a fresh result for the same config wins.
+    """
+    fresh = {res["config"] for res in new_results}
+    carried = [res for res in previous_results if res["config"] not in fresh]
+    logging.info(f"Carrying forward {len(carried)} previously validated configs.")
+    new_results.extend(carried)
+    return new_results
+
+def carry_waiting_channel_results(
+    new_results: Union[List[ValidatedConfig], ResultSpool],
+    previous_results: List[ValidatedConfig],
+    waiting: Set[str],
+    index: ConfigIndex,
+) -> Union[List[ValidatedConfig], ResultSpool]:
+    """
+    Keeps the previous results of servers whose channels weren't scraped this
+    run (see ChannelScheduler.waiting_fingerprints), so a channel waiting for
+    its next refresh doesn't drop out of the subscriptions. Servers another
+    channel posted this run went through validation and are not carried.
+    The carried results are appended to `new_results`, which is returned.
+    """
+    fresh = {res["config"] for res in new_results}
+    carried = []
+    for res in previous_results:
+        fingerprint = config_fingerprint(res["config"])
+        if fingerprint in waiting and fingerprint not in index and res["config"] not in fresh:
+            carried.append(res)
+    logging.info(f"Carrying forward {len(carried)} results from channels not scraped this run.")
+    new_results.extend(carried)
+    return new_results
+
+def prepare_threaded_services(session: requests.Session, services: ValidationServices) -> int:
+    """Binds the geo batcher and probe runner for validating from threads; returns the validator pool size."""
+    if services.geo_cache is not None and services.geo_lookup is None:
+        services.geo_lookup = GeoLookup(services.geo_cache, lambda ips: fetch_geo_batch(session, ips))
+    if services.probe_runner is None:
+        services.probe_runner = ProbeRunner(PROBE_CONCURRENCY, PROBE_SAMPLES, PROBE_TIMEOUT_SECONDS)
+    return VALIDATOR_WORKERS if services.geo_lookup or services.geo_db_only else UNBATCHED_GEO_VALIDATOR_WORKERS
+
+def completed_scrapes(future_to_channel: Dict[concurrent.futures.Future, str]) -> Iterator[Tuple[str, Set[str]]]:
+    """Yields (channel, configs) as scrape futures finish; channels whose scrape raised are logged and skipped."""
+    for future in concurrent.futures.as_completed(future_to_channel):
+        channel_name = future_to_channel[future]
+        try:
+            channel_configs = future.result()
+        except Exception as e:
+            logging.error(f"An exception occurred while processing channel {channel_name}: {e}")
+            continue
+        yield channel_name, channel_configs
+
+def scrape_channels(session: requests.Session, channels: List[str]) -> Dict[str, Set[str]]:
+    """Scrapes channels without validating anything (a sharded run's scrape phase, or --stage scrape)."""
+    channel_configs: Dict[str, Set[str]] = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=SCRAPER_WORKERS, thread_name_prefix='Scraper') as scraper:
+        future_to_channel = {scraper.submit(scrape_channel, session, name): name for name in channels}
+        for channel_name, configs in completed_scrapes(future_to_channel):
+            channel_configs[channel_name] = configs
+            run_metrics.metrics.channel_configs(channel_name, len(configs), 0)
+    return channel_configs
+
+def run_local_shards(count: int, argv: List[str], shard_dir: Path):
+    """
+    Runs a sharded collection on this machine: `count` collector processes per
+    phase, so parsing and validation use every core instead of one GIL.
+    """
+    for spec in (ShardSpec(index, count) for index in range(count)):
+        for path in (sharding.scraped_path(shard_dir, spec), sharding.partial_path(shard_dir, spec)):
+            path.unlink(missing_ok=True)  # A failed shard must not leave an older run's output to be merged
+    for phase in sharding.PHASES:
+        logging.info(f"--- Running the {phase} phase in {count} shard processes ---")
+        processes = [
+            subprocess.Popen([sys.executable, __file__, *sharding.shard_command(argv, ShardSpec(index, count), phase)])
+            for index in range(count)
+        ]
+        failed = [str(ShardSpec(index, count)) for index, process in enumerate(processes) if process.wait() != 0]
+        if failed:
+            raise ShardError(f"The {phase} phase failed in shard(s) {', '.join(failed)}")
 
 
 # ===== INITIALIZATION & STARTUP =====
-def main():
+def run_threaded_engine(
+    session: requests.Session,
+    channels: List[str],
+    cursors: Optional[Dict[str, ChannelCursor]] = None,
+    backfill_pages: int = 0,
+    index: Optional[ConfigIndex] = None,
+    services: Optional[ValidationServices] = None,
+    batches: Optional[Iterable[Tuple[str, Set[str]]]] = None,
+    window: Optional[int] = None,
+    results: Optional[ResultSpool] = None,
+) -> Union[List[ValidatedConfig], ResultSpool]:
+    """
+    Scrapes and validates configs using the thread pool executors.
+
+    Scraping and validation overlap: as soon as a channel finishes, its configs are
+    fingerprinted into the shared `index` and only the first config seen for each
+    server is submitted to the validator pool, so a single slow channel no longer
+    holds back validation of the rest and reposts are validated once.
+    With `cursors`, channels are scraped incrementally (see scrape_channel).
+    With `batches` ((channel or source, configs) pairs, e.g. a sharded run's
+    validate phase or a raw corpus), nothing is fetched: the batches are consumed
+    lazily, in order, as the validators' input.
+
+    At most `window` validations are in flight (default: VALIDATION_WINDOW_PER_WORKER
+    per validator thread); when the window is full, reading input waits for one to
+    finish. Results are appended to `results` (e.g. a ResultSpool, which keeps them
+    on disk) or to a new list, which is returned.
+    """
+    logging.info("--- Starting Scraping and Validation Pipeline ---")
+    index = index if index is not None else ConfigIndex()
+    services = services or ValidationServices()
+    validator_workers = prepare_threaded_services(session, services)
+    window = window or validator_workers * VALIDATION_WINDOW_PER_WORKER
+    geo_lookup = services.geo_lookup
+    validated_configs = results if results is not None else []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=SCRAPER_WORKERS, thread_name_prefix='Scraper') as scraper, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=validator_workers, thread_name_prefix='Validator') as validator:
+        if batches is None:
+            batches = completed_scrapes(
+                {scraper.submit(scrape_channel, session, name, cursors, backfill_pages): name for name in channels}
+            )
+        in_flight: Dict[concurrent.futures.Future, ProxyConfig] = {}
+        metrics = run_metrics.metrics
+        submitted_count = processed_count = 0
+
+        def collect(limit: int):
+            """Handles finished validations until at most `limit` are in flight."""
+            nonlocal processed_count
+            while len(in_flight) > limit:
+                done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    config = in_flight.pop(future)
+                    processed_count += 1
+                    result = None
+                    try:
+                        result = future.result()
+                        if result:
+                            validated_configs.append(result)
+                    except Exception as e:
+                        logging.error(f"An exception occurred while validating config {config.raw[:30]}...: {e}")
+                    record_health(services, config, result)
+                    if processed_count % 20 == 0:
+                        logging.info(f"Validation progress: {processed_count}/{submitted_count} configs processed.")
+                metrics.queue_depth("validation", len(in_flight))
+
+        with metrics.stage("scrape"):
+            for channel_name, channel_configs in batches:
+                # Only this thread touches the index, so no lock is needed
+                new_configs = index.add_many(channel_configs, channel_name)
+                metrics.channel_configs(channel_name, len(channel_configs), len(new_configs))
+                if channel_name in index.rejections:
+                    metrics.channel_rejections(channel_name, index.rejections[channel_name])
+                for cfg in select_due_configs(new_configs, services):
+                    collect(window - 1)
+                    in_flight[validator.submit(validate_and_enrich_config, session, cfg, services)] = cfg
+                    submitted_count += 1
+                metrics.queue_depth("validation", len(in_flight))
+
+        logging.info(
+            f"--- Scraping Complete --- Found {len(index)} unique servers in {index.raw_count} scraped configs "
+            f"({index.unparsed} unparseable, {index.rejected} rejected by static checks)."
+        )
+        if index.rejections:
+            logging.info(f"Dropped before validation: {index.rejection_summary()}.")
+
+        if not submitted_count:
+            logging.info("No configs found to validate.")
+            validated_configs.extend(carried_health_results(services))
+            return validated_configs
+
+        with metrics.stage("validate"):
+            collect(0)
+        logging.info(f"Validation progress: {processed_count}/{submitted_count} configs processed.")
+
+    if geo_lookup:
+        logging.info(f"Geo enrichment used {geo_lookup.requests_made} batch requests.")
+    if services.resolver:
+        services.resolver.log_summary()
+    validated_configs.extend(carried_health_results(services))
+    return validated_configs
+
+def positive_int(text: str) -> int:
+    """argparse type for counts and sizes that must be at least 1."""
+    value = int(text)
+    if value < 1:
+        raise ValueError(f"Expected a positive integer, got {text!r}")
+    return value
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parses command-line options for the collector."""
+    parser = argparse.ArgumentParser(description="Scrape, validate and publish V2Ray configs from Telegram channels.")
+    parser.add_argument(
+        "--engine", choices=["threaded", "async"], default="threaded",
+        help="Execution engine: thread pools (default) or a single asyncio event loop.",
+    )
+    parser.add_argument(
+        "--stage", choices=STAGES, default="all",
+        help=f"Run one stage: scrape (channels to the raw corpus in {OUTPUT_DIR}/), validate (raw corpus to "
+             f"--validated-file) or publish (--validated-file to {VALIDATED_DIR}/). Default: all, in one pass.",
+    )
+    parser.add_argument(
+        "--corpus", type=Path, nargs="+", metavar="PATH",
+        help=f"With --stage validate, raw corpus files or directories of *.txt to read: one config per line, "
+             f"or base64 subscriptions. Default: {OUTPUT_DIR}.",
+    )
+    parser.add_argument(
+        "--validated-file", type=Path, default=VALIDATED_STAGE_FILE, metavar="PATH",
+        help="Where --stage validate writes its results and --stage publish reads them.",
+    )
+    parser.add_argument(
+        "--window", type=positive_int, metavar="K",
+        help=f"Configs in flight at once (default: {VALIDATION_WINDOW_PER_WORKER} per validator thread, or "
+             f"{ASYNC_VALIDATION_WORKERS} validating plus as many queued with --engine async); input is read "
+             f"as the window drains.",
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Only parse messages newer than each channel's saved cursor and keep previous results.",
+    )
+    parser.add_argument(
+        "--backfill-pages", type=int, default=0, metavar="N",
+        help="With --incremental, walk N older pages (?before=) for channels that have no cursor yet.",
+    )
+    parser.add_argument(
+        "--geo-cache-ttl", type=float, default=GEO_CACHE_TTL_HOURS, metavar="HOURS",
+        help=f"How long cached geo-IP answers in {GEO_CACHE_FILE} stay valid.",
+    )
+    parser.add_argument(
+        "--no-geo-cache", action="store_true",
+        help="Query ip-api.com once per config, without the cache or batch endpoint.",
+    )
+    parser.add_argument(
+        "--geo-db", type=Path, metavar="PATH",
+        help="Offline IP-range database (.csv, compiled .idx or .mmdb) consulted before the geo-ip API.",
+    )
+    parser.add_argument(
+        "--geo-db-only", action="store_true",
+        help="With --geo-db, never call the geo-ip API; IPs missing from the database stay unknown.",
+    )
+    parser.add_argument(
+        "--no-health", action="store_true",
+        help=f"Validate every scraped server, ignoring the health history in {HEALTH_FILE}.",
+    )
+    parser.add_argument(
+        "--recheck-hours", type=float, default=HEALTHY_RECHECK_HOURS, metavar="HOURS",
+        help="How often a server that passed validation is re-checked; until then its last result is reused.",
+    )
+    parser.add_argument(
+        "--max-carry-hours", type=float, default=MAX_CARRY_HOURS, metavar="HOURS",
+        help="Stop carrying forward the results of servers not re-scraped (waiting channels, --incremental) "
+             "once their last validation is this old. Needs the health history.",
+    )
+    parser.add_argument(
+        "--no-channel-schedule", action="store_true",
+        help=f"Scrape every channel every run, ignoring the yield scores in {CHANNEL_SCORES_FILE}.",
+    )
+    parser.add_argument(
+        "--park-after", type=positive_int, default=PARK_AFTER_RUNS, metavar="N",
+        help="Park a channel (re-checked weekly) after N scrapes in a row that found nothing.",
+    )
+    parser.add_argument(
+        "--daemon", action="store_true",
+        help="Keep running: re-scrape channels and re-probe servers as they fall due, publishing every --flush-minutes.",
+    )
+    parser.add_argument(
+        "--flush-minutes", type=float, default=DAEMON_FLUSH_MINUTES, metavar="MINUTES",
+        help="With --daemon, how often results and state files are written.",
+    )
+    parser.add_argument(
+        "--daemon-hours", type=float, metavar="HOURS",
+        help="With --daemon, exit (after a final flush) once this many hours have passed.",
+    )
+    parser.add_argument(
+        "--serve", type=parse_listen_address, metavar="[HOST:]PORT",
+        help="With --daemon, also serve filtered subscriptions over HTTP (see subscription_server).",
+    )
+    parser.add_argument(
+        "--shards", type=positive_int, metavar="N",
+        help="Run N shard processes on this machine (scrape, then validate), then merge and publish their results.",
+    )
+    parser.add_argument(
+        "--shard", type=ShardSpec.parse, metavar="I/N",
+        help="Run one shard of an N-way run (for a matrix job); needs --shard-phase.",
+    )
+    parser.add_argument(
+        "--shard-phase", choices=sharding.PHASES,
+        help="scrape: fetch and parse this shard's channels. validate: validate this shard's servers "
+             "from every shard's scrape output.",
+    )
+    parser.add_argument(
+        "--merge-shards", type=positive_int, metavar="N",
+        help="Merge the validate outputs of N shards and publish them, instead of scraping.",
+    )
+    parser.add_argument(
+        "--shard-dir", type=Path, default=sharding.SHARD_DIR, metavar="PATH",
+        help="Where shards exchange their scrape and validate outputs.",
+    )
+    parser.add_argument(
+        "--xray-test", action="store_true",
+        help=f"After the TCP/TLS probe, test each config end to end through {XRAY_PATH} and drop failures.",
+    )
+    parser.add_argument(
+        "--xray-batch-size", type=positive_int, default=XRAY_BATCH_SIZE, metavar="N",
+        help="Configs tested per xray process with --xray-test.",
+    )
+    parser.add_argument(
+        "--run-report", type=Path, metavar="PATH",
+        help="Write per-stage, per-channel, per-upstream and probe metrics for this run as JSON.",
+    )
+    parser.add_argument(
+        "--metrics-textfile", type=Path, metavar="PATH",
+        help="Write the same metrics in Prometheus text format (for node_exporter's textfile collector).",
+    )
+    args = parser.parse_args(argv)
+    if bool(args.shard) != bool(args.shard_phase):
+        parser.error("--shard and --shard-phase go together")
+    if args.incremental and (args.shard or args.shards or args.merge_shards):
+        parser.error("--incremental keeps per-channel cursors from a single process and can't be sharded")
+    if args.daemon and (args.incremental or args.shard or args.shards or args.merge_shards or args.xray_test
+                        or args.engine == "async"):
+        parser.error("--daemon runs on the threaded engine, without --incremental, sharding or --xray-test")
+    if args.serve and not args.daemon:
+        parser.error("--serve runs inside --daemon; serve a results file with subscription_server.py")
+    if args.daemon and (args.no_health or args.no_channel_schedule):
+        parser.error("--daemon schedules its work from the health history and channel scores")
+    if args.stage != "all" and (args.daemon or args.incremental or args.shard or args.shards or args.merge_shards):
+        parser.error("--stage runs one stage of a single pass, without --daemon, --incremental or sharding")
+    if args.corpus and args.stage != "validate":
+        parser.error("--corpus is the input of --stage validate")
+    if args.xray_test and args.stage in ("scrape", "publish"):
+        parser.error("--xray-test is part of the validate stage")
+    return args
+
+def create_validation_services(args: argparse.Namespace, spec: Optional[ShardSpec] = None) -> ValidationServices:
+    """Opens the caches and lookup backends the command-line options ask for."""
+    # Each shard owns a fixed slice of the servers, so it keeps its own slice of the history
+    geo_cache_file = spec.state_path(GEO_CACHE_FILE) if spec else GEO_CACHE_FILE
+    health_file = spec.state_path(HEALTH_FILE) if spec else HEALTH_FILE
+    return ValidationServices(
+        geo_cache=None if args.no_geo_cache else GeoCache(geo_cache_file, args.geo_cache_ttl * 3600),
+        offline_geo=geoip_offline.open_geo_database(args.geo_db) if args.geo_db else None,
+        geo_db_only=args.geo_db_only,
+        resolver=DNSResolver(),
+        health=None if args.no_health else HealthScheduler(HealthStore(health_file), args.recheck_hours * 3600),
+    )
+
+def write_run_reports(args: argparse.Namespace, metrics: run_metrics.NullMetrics, spec: Optional[ShardSpec] = None):
+    """Writes --run-report and --metrics-textfile; a shard writes its own copies next to them."""
+    if args.run_report:
+        path = spec.state_path(args.run_report) if spec else args.run_report
+        metrics.write_json(path)
+        logging.info(f"Wrote run report to {path}")
+    if args.metrics_textfile:
+        metrics.write_prometheus(spec.state_path(args.metrics_textfile) if spec else args.metrics_textfile)
+
+def main(argv: Optional[List[str]] = None):
     """Main function to orchestrate the scraping and validation process."""
-    channels = load_channels(CHANNELS_FILE)
-    if not channels:
-        logging.warning("No channels to scrape. Exiting.")
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    spec: Optional[ShardSpec] = args.shard
+    # Channel scores need the whole run's index, so sharded and single-stage runs scrape every channel
+    sharded = bool(spec or args.shards or args.merge_shards)
+    scheduler = None
+    if not (args.no_channel_schedule or sharded or args.stage != "all"):
+        scheduler = ChannelScheduler(CHANNEL_SCORES_FILE, park_after=args.park_after)
+    # Instrumentation is a no-op unless a report was asked for or the channel scheduler needs fetch costs
+    if args.run_report or args.metrics_textfile or scheduler:
+        metrics = run_metrics.enable()
+    else:
+        metrics = run_metrics.metrics
+
+    if args.shards or args.merge_shards:
+        try:
+            if args.shards:
+                run_local_shards(args.shards, argv, args.shard_dir)
+            validated_configs = sharding.merge_partials(args.shard_dir, args.shards or args.merge_shards)
+        except ShardError as e:
+            logging.error(e)
+            raise SystemExit(1)
+        with metrics.stage("save"):
+            save_results(validated_configs)
+        write_run_reports(args, metrics)
         return
 
-    session = create_requests_session()
-    session.headers.update({"User-Agent": USER_AGENT})
+    if args.stage == "publish":
+        try:
+            with open(args.validated_file, "r", encoding="utf-8") as f:
+                validated_configs = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Nothing to publish from {args.validated_file}: {e}")
+            raise SystemExit(1)
+        validated_configs.sort(key=result_order)
+        with metrics.stage("save"):
+            save_results(validated_configs)
+        write_run_reports(args, metrics)
+        return
 
-    # Phase 1: Scraping
-    logging.info("--- Starting Scraping Phase ---")
-    raw_configs: Set[str] = set()
-    with concurrent.futures.ThreadPoolExecutor(max_workers=SCRAPER_WORKERS, thread_name_prefix='Scraper') as executor:
-        future_to_channel = {executor.submit(scrape_channel, session, name): name for name in channels}
-        for future in concurrent.futures.as_completed(future_to_channel):
-            try:
-                channel_configs = future.result()
-                if channel_configs:
-                    raw_configs.update(channel_configs)
-            except Exception as e:
-                channel_name = future_to_channel[future]
-                logging.error(f"An exception occurred while processing channel {channel_name}: {e}")
-
-    logging.info(f"--- Scraping Complete --- Found {len(raw_configs)} unique potential configs.")
-
-    if not raw_configs:
-        logging.info("No configs found to validate. Exiting.")
-        save_results([]) 
+    if args.daemon:
+        import daemon
+        daemon.run_daemon(args, create_validation_services(args), scheduler)
+        return
+
+    batches = None
+    channels: List[str] = []
+    if args.stage == "validate":
+        # Streamed batch by batch; the corpus is never held in memory as a whole
+        batches = raw_corpus.corpus_batches(args.corpus or [OUTPUT_DIR])
+    else:
+        channels = load_channels(CHANNELS_FILE)
+        if not channels:
+            logging.warning("No channels to scrape. Exiting.")
+            return
+    if scheduler:
+        scheduler.forget_missing(channels)
+        channels = scheduler.plan(channels)
+
+    if args.stage == "scrape" or (spec and args.shard_phase == "scrape"):
+        session = create_requests_session(limiters=HostLimiters(HOST_POLICIES))
+        session.headers.update({"User-Agent": USER_AGENT})
+        with metrics.stage("scrape"):
+            channel_configs = scrape_channels(session, sharding.select_channels(channels, spec) if spec else channels)
+        session.close()
+        with metrics.stage("save"):
+            if spec:
+                sharding.write_scraped(args.shard_dir, spec, channel_configs)
+            else:
+                raw_corpus.write_raw_corpus(
+                    (config for configs in channel_configs.values() for config in configs), OUTPUT_DIR
+                )
+        write_run_reports(args, metrics, spec)
+        return
+    if spec:
+        try:
+            batches = sorted(sharding.load_owned_configs(args.shard_dir, spec).items())
+        except ShardError as e:
+            logging.error(e)
+            raise SystemExit(1)
+
+    cursors = channel_state.load_channel_state() if args.incremental else None
+    # Results are spooled to disk in every stage and come back sorted from the spool's merge. Only the
+    # channel scheduler's scores need each server's representative and channels; otherwise dedup by fingerprint.
+    index = ConfigIndex(keep_records=scheduler is not None)
+    results = ResultSpool()
+    services = create_validation_services(args, spec)
+
+    if args.engine == "async":
+        import asyncio
+        import async_engine
+        validated_configs = asyncio.run(
+            async_engine.run_async_engine(
+                channels, cursors=cursors, backfill_pages=args.backfill_pages, index=index, services=services,
+                batches=batches, window=args.window, results=results,
+            )
+        )
+    else:
+        limiters = HostLimiters(HOST_POLICIES)
+        session = create_requests_session(limiters=limiters)
+        session.headers.update({"User-Agent": USER_AGENT})
+        validated_configs = run_threaded_engine(
+            session, channels, cursors, args.backfill_pages, index, services=services, batches=batches,
+            window=args.window, results=results,
+        )
+        session.close()
+        limiters.log_summary()
+
+    if args.xray_test:
+        with metrics.stage("xray_test"):
+            validated_configs = verify_spool_with_xray(validated_configs, args.xray_batch_size, services.health)
+
+    if scheduler:
+        scheduler.record_run(channels, index, validated_configs, metrics.channels)
+        waiting = scheduler.waiting_fingerprints()
+        if waiting:
+            previous = unexpired_results(load_previous_results(), services.health, args.max_carry_hours * 3600)
+            validated_configs = carry_waiting_channel_results(validated_configs, previous, waiting, index)
+        scheduler.save()
+        scheduler.log_summary()
+
+    if cursors is not None:
+        # Messages at or before the cursor were not re-validated, so keep their earlier results
+        previous = unexpired_results(load_previous_results(), services.health, args.max_carry_hours * 3600)
+        validated_configs = merge_with_previous_results(validated_configs, previous)
+        channel_state.save_channel_state(cursors)
+    services.close()
+
+    if spec:
+        sharding.write_partial(args.shard_dir, spec, validated_configs)
+        validated_configs.close()
+        write_run_reports(args, metrics, spec)
         return
 
-    # Phase 2: Validation and Enrichment
-    logging.info("--- Starting Validation and Enrichment Phase ---")
-    validated_configs: List[ValidatedConfig] = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=VALIDATOR_WORKERS, thread_name_prefix='Validator') as executor:
-        future_to_config = {executor.submit(validate_and_enrich_config, session, cfg): cfg for cfg in raw_configs}
-        
-        processed_count = 0
-        total_count = len(raw_configs)
-        for future in concurrent.futures.as_completed(future_to_config):
-            processed_count += 1
-            try:
-                result = future.result()
-                if result:
-                    validated_configs.append(result)
-            except Exception as e:
-                config_str = future_to_config[future]
-                logging.error(f"An exception occurred while validating config {config_str[:30]}...: {e}")
-            
-            if processed_count % 20 == 0 or processed_count == total_count:
-                logging.info(f"Validation progress: {processed_count}/{total_count} configs processed.")
-
-    validated_configs.sort(key=lambda x: x["latency"])
-    
     logging.info(f"--- Validation Complete --- Found {len(validated_configs)} working configs.")
 
-    # Phase 3: Save results
-    save_results(validated_configs)
+    if args.stage == "validate":
+        # The spool merges its sorted runs as the file is written
+        with metrics.stage("save"):
+            write_atomic_chunks(
+                args.validated_file, (chunk.encode("utf-8") for chunk in results_json_chunks(validated_configs))
+            )
+        validated_configs.close()
+        logging.info(f"Wrote {len(validated_configs)} validated configs to {args.validated_file}; "
+                     f"publish them with --stage publish.")
+        write_run_reports(args, metrics)
+        return
+
+    # Phase 3: Save results. The spool yields them in result_order (ties broken by config, so unchanged
+    # results keep their place in every output file); the output files are built in memory, as --stage publish does.
+    with metrics.stage("save"):
+        save_results(list(validated_configs))
+    validated_configs.close()
 
-    session.close()
+    write_run_reports(args, metrics)
 
 
 if __name__ == "__main__":
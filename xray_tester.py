@@ -0,0 +1,332 @@
+# xray_tester.py
+# Batched end-to-end config testing: one xray-core process per batch, one SOCKS inbound per config.
+# ===== IMPORTS & DEPENDENCIES =====
+import asyncio
+import json
+import logging
+import os
+import socket
+import struct
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from config_model import ProxyConfig
+
+# ===== CONFIGURATION & CONSTANTS =====
+DEFAULT_BATCH_SIZE = 200  # Outbounds per xray process
+DEFAULT_TIMEOUT_SECONDS = 10.0  # Budget for one HTTP request through a proxy
+STARTUP_TIMEOUT_SECONDS = 10.0  # How long xray may take to open its inbounds
+# Returns an empty 204 over plain HTTP, so a probe is one small request and a status line
+TEST_URL = "http://www.gstatic.com/generate_204"
+
+# ===== CORE LOGIC & UTILITY FUNCTIONS =====
+
+class XrayStartError(Exception):
+    """xray could not serve a batch (missing binary, rejected config, inbounds not opened), so nothing was tested."""
+
+def stream_settings(config: ProxyConfig) -> Dict:
+    """Builds xray streamSettings from a config's transport fields."""
+    network, params = config.network, config.params
+    settings: Dict = {"network": network, "security": config.security}
+    host, path = params.get("host", ""), params.get("path", "")
+    if network == "ws":
+        settings["wsSettings"] = {"path": path or "/", "headers": {"Host": host} if host else {}}
+    elif network == "grpc":
+        settings["grpcSettings"] = {"serviceName": params.get("serviceName") or path}
+    elif network in ("h2", "http"):
+        settings["httpSettings"] = {"path": path or "/", "host": [host] if host else []}
+    elif network in ("httpupgrade", "splithttp", "xhttp"):
+        settings[f"{network}Settings"] = {"path": path or "/", "host": host}
+    elif network == "tcp" and params.get("headerType") == "http":
+        settings["tcpSettings"] = {
+            "header": {"type": "http", "request": {"path": [path or "/"], "headers": {"Host": [host] if host else []}}}
+        }
+    if settings["security"] == "tls":
+        tls: Dict = {"serverName": config.sni or host or config.host, "allowInsecure": True}
+        if params.get("alpn"):
+            tls["alpn"] = params["alpn"].split(",")
+        if params.get("fp"):
+            tls["fingerprint"] = params["fp"]
+        settings["tlsSettings"] = tls
+    elif settings["security"] == "reality":
+        settings["realitySettings"] = {
+            "serverName": config.sni,
+            "fingerprint": params.get("fp") or "chrome",
+            "publicKey": params.get("pbk", ""),
+            "shortId": params.get("sid", ""),
+            "spiderX": params.get("spx", ""),
+        }
+    return settings
+
+def outbound_from_config(config: ProxyConfig, tag: str) -> Optional[Dict]:
+    """
+    Converts a parsed config into an xray outbound.
+
+    Returns:
+        The outbound dict tagged `tag`, or None for protocols xray can't dial (hysteria/hy2).
+    """
+    stream = stream_settings(config)
+    if config.protocol == "vmess":
+        try:
+            alter_id = int(config.params.get("aid") or 0)
+        except ValueError:
+            alter_id = 0
+        user = {"id": config.credential, "alterId": alter_id, "security": config.method}
+        settings: Dict = {"vnext": [{"address": config.host, "port": config.port, "users": [user]}]}
+    elif config.protocol == "vless":
+        user = {
+            "id": config.credential,
+            "encryption": config.params.get("encryption") or "none",
+            "flow": config.params.get("flow", ""),
+        }
+        settings = {"vnext": [{"address": config.host, "port": config.port, "users": [user]}]}
+    elif config.protocol == "trojan":
+        settings = {"servers": [{"address": config.host, "port": config.port, "password": config.credential}]}
+    elif config.protocol == "ss":
+        server = {"address": config.host, "port": config.port, "method": config.method, "password": config.credential}
+        return {"protocol": "shadowsocks", "settings": {"servers": [server]}, "tag": tag}
+    else:
+        return None
+    return {"protocol": config.protocol, "settings": settings, "streamSettings": stream, "tag": tag}
+
+def free_ports(count: int) -> List[int]:
+    """
+    Asks the OS for `count` unused TCP ports on 127.0.0.1.
+
+    The sockets are bound to port 0 and held until all ports are picked, so
+    the ports are distinct; another process could still take one before xray
+    binds it, which then shows up as a failed start.
+    """
+    sockets = []
+    try:
+        for _ in range(count):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sockets.append(sock)
+            sock.bind(("127.0.0.1", 0))
+        return [sock.getsockname()[1] for sock in sockets]
+    finally:
+        for sock in sockets:
+            sock.close()
+
+def build_batch_config(configs: List[ProxyConfig], listen_ports: Sequence[int]) -> Tuple[Dict, Dict[str, int]]:
+    """
+    Builds one xray config that serves every config in `configs` at once.
+
+    Each usable config gets its own SOCKS inbound on 127.0.0.1, routed 1:1 to its
+    outbound by tag; the n-th usable config listens on listen_ports[n]. Configs that
+    can't be converted are left out.
+
+    Returns:
+        (xray config, config URI -> local SOCKS port)
+    """
+    inbounds, outbounds, rules = [], [], []
+    ports: Dict[str, int] = {}
+    for config in configs:
+        if config.raw in ports:
+            continue
+        position = len(outbounds)
+        outbound = outbound_from_config(config, f"out-{position}")
+        if outbound is None:
+            continue
+        port = listen_ports[position]
+        inbounds.append({
+            "tag": f"in-{position}", "listen": "127.0.0.1", "port": port,
+            "protocol": "socks", "settings": {"auth": "noauth", "udp": False},
+        })
+        outbounds.append(outbound)
+        rules.append({"type": "field", "inboundTag": [f"in-{position}"], "outboundTag": f"out-{position}"})
+        ports[config.raw] = port
+    xray_config = {
+        "log": {"loglevel": "none"},
+        "inbounds": inbounds,
+        "outbounds": outbounds,
+        "routing": {"domainStrategy": "AsIs", "rules": rules},
+    }
+    return xray_config, ports
+
+def _socks5_connect_request(host: str, port: int) -> bytes:
+    encoded = host.encode("idna")
+    return b"\x05\x01\x00\x03" + bytes([len(encoded)]) + encoded + struct.pack("!H", port)
+
+async def http_probe_via_socks(proxy_port: int, url: str = TEST_URL, timeout: float = DEFAULT_TIMEOUT_SECONDS) -> Optional[int]:
+    """
+    Sends one HTTP GET through a local SOCKS5 proxy.
+
+    Returns:
+        Milliseconds until the response status line, or None if the request failed
+        or the status was not 2xx/3xx.
+    """
+    parts = urlsplit(url)
+    host, port = parts.hostname or "", parts.port or 80
+    request = (
+        f"GET {parts.path or '/'} HTTP/1.1\r\nHost: {host}\r\nUser-Agent: Mozilla/5.0\r\nConnection: close\r\n\r\n"
+    ).encode("ascii")
+
+    async def exchange() -> Optional[int]:
+        reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+        try:
+            started = time.perf_counter()
+            writer.write(b"\x05\x01\x00")
+            if await reader.readexactly(2) != b"\x05\x00":
+                return None
+            writer.write(_socks5_connect_request(host, port))
+            reply = await reader.readexactly(4)
+            if reply[1] != 0:
+                return None
+            address_type = reply[3]
+            if address_type == 1:
+                await reader.readexactly(4 + 2)
+            elif address_type == 4:
+                await reader.readexactly(16 + 2)
+            else:
+                await reader.readexactly((await reader.readexactly(1))[0] + 2)
+            writer.write(request)
+            status_line = await reader.readline()
+            elapsed = round((time.perf_counter() - started) * 1000)
+            fields = status_line.split()
+            if len(fields) < 2 or not fields[0].startswith(b"HTTP/") or fields[1][:1] not in (b"2", b"3"):
+                return None
+            return elapsed
+        finally:
+            writer.close()
+
+    try:
+        return await asyncio.wait_for(exchange(), timeout)
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+        return None
+
+async def wait_for_port(port: int, timeout: float, process: Optional[asyncio.subprocess.Process] = None) -> bool:
+    """Waits until something accepts connections on 127.0.0.1:port; gives up early if `process` exits."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.returncode is not None:
+            return False
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+        except OSError:
+            await asyncio.sleep(0.05)
+            continue
+        writer.close()
+        return True
+    return False
+
+class BatchTester:
+    """
+    Tests configs end to end through xray-core, a batch at a time.
+
+    For each batch a single xray process is started with one SOCKS inbound per
+    config, on ports the OS reports free; every inbound is then probed
+    concurrently with an HTTP request to TEST_URL. `xray_path` can point at any
+    binary that accepts `run -c <file>` and serves the inbounds in that file,
+    e.g. a stub SOCKS proxy.
+
+    A batch xray can't start is bisected, since one outbound it rejects fails
+    the whole process; a single config that still can't start is reported as
+    failed. If the binary can't be run at all, testing stops and the configs
+    not yet tested are left out of the results.
+    """
+
+    def __init__(
+        self,
+        xray_path: str,
+        config_file: Path,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        timeout: float = DEFAULT_TIMEOUT_SECONDS,
+        url: str = TEST_URL,
+    ):
+        self.xray_path = xray_path
+        self.config_file = config_file
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.url = url
+
+    async def test_batch(self, configs: List[ProxyConfig]) -> Dict[str, Optional[int]]:
+        """
+        Tests up to batch_size configs with one xray process.
+
+        Returns:
+            config URI -> latency, or None if the request through it failed.
+
+        Raises:
+            XrayStartError: xray didn't start or didn't open its inbounds, so no config was tested.
+            OSError: The binary can't be run.
+        """
+        results: Dict[str, Optional[int]] = {config.raw: None for config in configs}
+        xray_config, ports = build_batch_config(configs, free_ports(len(configs)))
+        if not ports:
+            return results
+        self.config_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.config_file, "w", encoding="utf-8") as f:
+            json.dump(xray_config, f)
+
+        process = None
+        try:
+            process = await asyncio.create_subprocess_exec(
+                self.xray_path, "run", "-c", str(self.config_file),
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+            )
+            # Inbounds open in order, so the last one being up means they all are
+            if not await wait_for_port(list(ports.values())[-1], STARTUP_TIMEOUT_SECONDS, process):
+                state = "exited" if process.returncode is not None else "did not open its inbounds in time"
+                raise XrayStartError(f"xray {state} with a batch of {len(ports)} configs")
+            latencies = await asyncio.gather(
+                *(http_probe_via_socks(port, self.url, self.timeout) for port in ports.values())
+            )
+            results.update(zip(ports.keys(), latencies))
+            return results
+        finally:
+            if process is not None and process.returncode is None:
+                process.terminate()
+                try:
+                    await asyncio.wait_for(process.wait(), 5)
+                except asyncio.TimeoutError:
+                    process.kill()
+                    await process.wait()
+            try:
+                os.remove(self.config_file)
+            except OSError:
+                pass
+
+    async def _test_or_bisect(self, configs: List[ProxyConfig], rejected: List[str]) -> Dict[str, Optional[int]]:
+        """test_batch, splitting a batch that can't start; configs xray won't start with go to `rejected`."""
+        try:
+            return await self.test_batch(configs)
+        except XrayStartError as e:
+            if len(configs) == 1:
+                rejected.append(configs[0].raw)
+                return {configs[0].raw: None}
+            logging.warning(f"{e}; splitting the batch.")
+        middle = len(configs) // 2
+        results = await self._test_or_bisect(configs[:middle], rejected)
+        results.update(await self._test_or_bisect(configs[middle:], rejected))
+        return results
+
+    async def test_all(self, configs: List[ProxyConfig]) -> Dict[str, Optional[int]]:
+        """
+        Tests every config, batch_size at a time.
+
+        Configs missing from the result weren't tested because xray couldn't be
+        run: the binary is missing, or it started with none of a batch's configs
+        (a broken install rather than bad configs), which stops the testing.
+        """
+        results: Dict[str, Optional[int]] = {}
+        for start in range(0, len(configs), self.batch_size):
+            batch = configs[start:start + self.batch_size]
+            rejected: List[str] = []
+            try:
+                batch_results = await self._test_or_bisect(batch, rejected)
+            except OSError as e:
+                logging.error(f"Could not run {self.xray_path}: {e}; {len(configs) - start} configs left untested.")
+                break
+            if rejected and len(set(rejected)) == len(batch_results):
+                logging.error(f"{self.xray_path} would not start with any config of a batch; "
+                              f"{len(configs) - start} configs left untested.")
+                break
+            if rejected:
+                logging.info(f"xray rejected {len(rejected)} configs; counting them as failed.")
+            results.update(batch_results)
+            working = sum(latency is not None for latency in results.values())
+            logging.info(f"xray test progress: {len(results)}/{len(configs)} tested, {working} working.")
+        return results